@@ -0,0 +1,386 @@
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from time import time
+from urllib.parse import parse_qsl
+
+import asyncpg
+from flask import current_app
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from app.aio import queries
+from app.controllers.accounts import (
+    account_cache, AccountController, serialize_up_to_date_account)
+from app.controllers.customer import CustomerController
+from app.schema.request import (
+    AddAccountRequest, AddCustomerRequest, AddPaymentRequest,
+    AddWithdrawalRequest, BulkTransactionsRequest, GetAccountRequest,
+    GetHistoryRequest, GetInterestRequest, ListAccountsRequest,
+    ListCustomersRequest, SimulateRequest)
+from app.schema.response import (
+    AccountGetResponse, AccountListResponse, BulkTransactionsResponse,
+    CustomerGetResponse, CustomerListResponse, CustomerTotalsGetResponse,
+    HistoryEntryResponse, InterestGetResponse, PortfolioTotalsGetResponse,
+    SimulateResponse)
+from app.utilities import (
+    APIError, get_config, get_db, SC, valid_uuid, written_recently)
+
+config = get_config()
+logger = logging.getLogger(__name__)
+
+
+class InvalidRequest(Exception):
+    def __init__(self, messages):
+        Exception.__init__(self)
+        self.messages = messages
+
+
+def load(schema, data):
+    """ Loads request arguments with a request schema.
+
+    Raises:
+        InvalidRequest - If the arguments are invalid
+    """
+    arguments, errors = schema(strict=False).load(data)
+    if errors:
+        raise InvalidRequest(errors)
+    return arguments
+
+
+def dump(schema, data):
+    return schema().dump(data).data
+
+
+async def log_request(request, call_next):
+    start = time()
+    response = await call_next(request)
+    logger.info({
+        'msg': 'App API Request',
+        'url': request.url.path,
+        'method': request.method,
+        'params': dict(request.query_params) or None,
+        'status_code': response.status_code,
+        'milliseconds': (time() - start) * 1000,
+    })
+    return response
+
+
+async def handle_http_error(request, ex):
+    message = ex.detail
+    if ex.status_code == SC.NOT_FOUND:
+        message = 'The requested URL was not found on the server.'
+    return JSONResponse(dict(message=message), ex.status_code)
+
+
+async def handle_invalid_request(request, ex):
+    return JSONResponse(dict(messages=ex.messages), SC.UNPROCESSABLE)
+
+
+async def handle_api_error(request, ex):
+    return JSONResponse(
+        dict(message=ex.message), getattr(ex, 'status_code', ex.STATUS_CODE))
+
+
+async def handle_exception(request, ex):
+    logger.exception('msg=request failed; path=%s', request.url.path)
+    return JSONResponse(dict(message='Internal Server Error'), SC.SERVERERR)
+
+
+async def request_data(request):
+    """ The JSON or form encoded body, like webargs reads it. """
+    body = await request.body()
+    if request.headers.get('content-type', '').startswith(
+            'application/json'):
+        return json.loads(body.decode('utf-8'))
+    return dict(parse_qsl(body.decode('utf-8')))
+
+
+class AsyncApp:
+    """ ASGI application serving the customer, accounts and reporting routes
+    of the Flask app, with the same request and response schemas.
+
+    Reads that don't write are made with asyncpg, so waiting on Postgres
+    doesn't hold a thread. Writes, and reads of accounts that are due for
+    interest, run the same controllers as the Flask app in a thread pool,
+    so the locking, idempotency and caching rules are shared by both. """
+
+    def __init__(self, flask_app):
+        """
+        Args:
+            flask_app (Flask) - The app providing the config and the
+                                database sessions of the controllers
+        """
+        self.flask_app = flask_app
+        self.executor = ThreadPoolExecutor(config.aio.executor_threads)
+        self.pool = None
+        self.app = Starlette(
+            routes=[
+                Route('/heartbeat', self.heartbeat),
+                Route('/customer/', self.list_customers),
+                Route('/customer/', self.add_customer, methods=['POST']),
+                Route('/customer/{uuid}', self.get_customer),
+                Route('/customer/{uuid}/accounts', self.list_accounts),
+                Route('/customer/{uuid}/totals', self.get_customer_totals),
+                Route('/accounts/', self.add_account, methods=['POST']),
+                Route('/accounts/payment', self.make_payment,
+                      methods=['POST']),
+                Route('/accounts/withdrawal', self.make_withdrawal,
+                      methods=['POST']),
+                Route('/accounts/transactions', self.add_transactions,
+                      methods=['POST']),
+                Route('/accounts/{uuid}', self.get_account),
+                Route('/accounts/{uuid}/history', self.get_history),
+                Route('/accounts/{uuid}/interest', self.get_interest),
+                Route('/accounts/{uuid}/simulate', self.simulate,
+                      methods=['POST']),
+                Route('/reporting/portfolio', self.get_portfolio_totals),
+            ],
+            middleware=[Middleware(BaseHTTPMiddleware, dispatch=log_request)],
+            exception_handlers={
+                HTTPException: handle_http_error,
+                InvalidRequest: handle_invalid_request,
+                APIError: handle_api_error,
+                Exception: handle_exception,
+            },
+            lifespan=lambda app: self)
+
+    async def __call__(self, scope, receive, send):
+        await self.app(scope, receive, send)
+
+    async def __aenter__(self):
+        """ Opens the asyncpg pool on startup. """
+        await self.connect()
+
+    async def __aexit__(self, *exc_info):
+        if self.pool is not None:
+            await self.pool.close()
+        self.executor.shutdown()
+
+    async def connect(self):
+        if self.pool is None:
+            self.pool = await create_pool()
+        return self.pool
+
+    async def run_sync(self, func, *args):
+        """ Runs a controller function in the thread pool, within an app
+        context of the Flask app. """
+        def run():
+            with self.flask_app.app_context():
+                get_db()
+                try:
+                    return func(*args)
+                finally:
+                    current_app.db.remove()
+                    # Like the teardown of the Flask app, the replica session
+                    # read_db opened in this thread is returned too.
+                    replica_db = getattr(current_app, 'replica_db', None)
+                    if (replica_db is not None and
+                            replica_db is not current_app.db):
+                        replica_db.remove()
+
+        return await asyncio.get_event_loop().run_in_executor(
+            self.executor, run)
+
+    async def heartbeat(self, request):
+        return JSONResponse('OK')
+
+    async def get_customer(self, request):
+        uuid = request.path_params['uuid']
+        customer = None
+        if valid_uuid(uuid):
+            customer = await queries.get_customer(await self.connect(), uuid)
+        if not customer:
+            raise APIError("Customer not found", SC.NOT_FOUND)
+        return JSONResponse(dump(CustomerGetResponse, dict(customer=customer)))
+
+    async def list_customers(self, request):
+        arguments = load(ListCustomersRequest, dict(request.query_params))
+        cursor = arguments.get('cursor')
+        customers = await queries.list_customers(
+            await self.connect(),
+            arguments.get('limit') or config.listing.page_size,
+            arguments.get('email'), arguments.get('email_prefix'),
+            cursor and str(cursor))
+        return JSONResponse(dump(CustomerListResponse, customers))
+
+    async def list_accounts(self, request):
+        uuid = request.path_params['uuid']
+        arguments = load(ListAccountsRequest, dict(request.query_params))
+        if not valid_uuid(uuid):
+            raise APIError("Customer not found", SC.NOT_FOUND)
+
+        # Replays the ledger of every account of the page, which is shared
+        # with the Flask app.
+        cursor = arguments.get('cursor')
+        accounts = await self.run_sync(
+            AccountController.list_accounts, uuid, cursor and str(cursor),
+            arguments.get('limit'))
+        return JSONResponse(dump(AccountListResponse, accounts))
+
+    async def get_customer_totals(self, request):
+        uuid = request.path_params['uuid']
+        totals = None
+        if valid_uuid(uuid):
+            totals = await queries.get_customer_totals(
+                await self.connect(), uuid)
+        if totals is None:
+            raise APIError("Customer not found", SC.NOT_FOUND)
+        return JSONResponse(dump(
+            CustomerTotalsGetResponse,
+            dict(customer_uuid=uuid, totals=totals)))
+
+    async def add_customer(self, request):
+        arguments = load(AddCustomerRequest, await request_data(request))
+        customer = await self.run_sync(
+            CustomerController.add,
+            arguments['email'], arguments['fname'], arguments['lname'])
+        return JSONResponse(dump(CustomerGetResponse, dict(customer=customer)))
+
+    async def get_account(self, request):
+        uuid = request.path_params['uuid']
+        arguments = load(GetAccountRequest, dict(
+            dict(time=datetime.now().isoformat()), **request.query_params))
+        time = arguments['time']
+
+        cached = None
+        if not written_recently(uuid):
+            cached = account_cache.get(
+                uuid, valid=lambda entry: time < entry[1])
+        if cached:
+            account = cached[0]
+        else:
+            snapshot = None
+            if valid_uuid(uuid):
+                snapshot = await queries.get_account_snapshot(
+                    await self.connect(), uuid)
+            if snapshot is None:
+                raise APIError("Account not found", SC.NOT_FOUND)
+
+            account = serialize_up_to_date_account(*snapshot, time)
+            if account is None:
+                # Interest is due, it is accrued with the account locked.
+                account = await self.run_sync(
+                    AccountController.get_account, uuid, time)
+
+        return JSONResponse(dump(AccountGetResponse, dict(account=account)))
+
+    async def get_history(self, request):
+        uuid = request.path_params['uuid']
+        arguments = load(GetHistoryRequest, dict(request.query_params))
+        pool = await self.connect()
+
+        if not valid_uuid(uuid) or not await queries.account_exists(
+                pool, uuid):
+            raise APIError("Account not found", SC.NOT_FOUND)
+
+        history = queries.get_history(
+            pool, uuid, arguments.get('since'), arguments.get('until'))
+        schema = HistoryEntryResponse()
+
+        async def lines():
+            async for entry in history:
+                yield json.dumps(
+                    schema.dump(entry).data, sort_keys=True) + '\n'
+
+        return StreamingResponse(
+            lines(), media_type='application/x-ndjson')
+
+    async def get_interest(self, request):
+        uuid = request.path_params['uuid']
+        arguments = load(GetInterestRequest, dict(request.query_params))
+
+        interest = None
+        if valid_uuid(uuid):
+            interest = await queries.get_interest_accruals(
+                await self.connect(), uuid, arguments.get('since'),
+                arguments.get('until'))
+        if interest is None:
+            raise APIError("Account not found", SC.NOT_FOUND)
+        return JSONResponse(dump(InterestGetResponse, interest))
+
+    async def simulate(self, request):
+        uuid = request.path_params['uuid']
+        arguments = load(SimulateRequest, await request_data(request))
+        if not valid_uuid(uuid):
+            raise APIError("Account not found", SC.NOT_FOUND)
+
+        # The projection is CPU bound, it runs in the thread pool too.
+        simulation = await self.run_sync(
+            AccountController.simulate, uuid, arguments['payments'],
+            arguments.get('periods'), arguments.get('time'),
+            arguments.get('include_balances', False))
+        return JSONResponse(dump(SimulateResponse, simulation))
+
+    async def add_account(self, request):
+        arguments = load(AddAccountRequest, await request_data(request))
+        account = await self.run_sync(
+            AccountController.open_account,
+            arguments['customer_uuid'], arguments['apr'],
+            arguments['max_credit'], arguments.get('time_opened'))
+        return JSONResponse(dump(AccountGetResponse, dict(account=account)))
+
+    async def make_payment(self, request):
+        return await self.transaction(
+            request, AddPaymentRequest, AccountController.payment)
+
+    async def make_withdrawal(self, request):
+        return await self.transaction(
+            request, AddWithdrawalRequest, AccountController.withdrawal)
+
+    async def transaction(self, request, schema, controller):
+        data = await request_data(request)
+        if 'Idempotency-Key' in request.headers:
+            data['Idempotency-Key'] = request.headers['Idempotency-Key']
+        arguments = load(schema, data)
+        account = await self.run_sync(
+            controller, arguments['account_uuid'], arguments['amount'],
+            arguments.get('time') or datetime.now(),
+            arguments.get('idempotency_key'))
+        return JSONResponse(dump(AccountGetResponse, dict(account=account)))
+
+    async def get_portfolio_totals(self, request):
+        totals = await queries.get_portfolio_totals(await self.connect())
+        return JSONResponse(dump(
+            PortfolioTotalsGetResponse, dict(totals=totals)))
+
+    async def add_transactions(self, request):
+        arguments = load(BulkTransactionsRequest, await request_data(request))
+        results = await self.run_sync(
+            AccountController.bulk_transactions, arguments['transactions'])
+        return JSONResponse(
+            dump(BulkTransactionsResponse, dict(results=results)))
+
+
+def asyncpg_dsn(url):
+    """ The asyncpg DSN for a SQLAlchemy database URL, which may name the
+    driver as in postgresql+psycopg2://. """
+    scheme, rest = url.split('://', 1)
+    return scheme.split('+')[0] + '://' + rest
+
+
+async def create_pool():
+    settings = config.db.postgres
+    server_settings = {}
+    if settings.statement_timeout_ms:
+        server_settings['statement_timeout'] = str(
+            settings.statement_timeout_ms)
+
+    options = {}
+    if settings.pgbouncer:
+        # PgBouncer in transaction pooling mode can't keep prepared
+        # statements around between transactions.
+        options['statement_cache_size'] = 0
+
+    return await asyncpg.create_pool(
+        asyncpg_dsn(settings.url),
+        min_size=config.aio.pool_min_size,
+        max_size=config.aio.pool_max_size,
+        server_settings=server_settings,
+        **options)
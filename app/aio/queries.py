@@ -0,0 +1,354 @@
+from types import SimpleNamespace
+
+from app.controllers.accounts import (
+    opening_balance, replay_history_entry, replay_ledger, serialize_balance,
+    stored_time)
+from app.controllers.reporting import serialize_totals
+from app.utilities import like_prefix
+
+HISTORY_PAGE_SIZE = 1000
+
+GET_CUSTOMER = """
+    SELECT uuid::text, email, fname, lname
+    FROM customer
+    WHERE uuid = $1
+"""
+
+LIST_CUSTOMERS = """
+    SELECT uuid::text, email, fname, lname
+    FROM customer
+"""
+
+# Outer joined to the customer, like `CustomerController.get_totals` does,
+# which tells missing customers apart from ones without accounts.
+GET_CUSTOMER_TOTALS = """
+    SELECT customer_totals.accounts, customer_totals.principal_owed,
+           customer_totals.interest_owed, customer_totals.available_credit
+    FROM customer
+    LEFT JOIN customer_totals
+        ON customer_totals.customer_uuid = customer.uuid
+    WHERE customer.uuid = $1
+"""
+
+GET_PORTFOLIO_TOTALS = """
+    SELECT sum(accounts) AS accounts,
+           sum(principal_owed) AS principal_owed,
+           sum(interest_owed) AS interest_owed,
+           sum(available_credit) AS available_credit
+    FROM portfolio_totals
+"""
+
+# The balance snapshot is found through the account's snapshot sequence
+# number, like `_account_snapshots` does, so only one balance is read.
+GET_ACCOUNT_SNAPSHOT = """
+    SELECT credit_account.uuid::text, credit_account.apr,
+           credit_account.max_credit, credit_account.time_opened,
+           credit_account.accrued_through, credit_account.ledger_seq,
+           credit_account.snapshot_seq, balance.available_credit,
+           balance.principal_owed, balance.interest_owed
+    FROM credit_account
+    JOIN balance
+        ON balance.credit_account_uuid = credit_account.uuid
+        AND balance.seq = credit_account.snapshot_seq
+    WHERE credit_account.uuid = $1
+"""
+
+# The ledger entries recorded after the balance snapshot, like
+# `_ledger_entries` reads them.
+GET_LEDGER_ENTRIES = """
+    SELECT seq, 'payment' AS type, time, amount,
+           NULL::bigint AS interest_owed
+    FROM payment
+    WHERE credit_account_uuid = $1 AND seq > $2
+    UNION ALL
+    SELECT seq, 'withdrawal', time, amount, NULL
+    FROM withdrawal
+    WHERE credit_account_uuid = $1 AND seq > $2
+    UNION ALL
+    SELECT seq, 'interest', period_end, interest, interest_owed
+    FROM interest_accrual
+    WHERE credit_account_uuid = $1 AND seq > $2
+"""
+
+ACCOUNT_EXISTS = """
+    SELECT 1 FROM credit_account WHERE uuid = $1
+"""
+
+# Outer joined to the account, like `AccountController.get_interest_accruals`
+# does, which tells missing accounts apart from ones without interest.
+GET_INTEREST_ACCRUALS = """
+    SELECT interest_accrual.period_start, interest_accrual.period_end,
+           interest_accrual.principal_days, interest_accrual.interest
+    FROM credit_account
+    LEFT JOIN interest_accrual
+        ON interest_accrual.credit_account_uuid = credit_account.uuid
+        AND ($2::timestamp IS NULL OR interest_accrual.period_end >= $2)
+        AND ($3::timestamp IS NULL OR interest_accrual.period_end < $3)
+    WHERE credit_account.uuid = $1
+    ORDER BY interest_accrual.period_end
+"""
+
+# Entries at the same time are sorted like `AccountController.get_history`
+# merges them: payments, then withdrawals, then balances in recorded order.
+HISTORY_SELECTS = [
+    """
+    SELECT uuid::text, 'payment' AS type, time, amount,
+           NULL::bigint AS available_credit, NULL::bigint AS principal_owed,
+           NULL::bigint AS interest_owed, 0 AS source, 0::bigint AS seq
+    FROM payment""",
+    """
+    SELECT uuid::text, 'withdrawal', time, amount, NULL, NULL, NULL, 1, 0
+    FROM withdrawal""",
+    """
+    SELECT uuid::text, 'balance', time, NULL, available_credit,
+           principal_owed, interest_owed, 2, seq
+    FROM balance""",
+]
+
+# The first and last ledger entries between two times, like
+# `_replayed_history_balances` finds them.
+HISTORY_LEDGER_WINDOW = """
+    SELECT min(seq) AS first, max(seq) AS last FROM (
+        SELECT seq, time FROM payment WHERE credit_account_uuid = $1
+        UNION ALL
+        SELECT seq, time FROM withdrawal WHERE credit_account_uuid = $1
+        UNION ALL
+        SELECT seq, period_end FROM interest_accrual
+        WHERE credit_account_uuid = $1
+    ) AS entries"""
+
+HISTORY_ACCOUNT = """
+    SELECT uuid::text, max_credit, time_opened
+    FROM credit_account
+    WHERE uuid = $1
+"""
+
+HISTORY_START_BALANCE = """
+    SELECT seq, principal_owed, interest_owed
+    FROM balance
+    WHERE credit_account_uuid = $1 AND seq < $2
+    ORDER BY seq DESC
+    LIMIT 1
+"""
+
+# The ledger entries after the start balance up to the last one of the
+# window, in order, with whether a balance was recorded with them.
+HISTORY_LEDGER_ENTRIES = """
+    SELECT entries.*, EXISTS (
+        SELECT 1 FROM balance
+        WHERE balance.credit_account_uuid = $1 AND balance.seq = entries.seq
+    ) AS recorded
+    FROM (""" + GET_LEDGER_ENTRIES + """) AS entries
+    WHERE seq <= $3
+    ORDER BY seq
+"""
+
+TRANSACTION_FIELDS = ('uuid', 'type', 'time', 'amount')
+BALANCE_FIELDS = (
+    'uuid', 'type', 'time', 'available_credit', 'principal_owed',
+    'interest_owed')
+
+
+def _list_customers_query(email, email_prefix, cursor):
+    conditions = []
+    args = []
+    for condition, arg in (('email = ${}', email),
+                           ('email LIKE ${}', email_prefix),
+                           ('uuid > ${}', cursor)):
+        if arg is not None:
+            args.append(arg)
+            conditions.append(condition.format(len(args)))
+
+    where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+    query = LIST_CUSTOMERS + where + ' ORDER BY uuid LIMIT ${}'.format(
+        len(args) + 1)
+    return query, args
+
+
+def _time_conditions(since, until):
+    conditions = []
+    if since is not None:
+        conditions.append('time >= $2')
+    if until is not None:
+        conditions.append('time < ${}'.format(len(conditions) + 2))
+    return conditions
+
+
+def _history_query(since, until):
+    conditions = ['credit_account_uuid = $1'] + _time_conditions(
+        since, until)
+
+    where = ' WHERE ' + ' AND '.join(conditions)
+    return ' UNION ALL '.join(
+        select + where for select in HISTORY_SELECTS
+    ) + ' ORDER BY time, source, seq'
+
+
+async def get_customer(pool, customer_uuid):
+    """ Retrieves a customer.
+
+    Returns:
+        dict - The serialized customer, or None if there is none
+    """
+    row = await pool.fetchrow(GET_CUSTOMER, customer_uuid)
+    return dict(row) if row else None
+
+
+async def list_customers(pool, limit, email=None, email_prefix=None,
+                         cursor=None):
+    """ Lists customers in uuid order, a page at a time, like
+    `CustomerController.list` does.
+
+    Returns:
+        dict - The serialized customers, and the cursor of the next page
+    """
+    if email_prefix is not None:
+        email_prefix = like_prefix(email_prefix)
+    query, args = _list_customers_query(email, email_prefix, cursor)
+
+    rows = await pool.fetch(query, *args, limit + 1)
+    customers = [dict(row) for row in rows[:limit]]
+    return dict(
+        customers=customers,
+        next_cursor=customers[-1]['uuid'] if len(rows) > limit else None)
+
+
+async def get_customer_totals(pool, customer_uuid):
+    """ Retrieves the totals of the accounts of a customer.
+
+    Returns:
+        dict - The serialized totals, or None if there is no customer
+    """
+    row = await pool.fetchrow(GET_CUSTOMER_TOTALS, customer_uuid)
+    return serialize_totals(SimpleNamespace(**dict(row))) if row else None
+
+
+async def get_portfolio_totals(pool):
+    """ Retrieves the totals of all accounts, adding up the portfolio totals
+    shards.
+
+    Returns:
+        dict - The serialized totals
+    """
+    row = await pool.fetchrow(GET_PORTFOLIO_TOTALS)
+    return serialize_totals(SimpleNamespace(**dict(row)))
+
+
+async def get_account_snapshot(pool, account_uuid):
+    """ Retrieves an account along with its current balance, replayed from
+    its last balance snapshot.
+
+    Returns:
+        tuple - The account and its balance, or None if there is no account
+    """
+    async with pool.acquire() as connection:
+        async with connection.transaction(readonly=True):
+            row = await connection.fetchrow(
+                GET_ACCOUNT_SNAPSHOT, account_uuid)
+            if not row:
+                return None
+
+            snapshot = SimpleNamespace(**dict(row))
+            entries = []
+            if snapshot.ledger_seq > snapshot.snapshot_seq:
+                entries = await connection.fetch(
+                    GET_LEDGER_ENTRIES, account_uuid, snapshot.snapshot_seq)
+
+    return snapshot, replay_ledger(snapshot, snapshot, [
+        SimpleNamespace(**dict(entry)) for entry in entries])
+
+
+async def get_interest_accruals(pool, account_uuid, since=None, until=None):
+    """ Retrieves the interest accrued for the pay periods of an account
+    closing between two times, sorted by time ascending, along with their
+    total.
+
+    Returns:
+        dict - The serialized interest accruals and the total interest, or
+               None if there is no account
+    """
+    rows = await pool.fetch(GET_INTEREST_ACCRUALS, account_uuid, since, until)
+    if not rows:
+        return None
+
+    accruals = [dict(row) for row in rows if row['period_end'] is not None]
+    return dict(
+        accruals=accruals,
+        total_interest=sum(accrual['interest'] for accrual in accruals))
+
+
+async def account_exists(pool, account_uuid):
+    return await pool.fetchval(ACCOUNT_EXISTS, account_uuid) is not None
+
+
+async def _replayed_history_balances(connection, args, since, until):
+    """ Replays the balances after the ledger entries between two times that
+    no balance was recorded for, like `_replayed_history_balances` in the
+    accounts controller does, as the entries are read from a cursor. """
+    account_uuid = args[0]
+    conditions = _time_conditions(since, until)
+    where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+    window = await connection.fetchrow(HISTORY_LEDGER_WINDOW + where, *args)
+    if window['first'] is None:
+        return
+
+    account = SimpleNamespace(
+        **dict(await connection.fetchrow(HISTORY_ACCOUNT, account_uuid)))
+    start = await connection.fetchrow(
+        HISTORY_START_BALANCE, account_uuid, window['first'])
+    balance = (SimpleNamespace(**dict(start)) if start is not None
+               else opening_balance(account))
+
+    async for entry in connection.cursor(
+            HISTORY_LEDGER_ENTRIES, account_uuid, balance.seq,
+            window['last'], prefetch=HISTORY_PAGE_SIZE):
+        balance, listed = replay_history_entry(
+            account, balance, SimpleNamespace(**dict(entry)), since, until)
+        if listed:
+            yield balance
+
+
+async def _next_balance(replayed):
+    """ The next replayed balance, or None after the last one. """
+    try:
+        return await replayed.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+async def get_history(pool, account_uuid, since=None, until=None):
+    """ Retrieves the balances, payments and withdrawals of an account
+    between two times, sorted by time ascending, with a server-side cursor
+    a page at a time. The balances after the ledger entries that no
+    snapshot was recorded for are replayed and merged in.
+
+    Returns:
+        async iterator(dict) - The serialized history entries
+    """
+    since, until = stored_time(since), stored_time(until)
+    args = [account_uuid] + [
+        time for time in (since, until) if time is not None]
+
+    async with pool.acquire() as connection:
+        async with connection.transaction(readonly=True):
+            replayed = _replayed_history_balances(
+                connection, args, since, until)
+            balance = await _next_balance(replayed)
+
+            async for row in connection.cursor(
+                    _history_query(since, until), *args,
+                    prefetch=HISTORY_PAGE_SIZE):
+                # Replayed balances sort like recorded ones.
+                while balance is not None and (
+                        balance.time, 2, balance.seq) < (
+                        row['time'], row['source'], row['seq']):
+                    yield serialize_balance(balance)
+                    balance = await _next_balance(replayed)
+
+                fields = (BALANCE_FIELDS if row['type'] == 'balance'
+                          else TRANSACTION_FIELDS)
+                yield {field: row[field] for field in fields}
+
+            while balance is not None:
+                yield serialize_balance(balance)
+                balance = await _next_balance(replayed)
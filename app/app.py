@@ -5,14 +5,23 @@ from time import time
 
 from apispec import APISpec
 from flask import (
-    current_app, g, Flask, jsonify, redirect, request, session, url_for)
+    current_app, g, Flask, jsonify, redirect, request, Response, session,
+    url_for)
 from flask_apispec.extension import FlaskApiSpec
 from flask.json import JSONEncoder
 from werkzeug.exceptions import default_exceptions
 
-from app.blueprints import accounts_blueprint, customer_blueprint
+from app.blueprints import (
+    accounts_blueprint, customer_blueprint, reporting_blueprint)
+from app.commands import (
+    accrue_interest, backfill_interest_accruals, compact_balances,
+    create_partitions_command, evict_idempotency_keys, ingest_transactions,
+    rebuild_totals)
+from app.controllers.accounts import account_cache
 from app.utilities import (
-    APIError, get_config, get_db, make_json_error, RedirectException, SC)
+    APIError, get_config, get_db, get_request_stats, make_json_error,
+    observe_request, RedirectException, render_counter, render_metrics,
+    render_pool_metrics, SC, start_request_stats)
 
 
 config = get_config()
@@ -54,12 +63,31 @@ def setup_base_routes(app):
         """A Simple Healthcheck to determine whether or not the app is up"""
         return "OK", SC.OK
 
+    @app.route('/metrics')
+    def metrics():
+        """The request and database pool metrics of this worker process, in
+        the Prometheus text format"""
+        cache_stats = account_cache.stats
+        return Response(
+            render_metrics() +
+            render_pool_metrics(get_db().bind.pool) +
+            render_counter(
+                'account_cache_hits_total',
+                'Accounts read from the account cache.',
+                cache_stats['hits']) +
+            render_counter(
+                'account_cache_misses_total',
+                'Accounts not found in the account cache.',
+                cache_stats['misses']),
+            mimetype='text/plain; version=0.0.4')
+
 
 def setup_event_hooks(app):
     @app.before_request
     def before_request():
         g.db = get_db()
         g.request_time = time()
+        start_request_stats()
         session["user_id"] = "1"
         session["role"] = "admin"
 
@@ -75,6 +103,12 @@ def setup_event_hooks(app):
             current_app.db.close()
             current_app.db.remove()
 
+        replica_db = getattr(current_app, 'replica_db', None)
+        if (replica_db is not None and
+                replica_db is not getattr(current_app, 'db', None)):
+            replica_db.close()
+            replica_db.remove()
+
         # Log how long this request took to complete.
         delta = 0
         if hasattr(g, 'request_time'):
@@ -104,7 +138,22 @@ def setup_event_hooks(app):
         except ValueError:
             body = None
 
-        app.logger.info({
+        stats = get_request_stats()
+        request_stats = {}
+        if stats is not None:
+            observe_request(
+                endpoint or 'unmatched', request.method,
+                response_status_code, delta, stats)
+            request_stats = {
+                'db_queries': stats.query_count,
+                'db_milliseconds': stats.db_milliseconds,
+                'slowest_query': stats.slowest_query,
+                'slowest_query_milliseconds':
+                    stats.slowest_query_milliseconds,
+                'timings': dict(stats.timings),
+            }
+
+        app.logger.info(dict({
             'msg': 'App API Request',
             'url': request.base_url,
             'method': request.method,
@@ -117,7 +166,7 @@ def setup_event_hooks(app):
             'milliseconds': delta,
             'user_id': session.get("user_id") or 'user_logged_out',
             'requestor_ip': request.remote_addr
-        })
+        }, **request_stats))
 
     @app.context_processor
     def utility_processor():
@@ -161,6 +210,17 @@ def configure_app(app):
 def setup_blueprints(app):
     app.register_blueprint(customer_blueprint, url_prefix='/customer')
     app.register_blueprint(accounts_blueprint, url_prefix='/accounts')
+    app.register_blueprint(reporting_blueprint, url_prefix='/reporting')
+
+
+def setup_commands(app):
+    app.cli.add_command(ingest_transactions)
+    app.cli.add_command(accrue_interest)
+    app.cli.add_command(evict_idempotency_keys)
+    app.cli.add_command(backfill_interest_accruals)
+    app.cli.add_command(create_partitions_command)
+    app.cli.add_command(compact_balances)
+    app.cli.add_command(rebuild_totals)
 
 
 def create_app():
@@ -170,6 +230,7 @@ def create_app():
     setup_base_routes(app)
     setup_event_hooks(app)
     setup_blueprints(app)
+    setup_commands(app)
     setup_swagger(app)
 
     app.logger.info('App Initialized')
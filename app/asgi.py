@@ -0,0 +1,4 @@
+from .aio import AsyncApp
+from .app import create_app
+
+app = AsyncApp(create_app())
@@ -1,2 +1,3 @@
 from .accounts import accounts_blueprint
 from .customer import customer_blueprint
+from .reporting import reporting_blueprint
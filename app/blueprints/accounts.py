@@ -1,13 +1,17 @@
+import json
 from datetime import datetime
 
-from flask import Blueprint
+from flask import Blueprint, Response, stream_with_context
 from flask_apispec import doc, marshal_with, use_kwargs
 
 from app.controllers.accounts import AccountController
-from app.schema.response import AccountGetResponse
+from app.schema.response import (
+    AccountGetResponse, BulkTransactionsResponse, HistoryEntryResponse,
+    InterestGetResponse, SimulateResponse)
 from app.schema.request import (
     AddAccountRequest, AddPaymentRequest, AddWithdrawalRequest,
-    GetAccountRequest)
+    BulkTransactionsRequest, GetAccountRequest, GetHistoryRequest,
+    GetInterestRequest, SimulateRequest)
 
 accounts_blueprint = Blueprint("accounts", __name__)
 
@@ -21,6 +25,38 @@ def get_account(uuid, time=datetime.now()):
     return(dict(account=account))
 
 
+@accounts_blueprint.route('/<string:uuid>/history', methods=['GET'])
+@use_kwargs(GetHistoryRequest)
+@doc()
+def get_history(uuid, since=None, until=None):
+    history = AccountController.get_history(uuid, since, until)
+    schema = HistoryEntryResponse()
+
+    lines = (
+        json.dumps(schema.dump(entry).data, sort_keys=True) + '\n'
+        for entry in history
+    )
+    return Response(
+        stream_with_context(lines), mimetype='application/x-ndjson')
+
+
+@accounts_blueprint.route('/<string:uuid>/interest', methods=['GET'])
+@use_kwargs(GetInterestRequest)
+@marshal_with(InterestGetResponse)
+@doc()
+def get_interest(uuid, since=None, until=None):
+    return AccountController.get_interest_accruals(uuid, since, until)
+
+
+@accounts_blueprint.route('/<string:uuid>/simulate', methods=['POST'])
+@use_kwargs(SimulateRequest)
+@marshal_with(SimulateResponse)
+@doc()
+def simulate(uuid, payments, periods=None, time=None, include_balances=False):
+    return AccountController.simulate(
+        uuid, payments, periods, time, include_balances)
+
+
 @accounts_blueprint.route('/', methods=['POST'])
 @use_kwargs(AddAccountRequest)
 @marshal_with(AccountGetResponse)
@@ -35,8 +71,9 @@ def add_account(customer_uuid, apr, max_credit, time_opened):
 @use_kwargs(AddPaymentRequest)
 @marshal_with(AccountGetResponse)
 @doc()
-def make_payment(account_uuid, amount, time):
-    account = AccountController.payment(account_uuid, amount, time)
+def make_payment(account_uuid, amount, time, idempotency_key=None):
+    account = AccountController.payment(
+        account_uuid, amount, time, idempotency_key)
     return(dict(account=account))
 
 
@@ -44,6 +81,16 @@ def make_payment(account_uuid, amount, time):
 @use_kwargs(AddWithdrawalRequest)
 @marshal_with(AccountGetResponse)
 @doc()
-def make_withdrawal(account_uuid, amount, time):
-    account = AccountController.withdrawal(account_uuid, amount, time)
+def make_withdrawal(account_uuid, amount, time, idempotency_key=None):
+    account = AccountController.withdrawal(
+        account_uuid, amount, time, idempotency_key)
     return(dict(account=account))
+
+
+@accounts_blueprint.route('/transactions', methods=['POST'])
+@use_kwargs(BulkTransactionsRequest)
+@marshal_with(BulkTransactionsResponse)
+@doc()
+def add_transactions(transactions):
+    results = AccountController.bulk_transactions(transactions)
+    return(dict(results=results))
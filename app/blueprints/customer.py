@@ -1,13 +1,26 @@
 from flask import Blueprint
 from flask_apispec import doc, marshal_with, use_kwargs
 
+from app.controllers.accounts import AccountController
 from app.controllers.customer import CustomerController
-from app.schema.response import CustomerGetResponse
-from app.schema.request import AddCustomerRequest
+from app.schema.response import (
+    AccountListResponse, CustomerGetResponse, CustomerListResponse,
+    CustomerTotalsGetResponse)
+from app.schema.request import (
+    AddCustomerRequest, ListAccountsRequest, ListCustomersRequest)
 
 customer_blueprint = Blueprint("customer", __name__)
 
 
+@customer_blueprint.route('/', methods=['GET'])
+@use_kwargs(ListCustomersRequest)
+@marshal_with(CustomerListResponse)
+@doc()
+def list_customers(email=None, email_prefix=None, cursor=None, limit=None):
+    return CustomerController.list(
+        email, email_prefix, cursor and str(cursor), limit)
+
+
 @customer_blueprint.route('/<string:uuid>', methods=['GET'])
 @marshal_with(CustomerGetResponse)
 @doc()
@@ -16,6 +29,22 @@ def get_customer(uuid):
     return(dict(customer=customer))
 
 
+@customer_blueprint.route('/<string:uuid>/totals', methods=['GET'])
+@marshal_with(CustomerTotalsGetResponse)
+@doc()
+def get_customer_totals(uuid):
+    return CustomerController.get_totals(uuid)
+
+
+@customer_blueprint.route('/<string:uuid>/accounts', methods=['GET'])
+@use_kwargs(ListAccountsRequest)
+@marshal_with(AccountListResponse)
+@doc()
+def list_accounts(uuid, cursor=None, limit=None):
+    return AccountController.list_accounts(
+        uuid, cursor and str(cursor), limit)
+
+
 @customer_blueprint.route('/', methods=['POST'])
 @use_kwargs(AddCustomerRequest)
 @marshal_with(CustomerGetResponse)
@@ -0,0 +1,15 @@
+from flask import Blueprint
+from flask_apispec import doc, marshal_with
+
+from app.controllers.reporting import ReportingController
+from app.schema.response import PortfolioTotalsGetResponse
+
+reporting_blueprint = Blueprint("reporting", __name__)
+
+
+@reporting_blueprint.route('/portfolio', methods=['GET'])
+@marshal_with(PortfolioTotalsGetResponse)
+@doc()
+def get_portfolio_totals():
+    totals = ReportingController.get_portfolio_totals()
+    return(dict(totals=totals))
@@ -0,0 +1,247 @@
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+from multiprocessing import Pool
+
+import click
+from flask.cli import with_appcontext
+
+from app.controllers.accounts import AccountController
+from app.schema.request import TransactionRequest
+from app.schema.response import TransactionResultResponse
+from app.utilities import create_partitions, get_config, get_db, SC
+
+config = get_config()
+
+
+def _write_result(result):
+    data = TransactionResultResponse().dump(result).data
+    click.echo(json.dumps(data, sort_keys=True))
+
+
+@click.command('ingest-transactions')
+@click.argument('transactions_file', type=click.File('r'))
+@click.option('--batch-size', default=10000, show_default=True,
+              help='Number of transactions applied at a time.')
+@with_appcontext
+def ingest_transactions(transactions_file, batch_size):
+    """Applies the payments and withdrawals in TRANSACTIONS_FILE.
+
+    The file (or - for stdin) holds one transaction per line, as JSON in the
+    same format as POST /accounts/transactions. It is read in batches so any
+    number of transactions can be streamed through it, and should be sorted
+    by time. The result of each transaction is written to stdout as a line
+    of JSON, indexed by its line number starting at 0.
+    """
+    get_db()
+    request_schema = TransactionRequest()
+    lines = enumerate(transactions_file)
+
+    while True:
+        batch = list(islice(lines, batch_size))
+        if not batch:
+            break
+
+        results = {}
+        indexes = []
+        transactions = []
+        for index, line in batch:
+            try:
+                data = json.loads(line)
+            except ValueError:
+                results[index] = dict(
+                    index=index, status_code=SC.BAD_REQUEST,
+                    message="Invalid JSON")
+                continue
+
+            transaction, errors = request_schema.load(data)
+            if errors:
+                results[index] = dict(
+                    index=index, account_uuid=data.get('accountUUID'),
+                    status_code=SC.UNPROCESSABLE, message=json.dumps(errors))
+                continue
+
+            indexes.append(index)
+            transactions.append(transaction)
+
+        for index, result in zip(
+                indexes, AccountController.bulk_transactions(transactions)):
+            result['index'] = index
+            results[index] = result
+
+        for index in sorted(results):
+            _write_result(results[index])
+
+
+def _uuid_partitions(count):
+    """ Splits the uuid space into `count` contiguous ranges. """
+    bounds = [
+        '{:08x}-0000-0000-0000-000000000000'.format(
+            index * 16 ** 8 // count)
+        for index in range(count)
+    ]
+    return list(zip(bounds, bounds[1:] + [None]))
+
+
+def _init_accrual_worker():
+    # Each worker process gets its own app and database connections, the
+    # ones inherited from the parent process can't be shared.
+    from app.app import create_app
+
+    create_app().app_context().push()
+    get_db()
+
+
+def _accrue_partition(as_of_date, lower_uuid, upper_uuid, batch_size):
+    return AccountController.accrue_due_interest(
+        as_of_date, lower_uuid, upper_uuid, batch_size)
+
+
+@click.command('accrue-interest')
+@click.option('--as-of', type=click.DateTime(),
+              help='Time to accrue interest up to.  [default: now]')
+@click.option('--processes', default=os.cpu_count(), show_default=True,
+              help='Number of worker processes accruing interest.')
+@click.option('--batch-size', default=1000, show_default=True,
+              help='Number of accounts accrued per transaction.')
+@click.option('--interval', type=int,
+              help='Keep running, accruing every INTERVAL seconds.')
+@with_appcontext
+def accrue_interest(as_of, processes, batch_size, interval):
+    """Accrues the interest of accounts whose pay period closed.
+
+    Interest is otherwise accrued by the first request to an account after
+    its pay period closes. Running this ahead of time, on a schedule or as a
+    worker with --interval, leaves requests with only reads to do. Accounts
+    are split by uuid between the worker processes, which accrue them in
+    batches. A summary of each run is written to stdout as a line of JSON.
+    """
+    get_db()
+    pool = Pool(processes, _init_accrual_worker) if processes > 1 else None
+
+    try:
+        while True:
+            started = time.time()
+            as_of_date = as_of or datetime.now()
+
+            if pool:
+                accrued = sum(pool.starmap(_accrue_partition, [
+                    (as_of_date, lower_uuid, upper_uuid, batch_size)
+                    for lower_uuid, upper_uuid in _uuid_partitions(processes)
+                ]))
+            else:
+                accrued = AccountController.accrue_due_interest(
+                    as_of_date, batch_size=batch_size)
+
+            click.echo(json.dumps(dict(
+                as_of=as_of_date.isoformat(),
+                accounts=accrued,
+                seconds=round(time.time() - started, 3))))
+
+            if interval is None:
+                break
+            time.sleep(interval)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+
+@click.command('evict-idempotency-keys')
+@click.option('--batch-size', default=10000, show_default=True,
+              help='Number of keys deleted per transaction.')
+@with_appcontext
+def evict_idempotency_keys(batch_size):
+    """Deletes the idempotency keys older than their time to live.
+
+    Payments and withdrawals can only be retried with the same
+    Idempotency-Key header for `idempotency.key_ttl_hours`, after which
+    their keys are left in the database until this is run. The number of
+    keys deleted is written to stdout as a line of JSON.
+    """
+    get_db()
+    evicted = AccountController.evict_idempotency_keys(batch_size)
+    click.echo(json.dumps(dict(evicted=evicted)))
+
+
+@click.command('backfill-interest-accruals')
+@click.option('--batch-size', default=100, show_default=True,
+              help='Number of accounts backfilled per transaction.')
+@with_appcontext
+def backfill_interest_accruals(batch_size):
+    """Records the interest accruals of the pay periods accrued before
+    interest accruals were recorded.
+
+    The interest of each pay period is calculated over the balance history
+    of the account, for every pay period up to the accrual checkpoint that
+    has no interest accrual yet, so it can be run again safely. The number
+    of interest accruals recorded is written to stdout as a line of JSON.
+    """
+    get_db()
+    recorded = AccountController.backfill_interest_accruals(batch_size)
+    click.echo(json.dumps(dict(accruals=recorded)))
+
+
+@click.command('create-partitions')
+@click.option('--years-ahead', default=config.archive.partition_years_ahead,
+              show_default=True,
+              help='Number of years after this one to create partitions for.')
+@with_appcontext
+def create_partitions_command(years_ahead):
+    """Creates the yearly partitions of the balance, payment and withdrawal
+    tables, from this year on.
+
+    Rows outside of the yearly partitions go to a default partition, which
+    has to be scanned whenever a partition is created. Running this ahead of
+    each year keeps new rows out of it. The partitions created are written
+    to stdout as a line of JSON.
+    """
+    year = datetime.now().year
+    created = create_partitions(get_db(), year, year + years_ahead)
+    get_db().commit()
+    click.echo(json.dumps(dict(created=created)))
+
+
+@click.command('compact-balances')
+@click.option('--retention-days', default=config.archive.retention_days,
+              show_default=True,
+              help='Days balances are kept as they were recorded for.')
+@click.option('--batch-size', default=1000, show_default=True,
+              help='Number of accounts compacted per transaction.')
+@with_appcontext
+def compact_balances(retention_days, batch_size):
+    """Compacts the balances of pay periods older than the retention window.
+
+    Only the last balance of each pay period that closed before the window
+    is kept, the starting balance interest accrual reads for the pay periods
+    after it. Pay periods interest wasn't accrued for are left as they are.
+    Backfill the interest accruals first, they can't be calculated over the
+    compacted balances. The number of balances deleted is written to stdout
+    as a line of JSON.
+    """
+    get_db()
+    deleted = AccountController.compact_balances(
+        datetime.now() - timedelta(days=retention_days),
+        batch_size=batch_size)
+    click.echo(json.dumps(dict(deleted=deleted)))
+
+
+@click.command('rebuild-totals')
+@click.option('--batch-size', default=1000, show_default=True,
+              help='Number of accounts read at a time.')
+@with_appcontext
+def rebuild_totals(batch_size):
+    """Recalculates the customer and portfolio totals from the balance of
+    every account.
+
+    The totals are kept up to date by every write to the balances. This
+    fills them in for the accounts opened before they were kept, or after
+    changing the number of portfolio totals shards. Writes to balances wait
+    until it is done. The number of accounts added up is written to stdout
+    as a line of JSON.
+    """
+    get_db()
+    accounts = AccountController.rebuild_totals(batch_size)
+    click.echo(json.dumps(dict(accounts=accounts)))
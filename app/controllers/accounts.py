@@ -1,15 +1,84 @@
+import heapq
 import uuid
+from array import array
+from collections import defaultdict, OrderedDict
+from datetime import datetime, timedelta, timezone
+from itertools import chain
+from operator import attrgetter, itemgetter
 
 from flask import current_app
+from sqlalchemy import (
+    and_, BIGINT, cast, func, literal, null, text, tuple_)
+from sqlalchemy.orm import aliased
 
+from app.controllers.reporting import TotalsChanges
 from app.utilities import (
-    APIError, get_monthly_interests, make_payment, make_withdrawal, SC)
-from schema import Balance, CreditAccount, Customer, Payment, Withdrawal
+    APIError, BalanceHistory, get_config, get_db, get_period_accruals,
+    get_period_accruals_batch, get_replica_db, keyset_page, make_cache,
+    make_payment, make_withdrawal, mark_written, project_payoff, read_db, SC,
+    timed, valid_uuid, written_recently)
+from schema import (
+    Balance, CreditAccount, Customer, CustomerTotals, IdempotencyKey,
+    InterestAccrual, Payment, PortfolioTotals, Withdrawal)
 
+config = get_config()
 
-def serialize_account(account):
-    last_balance = account.balances[-1]
+PAY_PERIOD = 30
+HISTORY_PAGE_SIZE = 1000
+IDEMPOTENCY_KEY_TTL = timedelta(hours=config.idempotency.key_ttl_hours)
 
+# Deletes the balances of the given accounts in pay periods that closed
+# before both the given time and the accrual window of the account, except
+# for the first balance of the account, the last balance of each pay period
+# and the snapshot the ledger is replayed from. Histories are replayed from
+# the kept balances, see `_replayed_history_balances`. The accrual window
+# starts a pay period before the accrual checkpoint, see
+# `_get_accrual_history`.
+COMPACT_BALANCES = text("""
+    DELETE FROM balance
+    USING (
+        SELECT ranked.uuid, ranked.time
+        FROM (
+            SELECT balance.uuid, balance.time, row_number() OVER (
+                PARTITION BY balance.credit_account_uuid, periods.period
+                ORDER BY balance.time DESC, balance.seq DESC) AS rank
+            FROM balance
+            JOIN credit_account
+                ON credit_account.uuid = balance.credit_account_uuid
+            CROSS JOIN LATERAL (
+                SELECT
+                    floor(date_part(
+                        'day', balance.time - credit_account.time_opened
+                    ) / :pay_period) AS period,
+                    floor(date_part(
+                        'day', least(
+                            :before,
+                            credit_account.accrued_through -
+                            :pay_period * interval '1 day'
+                        ) - credit_account.time_opened
+                    ) / :pay_period) AS cutoff_period
+            ) AS periods
+            WHERE credit_account.uuid IN :account_uuids
+                AND balance.seq <> credit_account.snapshot_seq
+                AND balance.seq > (
+                    SELECT min(first.seq) FROM balance AS first
+                    WHERE first.credit_account_uuid =
+                        balance.credit_account_uuid
+                )
+                AND balance.time < :before
+                AND periods.period < periods.cutoff_period
+        ) AS ranked
+        WHERE ranked.rank > 1
+    ) AS compacted
+    WHERE balance.uuid = compacted.uuid AND balance.time = compacted.time
+""")
+
+# Serialized accounts along with the time their next pay period closes,
+# invalidated whenever the account is written to.
+account_cache = make_cache(config.account_cache)
+
+
+def serialize_account(account, last_balance):
     return dict(
         uuid=account.uuid,
         apr=account.apr,
@@ -21,21 +90,745 @@ def serialize_account(account):
     )
 
 
-def _get_account(account_uuid):
-    account = current_app.db.query(CreditAccount).get(account_uuid)
+def serialize_balance(balance):
+    return dict(
+        uuid=balance.uuid,
+        type='balance',
+        time=balance.time,
+        available_credit=balance.available_credit,
+        principal_owed=balance.principal_owed,
+        interest_owed=balance.interest_owed
+    )
+
+
+def serialize_interest_accrual(accrual):
+    return dict(
+        period_start=accrual.period_start,
+        period_end=accrual.period_end,
+        principal_days=accrual.principal_days,
+        interest=accrual.interest
+    )
+
+
+def serialize_transaction(transaction):
+    return dict(
+        uuid=transaction.uuid,
+        type=transaction.__tablename__,
+        time=transaction.time,
+        amount=transaction.amount
+    )
+
+
+def _account_snapshots(session=None):
+    """ Query of accounts along with their last balance snapshot, found
+    through the snapshot sequence number of the account, so only one balance
+    is read per account. """
+    session = session or current_app.db
+    return session.query(CreditAccount, Balance).join(
+        Balance, and_(
+            Balance.credit_account_uuid == CreditAccount.uuid,
+            Balance.seq == CreditAccount.snapshot_seq))
+
+
+def _ledger_entries(session, account_uuids, after_seq):
+    """ Query of the ledger entries of accounts: their payments, withdrawals
+    and interest accruals numbered after `after_seq`, an expression of the
+    account such as its snapshot sequence number. Each row has the
+    account_uuid, seq, type, time, amount and interest_owed of an entry. """
+    def entries(model, entry_type, time, amount, interest_owed):
+        return session.query(
+            model.credit_account_uuid.label('account_uuid'),
+            model.seq.label('seq'),
+            literal(entry_type).label('type'),
+            time.label('time'),
+            amount.label('amount'),
+            interest_owed.label('interest_owed')
+        ).join(
+            CreditAccount, model.credit_account_uuid == CreditAccount.uuid
+        ).filter(
+            CreditAccount.uuid.in_(account_uuids),
+            model.seq > after_seq)
+
+    no_interest = cast(null(), BIGINT)
+    return entries(
+        Payment, 'payment', Payment.time, Payment.amount, no_interest
+    ).union_all(
+        entries(Withdrawal, 'withdrawal', Withdrawal.time, Withdrawal.amount,
+                no_interest),
+        entries(InterestAccrual, 'interest', InterestAccrual.period_end,
+                InterestAccrual.interest, InterestAccrual.interest_owed))
+
+
+def _apply_entry(account, balance, entry):
+    """ Replays a ledger entry on top of the balance right before it and
+    returns the balance right after it. """
+    principal_owed = balance.principal_owed
+    interest_owed = balance.interest_owed
+    if entry.type == 'payment':
+        principal_owed, interest_owed = make_payment(
+            principal_owed, interest_owed, entry.amount)
+    elif entry.type == 'withdrawal':
+        principal_owed += entry.amount
+    else:
+        # Accruals set the interest owed to the one calculated for the pay
+        # period, see `_record_interests`.
+        interest_owed = entry.interest_owed
+
+    return _create_balance(
+        account,
+        seq=entry.seq,
+        time=entry.time,
+        principal_owed=principal_owed,
+        interest_owed=interest_owed)
+
+
+def replay_ledger(account, balance, entries):
+    """ Replays ledger entries on top of a balance snapshot of an account.
+
+    Args:
+        account (CreditAccount) - The account of the entries
+        balance (Balance) - The balance snapshot the entries were recorded
+                            after
+        entries (iterable) - The ledger entries, in any order
+
+    Returns:
+        Balance - The balance after the last entry, which isn't recorded
+    """
+    for entry in sorted(entries, key=attrgetter('seq')):
+        balance = _apply_entry(account, balance, entry)
+    return balance
+
+
+def stored_time(time):
+    """ A time as it is stored, without a time zone. Times are stored as
+    UTC, which is how they are serialized. """
+    if time is None or time.tzinfo is None:
+        return time
+    return time.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def opening_balance(account):
+    """ The balance of an account when it was opened, before any ledger
+    entry. """
+    return _create_balance(
+        account, seq=0, time=account.time_opened, principal_owed=0,
+        interest_owed=0)
+
+
+def replay_history_entry(account, balance, entry, since=None, until=None):
+    """ Replays a ledger entry on top of the balance right before it, for
+    the history of the account. The balance after it is listed unless a
+    balance was recorded with the entry, or the entry is outside the times
+    listed. It gets a uuid derived from the account and the entry, so it is
+    listed the same way every time.
+
+    Args:
+        account (CreditAccount) - The account of the entry
+        balance (Balance) - The balance right before the entry
+        entry (row) - The ledger entry, with whether a balance was
+                      `recorded` with it
+        since (datetime) - Only list balances from this time onwards
+        until (datetime) - Only list balances from before this time
+
+    Returns:
+        tuple - The balance after the entry, and whether it is listed
+    """
+    balance = _apply_entry(account, balance, entry)
+    balance.uuid = str(uuid.uuid5(uuid.UUID(account.uuid), str(entry.seq)))
+    listed = not (entry.recorded or
+                  (since is not None and entry.time < since) or
+                  (until is not None and entry.time >= until))
+    return balance, listed
+
+
+def _replay_snapshots(snapshots, session=None):
+    """ Brings the balance snapshot of each account up to date, replaying
+    the ledger entries recorded after it. The entries of every account are
+    read in one query, which accounts without any are left out of.
 
-    if not account:
+    Args:
+        snapshots (list(tuple)) - The (CreditAccount, Balance) snapshots
+
+    Returns:
+        list(tuple) - The accounts along with their current balance
+    """
+    session = session or current_app.db
+    behind = [
+        account.uuid for account, _ in snapshots
+        if account.ledger_seq > account.snapshot_seq
+    ]
+
+    entries = defaultdict(list)
+    if behind:
+        for entry in _ledger_entries(
+                session, behind, CreditAccount.snapshot_seq):
+            entries[entry.account_uuid].append(entry)
+
+    return [
+        (account, replay_ledger(account, balance, entries[account.uuid]))
+        for account, balance in snapshots
+    ]
+
+
+def _replayed_history_balances(session, account_uuid, since, until):
+    """ Replays the balances after the ledger entries of an account between
+    two times that no balance was recorded for, from the last balance
+    recorded before the first of them, or from the opening balance if
+    compaction deleted it. The entries are read with a server-side cursor a
+    page at a time, so the balances are replayed as they are read.
+
+    Entries are numbered in the order they were recorded in, so the
+    balances are listed in time order unless an entry was recorded with a
+    time earlier than the ones before it.
+    """
+    since, until = stored_time(since), stored_time(until)
+
+    def window(model, time):
+        query = session.query(func.min(model.seq), func.max(model.seq)).filter(
+            model.credit_account_uuid == account_uuid)
+        if since is not None:
+            query = query.filter(time >= since)
+        if until is not None:
+            query = query.filter(time < until)
+        return query.one()
+
+    # Entries recorded before the ledger have no sequence number, and have a
+    # balance recorded with them.
+    windows = [
+        window(Payment, Payment.time),
+        window(Withdrawal, Withdrawal.time),
+        window(InterestAccrual, InterestAccrual.period_end),
+    ]
+    firsts = [first for first, _ in windows if first is not None]
+    if not firsts:
+        return
+    first = min(firsts)
+    last = max(last for _, last in windows if last is not None)
+
+    account = session.query(CreditAccount).get(account_uuid)
+    balance = session.query(Balance).filter(
+        Balance.credit_account_uuid == account_uuid,
+        Balance.seq < first
+    ).order_by(Balance.seq.desc()).first() or opening_balance(account)
+
+    entries = _ledger_entries(session, [account_uuid], balance.seq).subquery()
+    recorded = session.query(Balance.seq).filter(
+        Balance.credit_account_uuid == account_uuid,
+        Balance.seq == entries.c.seq).exists()
+    query = session.query(entries, recorded.label('recorded')).filter(
+        entries.c.seq <= last
+    ).order_by(entries.c.seq).yield_per(HISTORY_PAGE_SIZE)
+
+    for entry in query:
+        balance, listed = replay_history_entry(
+            account, balance, entry, since, until)
+        if listed:
+            yield balance
+
+
+def _lock_accounts(account_uuids):
+    """ Locks the rows of the accounts until the end of the transaction.
+    Every write to an account holds this lock, so writes to the same account
+    are serialized while writes to different accounts go on in parallel.
+
+    The lock has to be taken before the last balance is read, so the read
+    sees the balances written by the previous holder of the lock. Accounts
+    are locked in uuid order, so transactions locking several accounts can't
+    deadlock each other.
+    """
+    current_app.db.query(
+        CreditAccount.uuid
+    ).filter(
+        CreditAccount.uuid.in_(account_uuids)
+    ).order_by(
+        CreditAccount.uuid
+    ).with_for_update().all()
+
+
+def _get_account_snapshot(account_uuid, lock=False, session=None):
+    """ Retrieves the account along with its current balance, replayed from
+    its last balance snapshot, locking the account first when it is going to
+    be written to. Read from the primary unless another session is given.
+    """
+    if not valid_uuid(account_uuid):
         raise APIError("Account not found", SC.NOT_FOUND)
-    return account
 
+    query = _account_snapshots(session).filter(
+        CreditAccount.uuid == account_uuid)
+
+    if lock:
+        _lock_accounts([account_uuid])
+        # The account may have been read before it was locked.
+        query = query.populate_existing()
+
+    snapshot = query.first()
 
-def _create_balance(time, principal_owed, interest_owed, max_credit):
+    if not snapshot:
+        raise APIError("Account not found", SC.NOT_FOUND)
+    return _replay_snapshots([snapshot], session)[0]
+
+
+def _get_balances_since(account_uuid, start_time):
+    """ Retrieves the (time, seq, principal_owed, interest_owed) of the
+    balance snapshots recorded since the start time along with the last one
+    recorded before it, sorted by time ascending. """
+    query = current_app.db.query(
+        Balance.time, Balance.seq, Balance.principal_owed,
+        Balance.interest_owed
+    ).filter(
+        Balance.credit_account_uuid == account_uuid)
+
+    previous_balance = query.filter(
+        Balance.time < start_time
+    ).order_by(
+        Balance.time.desc(), Balance.seq.desc()
+    ).first()
+
+    balances = query.filter(
+        Balance.time >= start_time
+    ).order_by(
+        Balance.time, Balance.seq
+    ).all()
+
+    if previous_balance:
+        balances.insert(0, previous_balance)
+    return balances
+
+
+def _next_seq(account):
+    """ Numbers a new entry of the ledger of an account. """
+    account.ledger_seq += 1
+    return account.ledger_seq
+
+
+def _create_balance(account, seq, time, principal_owed, interest_owed):
     return Balance(
         uuid=str(uuid.uuid4()),
+        credit_account_uuid=account.uuid,
+        seq=seq,
         time=time,
         principal_owed=principal_owed,
         interest_owed=interest_owed,
-        available_credit=max_credit - (principal_owed + interest_owed))
+        available_credit=account.max_credit - (principal_owed + interest_owed))
+
+
+def _record_balance(account, balance, new_rows):
+    """ Records the balance after a ledger entry as a snapshot of the
+    account, if `ledger.snapshot_interval` entries were recorded since the
+    last snapshot. This bounds the entries replayed to read the account. """
+    if balance.seq - account.snapshot_seq >= config.ledger.snapshot_interval:
+        new_rows.append(balance)
+        account.snapshot_seq = balance.seq
+
+
+def _as_row(instance):
+    """ Converts a model instance into a row for a set-based insert. """
+    return {
+        column.key: getattr(instance, column.key)
+        for column in instance.__table__.columns
+    }
+
+
+def _insert_rows(instances):
+    """ Writes model instances with one set-based insert per table. """
+    rows = OrderedDict()
+    for instance in instances:
+        rows.setdefault(type(instance), []).append(_as_row(instance))
+
+    for model, model_rows in rows.items():
+        current_app.db.execute(model.__table__.insert(), model_rows)
+
+
+def _pay_periods_closed(account, time):
+    return (time - account.time_opened).days // PAY_PERIOD
+
+
+def _next_accrual(account):
+    """ The time the pay period after the accrual checkpoint closes, from
+    which on interest is due. """
+    return account.time_opened + timedelta(
+        days=(_pay_periods_closed(account, account.accrued_through) + 1) *
+        PAY_PERIOD)
+
+
+def _accrual_due(account, as_of_date):
+    """ Whether a pay period has closed since interest was last accrued. """
+    # Pay periods are compared by number rather than by closing time, as
+    # the time of day interest is accrued at depends on the request. Interest
+    # accrued ahead of time must not be accrued again by a request made
+    # later in the day.
+    return (_pay_periods_closed(account, as_of_date) >
+            _pay_periods_closed(account, account.accrued_through))
+
+
+def serialize_up_to_date_account(account, last_balance, time):
+    """ Serializes and caches an account read without locking it, if no
+    interest is due as of the time.
+
+    Returns:
+        dict - The serialized account, or None if interest has to be accrued
+               first
+    """
+    if _accrual_due(account, time):
+        return None
+
+    # Nothing to write, the last balance is up to date. Accounts written to
+    # recently may have been read from a replica without the write, which
+    # would be served to every client if cached.
+    serialized_account = serialize_account(account, last_balance)
+    if not written_recently(account.uuid):
+        account_cache.set(
+            account.uuid, (serialized_account, _next_accrual(account)))
+    return serialized_account
+
+
+def _get_accrual_history(account):
+    """ Retrieves the part of the balance history needed to accrue interest
+    for the pay periods closing after the accrual checkpoint. """
+    # Interest can only change for the pay period containing the last
+    # recorded balance and the ones after it. Every balance in those periods
+    # comes after the start of the last accrued pay period, so only those
+    # balances and the one right before them need to be read, replaying the
+    # ledger from the snapshot before them.
+    snapshots = _get_balances_since(
+        account.uuid, account.accrued_through - timedelta(days=PAY_PERIOD))
+    entries = _ledger_entries(
+        current_app.db, [account.uuid], snapshots[0].seq)
+
+    history, _ = _replay_history(account, snapshots, entries)
+    return _with_opening_balance(account, history)
+
+
+def _get_accrual_histories(accounts):
+    """ Retrieves the accrual history of many accounts at once, reading the
+    balances of all of them in two queries and their ledger entries in one.
+
+    Returns:
+        dict - The accrual history and current balance of each account, by
+               account uuid
+    """
+    window_start = CreditAccount.accrued_through - timedelta(days=PAY_PERIOD)
+    account_uuids = [account.uuid for account in accounts]
+
+    previous = aliased(Balance)
+
+    def previous_balance(column):
+        return current_app.db.query(
+            column
+        ).filter(
+            previous.credit_account_uuid == CreditAccount.uuid,
+            previous.time < window_start
+        ).order_by(
+            previous.time.desc(), previous.seq.desc()
+        ).limit(1).correlate(CreditAccount).as_scalar()
+
+    columns = (
+        Balance.credit_account_uuid, Balance.time, Balance.seq,
+        Balance.principal_owed, Balance.interest_owed)
+
+    previous_balances = current_app.db.query(*columns).join(
+        CreditAccount, Balance.uuid == previous_balance(previous.uuid)
+    ).filter(
+        CreditAccount.uuid.in_(account_uuids))
+
+    window_balances = current_app.db.query(*columns).join(
+        CreditAccount, Balance.credit_account_uuid == CreditAccount.uuid
+    ).filter(
+        CreditAccount.uuid.in_(account_uuids),
+        Balance.time >= window_start)
+
+    # Accounts opened within the window have no balance before it.
+    entries = _ledger_entries(
+        current_app.db, account_uuids,
+        func.coalesce(previous_balance(previous.seq), 0))
+
+    snapshots = defaultdict(list)
+    for balance in chain(previous_balances, window_balances):
+        snapshots[balance.credit_account_uuid].append(balance)
+    account_entries = defaultdict(list)
+    for entry in entries:
+        account_entries[entry.account_uuid].append(entry)
+
+    histories = {}
+    for account in accounts:
+        history, balance = _replay_history(
+            account, snapshots[account.uuid], account_entries[account.uuid])
+        histories[account.uuid] = (
+            _with_opening_balance(account, history), balance)
+    return histories
+
+
+def _with_opening_balance(account, history):
+    if history.first_time > account.time_opened:
+        # Pay periods are counted from the opening balance, which is older
+        # than any of the balances that were read.
+        history.insert(account.time_opened, 0)
+    return history
+
+
+def _replay_history(account, snapshots, entries):
+    """ Builds the balance history of an account from balance snapshots and
+    the ledger entries recorded after the first of them, replaying each
+    entry on top of the balance before it.
+
+    Args:
+        account (CreditAccount) - The account of the balances
+        snapshots (list) - The balance snapshots, with at least the seq,
+                           time, principal_owed and interest_owed
+        entries (iterable) - The ledger entries
+
+    Returns:
+        tuple - The BalanceHistory and the last balance of the account
+    """
+    # Snapshots come before the entry they were recorded at, which is then
+    # already included in them. Entries before the first snapshot, left by
+    # compacted balances, are included in it too.
+    items = sorted(chain(
+        ((snapshot.seq, 0, snapshot) for snapshot in snapshots),
+        ((entry.seq, 1, entry) for entry in entries)
+    ), key=itemgetter(0, 1))
+
+    history = BalanceHistory()
+    balance = None
+    for seq, is_entry, item in items:
+        if not is_entry:
+            balance = item
+        elif balance is not None and seq > balance.seq:
+            balance = _apply_entry(account, balance, item)
+        else:
+            continue
+        history.insert(balance.time, balance.principal_owed)
+    return history, balance
+
+
+def _record_history(history, balance):
+    """ Adds a new balance to a balance history, keeping it sorted by time. """
+    history.insert(balance.time, balance.principal_owed)
+
+
+def _accrue_interest(account, last_balance, as_of_date, new_rows,
+                     history=None):
+    """ Creates the balances and interest accruals for the pay periods that
+    closed since interest was last accrued and returns the new last balance.
+
+    Args:
+        account (CreditAccount) - The account to accrue interest for
+        last_balance (Balance) - The last recorded balance of the account
+        as_of_date (datetime) - The time to accrue interest up to
+        new_rows (list) - The created balances and interest accruals are
+                          appended to this list
+        history (BalanceHistory) - The accrual history of the account, read
+                                   from the database if not given. Created
+                                   balances are recorded in it.
+
+    Returns:
+        Balance - The last balance of the account after accruing interest
+    """
+    if not _accrual_due(account, as_of_date):
+        return last_balance
+
+    if history is None:
+        history = _get_accrual_history(account)
+
+    with timed('interest_calculation'):
+        accruals = get_period_accruals(
+            account.apr, PAY_PERIOD, as_of_date, history
+        )
+
+    return _record_interests(
+        account, last_balance.principal_owed, accruals, new_rows,
+        history) or last_balance
+
+
+def _create_interest_accrual(account, period_end, principal_days, interest,
+                             seq=None, interest_owed=None):
+    return InterestAccrual(
+        credit_account_uuid=account.uuid,
+        period_start=period_end - timedelta(days=PAY_PERIOD),
+        period_end=period_end,
+        principal_days=principal_days,
+        interest=interest,
+        seq=seq,
+        interest_owed=interest_owed)
+
+
+def _record_interests(account, principal_owed, accruals, new_rows,
+                      history=None):
+    """ Records the interest accruals for the calculated pay periods in the
+    ledger, advancing the accrual checkpoint of the account, and returns the
+    balance after the last of them. Pay periods that were already accrued
+    are left out. """
+    accrued_periods = _pay_periods_closed(account, account.accrued_through)
+    balance = None
+    interest_owed = 0
+    for (calc_date, principal_days, interest) in accruals:
+        # The interest owed adds up over the calculated pay periods.
+        interest_owed += interest
+        if _pay_periods_closed(account, calc_date) <= accrued_periods:
+            continue
+
+        seq = _next_seq(account)
+        balance = _create_balance(
+            account,
+            seq=seq,
+            time=calc_date,
+            principal_owed=principal_owed,
+            interest_owed=interest_owed
+        )
+        new_rows.append(_create_interest_accrual(
+            account, calc_date, principal_days, interest, seq=seq,
+            interest_owed=interest_owed))
+        _record_balance(account, balance, new_rows)
+        if history is not None:
+            _record_history(history, balance)
+        account.accrued_through = max(account.accrued_through, calc_date)
+
+    return balance
+
+
+def _apply_payment(account, last_balance, payment, time):
+    """ Creates the payment made on an account and the balance after it. """
+    try:
+        principal, interest = make_payment(
+            last_balance.principal_owed, last_balance.interest_owed, payment)
+    except ValueError as ex:
+        raise APIError(str(ex), SC.UNPROCESSABLE)
+
+    seq = _next_seq(account)
+    balance = _create_balance(
+        account,
+        seq=seq,
+        time=time,
+        principal_owed=principal,
+        interest_owed=interest
+    )
+
+    return balance, Payment(
+        uuid=str(uuid.uuid4()),
+        credit_account_uuid=account.uuid,
+        seq=seq,
+        amount=payment,
+        time=time
+    )
+
+
+def _apply_withdrawal(account, last_balance, withdrawal_amount, time):
+    """ Creates the withdrawal made on an account and the balance after it.
+    """
+    try:
+        make_withdrawal(last_balance.available_credit, withdrawal_amount)
+    except ValueError as ex:
+        raise APIError(str(ex), SC.UNPROCESSABLE)
+
+    seq = _next_seq(account)
+    balance = _create_balance(
+        account,
+        seq=seq,
+        time=time,
+        principal_owed=last_balance.principal_owed + withdrawal_amount,
+        interest_owed=last_balance.interest_owed
+    )
+
+    return balance, Withdrawal(
+        uuid=str(uuid.uuid4()),
+        credit_account_uuid=account.uuid,
+        seq=seq,
+        amount=withdrawal_amount,
+        time=time
+    )
+
+
+def _record_totals(account, before, after):
+    """ Updates the customer and portfolio totals with the change of the
+    balance of an account. """
+    totals = TotalsChanges()
+    totals.add(account, before, after)
+    totals.apply()
+
+
+def _serialize_simulation(account, time, payment, closes, projection,
+                          include_balances):
+    """ Serializes the projection of a payment amount, from the pay period
+    columns of `project_payoff`, up to the pay period paying the account off.
+    """
+    interests, paid, principals, interests_owed = projection
+    owed = (principals + interests_owed).tolist()
+    if not owed:
+        # Nothing is owed to begin with.
+        payoff_periods = 0
+    elif 0 in owed:
+        payoff_periods = owed.index(0) + 1
+    else:
+        payoff_periods = None
+
+    periods = len(owed) if payoff_periods is None else payoff_periods
+    simulation = dict(
+        payment=payment,
+        payoff_periods=payoff_periods,
+        payoff_time=(
+            None if payoff_periods is None else
+            closes[payoff_periods - 1] if payoff_periods else time),
+        total_interest=int(interests[:periods].sum()),
+        total_paid=int(paid[:periods].sum()),
+        principal_owed=(
+            int(principals[periods - 1]) if periods
+            else account['principal_owed']),
+        interest_owed=(
+            int(interests_owed[periods - 1]) if periods
+            else account['interest_owed']))
+
+    if include_balances:
+        simulation['balances'] = [
+            dict(time=close, interest=interest, payment=payment_made,
+                 principal_owed=principal_owed, interest_owed=interest_owed)
+            for close, interest, payment_made, principal_owed, interest_owed
+            in zip(closes[:periods], interests[:periods].tolist(),
+                   paid[:periods].tolist(), principals[:periods].tolist(),
+                   interests_owed[:periods].tolist())
+        ]
+    return simulation
+
+
+def _get_idempotent_result(account_uuid, idempotency_key, transaction_type,
+                           amount):
+    """ Retrieves the serialized account stored for a request made with an
+    idempotency key, if the key was used before and hasn't expired. """
+    stored = current_app.db.query(
+        CreditAccount, IdempotencyKey
+    ).join(
+        IdempotencyKey,
+        IdempotencyKey.credit_account_uuid == CreditAccount.uuid
+    ).filter(
+        CreditAccount.uuid == account_uuid,
+        IdempotencyKey.key == idempotency_key,
+        IdempotencyKey.time_created >= datetime.now() - IDEMPOTENCY_KEY_TTL
+    ).first()
+
+    if not stored:
+        return None
+
+    account, result = stored
+    if (result.transaction_type, result.amount) != (transaction_type, amount):
+        raise APIError(
+            "Idempotency key was already used for a different request",
+            SC.CONFLICT)
+    return serialize_account(account, result)
+
+
+_TRANSACTIONS = {
+    'payment': _apply_payment,
+    'withdrawal': _apply_withdrawal,
+}
+
+
+def _transaction_result(index, account_uuid, status_code, message=None,
+                        account=None):
+    return dict(
+        index=index,
+        account_uuid=account_uuid,
+        status_code=status_code,
+        message=message,
+        account=account)
 
 
 class AccountController:
@@ -48,128 +841,748 @@ class AccountController:
 
         account = CreditAccount(
             uuid=str(uuid.uuid4()),
+            customer_uuid=customer.uuid,
             time_opened=opening_time,
+            accrued_through=opening_time,
+            ledger_seq=0,
+            snapshot_seq=0,
             apr=apr,
             max_credit=max_credit)
 
+        # The first snapshot, before any entry was recorded in the ledger.
         opening_balance = _create_balance(
+            account,
+            seq=0,
             time=opening_time,
             principal_owed=0,
-            interest_owed=0,
-            max_credit=max_credit)
+            interest_owed=0)
 
-        account.balances.append(opening_balance)
         customer.accounts.append(account)
 
+        totals = TotalsChanges()
+        totals.add(account, None, opening_balance)
+        totals.apply()
+
         current_app.db.add(opening_balance)
         current_app.db.add(account)
         current_app.db.add(customer)
         current_app.db.commit()
-        return serialize_account(account)
+        mark_written(account.uuid)
+        return serialize_account(account, opening_balance)
 
     @staticmethod
     def get_account(account_uuid, time):
-        account = _get_account(account_uuid)
-        AccountController.update_balances(account_uuid, time)
+        # Accounts written to recently are read from the primary. The cache
+        # is skipped too, it may hold what was read from the replica before
+        # the write reached it.
+        if written_recently(account_uuid):
+            session = get_db()
+        else:
+            cached = account_cache.get(
+                account_uuid, valid=lambda entry: time < entry[1])
+            if cached:
+                return cached[0]
+            session = get_replica_db()
 
-        return serialize_account(account)
+        account, last_balance = _get_account_snapshot(
+            account_uuid, session=session)
+
+        serialized_account = serialize_up_to_date_account(
+            account, last_balance, time)
+        if serialized_account is not None:
+            return serialized_account
+
+        # Interest may have been accrued while waiting for the lock.
+        account, last_balance = _get_account_snapshot(account_uuid, lock=True)
+
+        new_rows = []
+        balance = _accrue_interest(account, last_balance, time, new_rows)
+
+        current_app.db.add_all(new_rows)
+        _record_totals(account, last_balance, balance)
+        serialized_account = serialize_account(account, balance)
+        next_accrual = _next_accrual(account)
+        current_app.db.commit()
+        mark_written(account_uuid)
+
+        account_cache.set(account_uuid, (serialized_account, next_accrual))
+        return serialized_account
 
     @staticmethod
     def update_balances(account_uuid, as_of_date):
-        account = _get_account(account_uuid)
+        account, last_balance = _get_account_snapshot(account_uuid, lock=True)
 
-        balances = [
-            dict(time=row.time, principal_owed=row.principal_owed)
-            for row in account.balances
-        ]
+        new_rows = []
+        balance = _accrue_interest(
+            account, last_balance, as_of_date, new_rows)
 
-        interests = get_monthly_interests(
-            account.apr, 30, as_of_date, balances
-        )
+        current_app.db.add_all(new_rows)
+        _record_totals(account, last_balance, balance)
+        current_app.db.commit()
+        mark_written(account_uuid)
+        account_cache.delete(account_uuid)
 
-        last_balance = account.balances[-1]
-        principal_owed = last_balance.principal_owed
+        return balance
 
-        for (interest_owed, calc_date) in interests:
-            last_balance = _create_balance(
-                time=calc_date,
-                principal_owed=principal_owed,
-                interest_owed=interest_owed,
-                max_credit=account.max_credit
-            )
+    @staticmethod
+    def accrue_due_interest(as_of_date, lower_uuid=None, upper_uuid=None,
+                            batch_size=1000):
+        """ Accrues the interest of every account that had a pay period close
+        since interest was last accrued, so requests find it already
+        recorded. Accounts are processed `batch_size` at a time, each batch
+        in its own transaction. Accounts locked by a request are skipped, as
+        the request accrues their interest itself.
 
-            account.balances.append(last_balance)
+        Args:
+            as_of_date (datetime) - The time to accrue interest up to
+            lower_uuid (str) - Only accrue accounts with a uuid greater than
+                               or equal to this one
+            upper_uuid (str) - Only accrue accounts with a uuid less than
+                               this one
+            batch_size (int) - The number of accounts read at a time
 
-        current_app.db.add(account)
-        current_app.db.commit()
+        Returns:
+            int - The number of accounts interest was accrued for
+        """
+        # A pay period closed since the checkpoint only if the checkpoint is
+        # more than a pay period minus the time of day old, which lets the
+        # database leave out most of the accounts that are up to date.
+        due_before = as_of_date - timedelta(days=PAY_PERIOD - 1)
+        accrued = 0
 
-        return last_balance
+        query = current_app.db.query(CreditAccount).filter(
+            CreditAccount.accrued_through < due_before)
+        if upper_uuid is not None:
+            query = query.filter(CreditAccount.uuid < upper_uuid)
+
+        batch_query = query
+        if lower_uuid is not None:
+            batch_query = query.filter(CreditAccount.uuid >= lower_uuid)
+
+        while True:
+            batch = batch_query.order_by(
+                CreditAccount.uuid
+            ).limit(batch_size).with_for_update(skip_locked=True).all()
+
+            if not batch:
+                break
+            batch_query = query.filter(CreditAccount.uuid > batch[-1].uuid)
+
+            accounts = [
+                account for account in batch
+                if _accrual_due(account, as_of_date)
+            ]
+            if not accounts:
+                current_app.db.commit()
+                continue
+
+            histories = _get_accrual_histories(accounts)
+            account_ids, aprs = [], []
+            times, principals_owed = array('q'), array('q')
+            for account in accounts:
+                history, _ = histories[account.uuid]
+                account_ids.extend([account.uuid] * len(history))
+                aprs.extend([account.apr] * len(history))
+                times.extend(history.times)
+                principals_owed.extend(history.principals_owed)
+
+            with timed('interest_calculation'):
+                account_ids, ends, principal_days, interests = (
+                    get_period_accruals_batch(
+                        PAY_PERIOD, as_of_date, account_ids, times,
+                        principals_owed, aprs))
+
+            account_accruals = defaultdict(list)
+            for account_uuid, calc_date, days, interest in zip(
+                    account_ids, ends.astype(datetime),
+                    principal_days.tolist(), interests.tolist()):
+                account_accruals[account_uuid].append(
+                    (calc_date, days, interest))
+
+            new_rows = []
+            totals = TotalsChanges()
+            for account in accounts:
+                _, last_balance = histories[account.uuid]
+                balance = _record_interests(
+                    account, last_balance.principal_owed,
+                    account_accruals[account.uuid], new_rows)
+                if balance is not None:
+                    totals.add(account, last_balance, balance)
+
+            _insert_rows(new_rows)
+            totals.apply()
+            current_app.db.commit()
+            accrued += len(accounts)
+
+            for account in accounts:
+                account_cache.delete(account.uuid)
+
+        return accrued
 
     @staticmethod
-    def payment(account_uuid, payment, time):
-        account = _get_account(account_uuid)
+    def backfill_interest_accruals(batch_size=100):
+        """ Records the interest accruals of the pay periods that were
+        accrued before they were recorded, calculating them over the balance
+        history of each account, replayed from its ledger. The accruals are
+        left out of the ledger, the balances recorded with them already
+        include them. Periods that already have an accrual are
+        left as they are. Accounts are processed `batch_size` at a time,
+        each batch locked and written in its own transaction.
 
-        last_balance = AccountController.update_balances(account_uuid, time)
-        principal_owed = last_balance.principal_owed
-        interest_owed = last_balance.interest_owed
+        Returns:
+            int - The number of interest accruals recorded
+        """
+        recorded = 0
+        query = current_app.db.query(CreditAccount).filter(
+            CreditAccount.accrued_through > CreditAccount.time_opened)
 
-        try:
-            principal, interest = make_payment(
-                principal_owed, interest_owed, payment)
-        except ValueError as ex:
-            raise APIError(str(ex), SC.UNPROCESSABLE)
+        batch_query = query
+        while True:
+            batch = batch_query.order_by(
+                CreditAccount.uuid
+            ).limit(batch_size).with_for_update().all()
 
-        account.balances.append(
-            _create_balance(
-                time=time,
-                principal_owed=principal,
-                interest_owed=interest,
-                max_credit=account.max_credit
-            )
-        )
+            if not batch:
+                break
+            batch_query = query.filter(CreditAccount.uuid > batch[-1].uuid)
 
-        account.payments.append(
-            Payment(
-                uuid=str(uuid.uuid4()),
-                amount=payment,
-                time=time
-            )
-        )
+            accounts = {account.uuid: account for account in batch}
+            recorded_periods = defaultdict(set)
+            for account_uuid, period_end in current_app.db.query(
+                    InterestAccrual.credit_account_uuid,
+                    InterestAccrual.period_end
+            ).filter(
+                InterestAccrual.credit_account_uuid.in_(accounts)
+            ):
+                recorded_periods[account_uuid].add(
+                    _pay_periods_closed(accounts[account_uuid], period_end))
+
+            snapshots = defaultdict(list)
+            for balance in current_app.db.query(
+                    Balance.credit_account_uuid, Balance.time, Balance.seq,
+                    Balance.principal_owed, Balance.interest_owed
+            ).filter(
+                Balance.credit_account_uuid.in_(accounts)
+            ).yield_per(HISTORY_PAGE_SIZE):
+                snapshots[balance.credit_account_uuid].append(balance)
+
+            entries = defaultdict(list)
+            for entry in _ledger_entries(current_app.db, list(accounts), 0):
+                entries[entry.account_uuid].append(entry)
+
+            new_accruals = []
+            for account in batch:
+                accrued_periods = _pay_periods_closed(
+                    account, account.accrued_through)
+                history, _ = _replay_history(
+                    account, snapshots[account.uuid], entries[account.uuid])
+                history = _with_opening_balance(account, history)
+
+                for period_end, principal_days, interest in (
+                        get_period_accruals(
+                            account.apr, PAY_PERIOD, account.accrued_through,
+                            history, since=account.time_opened)):
+                    period = _pay_periods_closed(account, period_end)
+                    if (0 < period <= accrued_periods and
+                            period not in recorded_periods[account.uuid]):
+                        new_accruals.append(_create_interest_accrual(
+                            account, period_end, principal_days, interest))
+
+            _insert_rows(new_accruals)
+            current_app.db.commit()
+            recorded += len(new_accruals)
+
+        return recorded
+
+    @staticmethod
+    def compact_balances(before, lower_uuid=None, upper_uuid=None,
+                         batch_size=1000):
+        """ Compacts the balances of the pay periods that closed before a
+        time into the last balance of each pay period, which is all the
+        interest accrual reads of them. Pay periods in the accrual window of
+        an account are left as they are. Accounts are processed `batch_size`
+        at a time, each batch in its own transaction. Accounts locked by a
+        request are skipped, and compacted the next time this is run.
+
+        Args:
+            before (datetime) - Only compact pay periods closing before this
+                                time
+            lower_uuid (str) - Only compact accounts with a uuid greater than
+                               or equal to this one
+            upper_uuid (str) - Only compact accounts with a uuid less than
+                               this one
+            batch_size (int) - The number of accounts compacted at a time
+
+        Returns:
+            int - The number of balances deleted
+        """
+        deleted = 0
+        query = current_app.db.query(CreditAccount.uuid).filter(
+            CreditAccount.time_opened < before)
+        if upper_uuid is not None:
+            query = query.filter(CreditAccount.uuid < upper_uuid)
+
+        batch_query = query
+        if lower_uuid is not None:
+            batch_query = query.filter(CreditAccount.uuid >= lower_uuid)
+
+        while True:
+            batch = [account_uuid for account_uuid, in batch_query.order_by(
+                CreditAccount.uuid
+            ).limit(batch_size).with_for_update(skip_locked=True)]
+
+            if not batch:
+                break
+            batch_query = query.filter(CreditAccount.uuid > batch[-1])
+
+            deleted += current_app.db.execute(COMPACT_BALANCES, dict(
+                account_uuids=tuple(batch),
+                before=before,
+                pay_period=PAY_PERIOD)).rowcount
+            current_app.db.commit()
+
+        return deleted
+
+    @staticmethod
+    def rebuild_totals(batch_size=1000):
+        """ Recalculates the customer and portfolio totals from the current
+        balance of every account, such as for the accounts opened before
+        the totals were kept. The totals are locked until it is done, so
+        writes to balances wait for it rather than being left out.
+
+        Args:
+            batch_size (int) - The number of accounts read at a time
+
+        Returns:
+            int - The number of accounts added up
+        """
+        current_app.db.execute(text(
+            "LOCK TABLE customer_totals, portfolio_totals IN EXCLUSIVE MODE"))
+        current_app.db.query(CustomerTotals).delete()
+        current_app.db.query(PortfolioTotals).delete()
+
+        totals = TotalsChanges()
+        added = 0
+        query = _account_snapshots()
+
+        batch_query = query
+        while True:
+            batch = batch_query.order_by(
+                CreditAccount.uuid
+            ).limit(batch_size).all()
+
+            if not batch:
+                break
+            batch_query = query.filter(CreditAccount.uuid > batch[-1][0].uuid)
+
+            for account, balance in _replay_snapshots(batch):
+                totals.add(account, None, balance)
+            totals.apply()
+            added += len(batch)
+            # Only the totals are kept until the end of the transaction.
+            current_app.db.expunge_all()
 
-        current_app.db.add(account)
         current_app.db.commit()
-        return serialize_account(account)
+        return added
 
     @staticmethod
-    def withdrawal(account_uuid, withdrawal_amount, time):
-        account = _get_account(account_uuid)
-        last_balance = AccountController.update_balances(account_uuid, time)
-        available_credit = last_balance.available_credit
+    def list_accounts(customer_uuid, cursor=None, limit=None):
+        """ Lists the accounts of a customer in uuid order, a page at a time,
+        with their balance as of their last write. The balance snapshots of
+        a page are read in one query and the ledger entries recorded after
+        them in another, see `_replay_snapshots`.
 
-        try:
-            make_withdrawal(available_credit, withdrawal_amount)
-        except ValueError as ex:
-            raise APIError(str(ex), SC.UNPROCESSABLE)
+        Args:
+            customer_uuid (str) - The customer uuid
+            cursor (str) - The uuid of the last account of the previous
+                           page, or None for the first page
+            limit (int) - The number of accounts of a page
 
-        principal_owed = last_balance.principal_owed + withdrawal_amount
-        interest_owed = last_balance.interest_owed
+        Returns:
+            dict - The customer uuid, the serialized accounts, and the
+                   cursor of the next page or None on the last page
+        """
+        if not valid_uuid(customer_uuid):
+            raise APIError("Customer not found", SC.NOT_FOUND)
 
-        account.balances.append(
-            _create_balance(
-                time=time,
-                principal_owed=principal_owed,
-                interest_owed=interest_owed,
-                max_credit=account.max_credit
-            )
-        )
+        session = read_db(customer_uuid)
+        snapshots, more = keyset_page(
+            _account_snapshots(session).filter(
+                CreditAccount.customer_uuid == customer_uuid),
+            CreditAccount.uuid, cursor, limit or config.listing.page_size)
 
-        account.withdrawals.append(
-            Withdrawal(
-                uuid=str(uuid.uuid4()),
-                amount=withdrawal_amount,
-                time=time
-            )
-        )
+        # Only an empty page can be of a missing customer.
+        if not snapshots and session.query(Customer.uuid).filter(
+                Customer.uuid == customer_uuid).first() is None:
+            raise APIError("Customer not found", SC.NOT_FOUND)
+
+        accounts = [
+            serialize_account(account, balance)
+            for account, balance in _replay_snapshots(snapshots, session)
+        ]
+        return dict(
+            customer_uuid=customer_uuid,
+            accounts=accounts,
+            next_cursor=accounts[-1]['uuid'] if more else None)
+
+    @staticmethod
+    def simulate(account_uuid, payments, periods=None, time=None,
+                 include_balances=False):
+        """ Projects how an account would be paid off by making the same
+        payment at the close of every pay period, for several payment
+        amounts at once, see `project_payoff`. The projection starts from
+        the balance of the account as of the time, accruing the interest due
+        up to it like reading the account does. Nothing else is recorded.
+
+        Args:
+            account_uuid (str) - The account uuid
+            payments (list(int)) - The payment amounts to project
+            periods (int) - The most pay periods to project
+            time (datetime) - The time to project from, now by default
+            include_balances (bool) - Include the projected balance at the
+                                      close of every pay period
+
+        Returns:
+            dict - The serialized account, and the serialized projection of
+                   each payment amount, in the order they were given
+        """
+        time = time or datetime.now()
+        account = AccountController.get_account(account_uuid, time)
+
+        with timed('payoff_projection'):
+            projection = project_payoff(
+                account['principal_owed'], account['interest_owed'],
+                account['apr'], PAY_PERIOD, payments,
+                periods or config.simulation.periods)
+
+        # The first projected pay period is the one open at the time.
+        first_close = account['time_opened'] + timedelta(days=PAY_PERIOD * (
+            (time - account['time_opened']).days // PAY_PERIOD + 1))
+        closes = [
+            first_close + timedelta(days=PAY_PERIOD * period)
+            for period in range(len(projection[0]))
+        ]
+
+        simulations = [
+            _serialize_simulation(
+                account, time, payment, closes,
+                [values[:, column] for values in projection],
+                include_balances)
+            for column, payment in enumerate(payments)
+        ]
+        return dict(account=account, simulations=simulations)
+
+    @staticmethod
+    def get_interest_accruals(account_uuid, since=None, until=None):
+        """ Retrieves the interest accrued for the pay periods of an account
+        closing between two times, sorted by time ascending, along with
+        their total. The accruals are read through the primary key of the
+        interest_accrual table in a single lookup.
+
+        Args:
+            account_uuid (str) - The account uuid
+            since (datetime) - Only include pay periods closing from this
+                               time onwards
+            until (datetime) - Only include pay periods closing before this
+                               time
+
+        Returns:
+            dict - The serialized interest accruals and the total interest
+        """
+        if not valid_uuid(account_uuid):
+            raise APIError("Account not found", SC.NOT_FOUND)
+
+        conditions = [
+            InterestAccrual.credit_account_uuid == CreditAccount.uuid]
+        if since is not None:
+            conditions.append(InterestAccrual.period_end >= since)
+        if until is not None:
+            conditions.append(InterestAccrual.period_end < until)
+
+        # Outer joined to the account, which tells missing accounts apart
+        # from accounts without any interest accrued.
+        rows = read_db(account_uuid).query(
+            CreditAccount.uuid, InterestAccrual
+        ).outerjoin(
+            InterestAccrual, and_(*conditions)
+        ).filter(
+            CreditAccount.uuid == account_uuid
+        ).order_by(
+            InterestAccrual.period_end
+        ).all()
+
+        if not rows:
+            raise APIError("Account not found", SC.NOT_FOUND)
+
+        accruals = [
+            serialize_interest_accrual(accrual)
+            for _, accrual in rows if accrual is not None
+        ]
+        return dict(
+            accruals=accruals,
+            total_interest=sum(accrual['interest'] for accrual in accruals))
+
+    @staticmethod
+    def payment(account_uuid, payment, time, idempotency_key=None):
+        return AccountController._transaction(
+            'payment', account_uuid, payment, time, idempotency_key)
+
+    @staticmethod
+    def withdrawal(account_uuid, withdrawal_amount, time,
+                   idempotency_key=None):
+        return AccountController._transaction(
+            'withdrawal', account_uuid, withdrawal_amount, time,
+            idempotency_key)
+
+    @staticmethod
+    def _transaction(transaction_type, account_uuid, amount, time,
+                     idempotency_key=None):
+        """ Applies a payment or withdrawal to an account.
+
+        When an idempotency key is given, the resulting account is stored
+        along with the transaction. Retries with the same key get the stored
+        account back, without anything being applied or written again.
+        """
+        if idempotency_key:
+            if len(idempotency_key) > IdempotencyKey.key.type.length:
+                raise APIError("Idempotency key is too long", SC.BAD_REQUEST)
+
+            result = _get_idempotent_result(
+                account_uuid, idempotency_key, transaction_type, amount)
+            if result:
+                return result
+
+        account, last_balance = _get_account_snapshot(account_uuid, lock=True)
+
+        if idempotency_key:
+            # A retry may have been applied while waiting for the lock.
+            result = _get_idempotent_result(
+                account_uuid, idempotency_key, transaction_type, amount)
+            if result:
+                current_app.db.rollback()
+                return result
+
+        new_rows = []
+        previous_balance = last_balance
+        last_balance = _accrue_interest(
+            account, last_balance, time, new_rows)
+
+        last_balance, transaction = _TRANSACTIONS[transaction_type](
+            account, last_balance, amount, time)
+        new_rows.append(transaction)
+        _record_balance(account, last_balance, new_rows)
+
+        current_app.db.add_all(new_rows)
         current_app.db.add(account)
+        _record_totals(account, previous_balance, last_balance)
+
+        if idempotency_key:
+            # Merged, as an expired key may still be stored.
+            current_app.db.merge(IdempotencyKey(
+                credit_account_uuid=account_uuid,
+                key=idempotency_key,
+                time_created=datetime.now(),
+                transaction_type=transaction_type,
+                amount=amount,
+                available_credit=last_balance.available_credit,
+                principal_owed=last_balance.principal_owed,
+                interest_owed=last_balance.interest_owed))
+
+        serialized_account = serialize_account(account, last_balance)
         current_app.db.commit()
-        return serialize_account(account)
+        mark_written(account_uuid)
+        account_cache.delete(account_uuid)
+        return serialized_account
+
+    @staticmethod
+    def evict_idempotency_keys(batch_size=10000):
+        """ Deletes the idempotency keys that expired, `batch_size` at a
+        time, each batch in its own transaction.
+
+        Returns:
+            int - The number of keys deleted
+        """
+        cutoff = datetime.now() - IDEMPOTENCY_KEY_TTL
+        evicted = 0
+
+        while True:
+            expired = current_app.db.query(
+                IdempotencyKey.credit_account_uuid, IdempotencyKey.key
+            ).filter(
+                IdempotencyKey.time_created < cutoff
+            ).limit(batch_size).subquery()
+
+            deleted = current_app.db.query(IdempotencyKey).filter(
+                tuple_(
+                    IdempotencyKey.credit_account_uuid, IdempotencyKey.key
+                ).in_(expired)
+            ).delete(synchronize_session=False)
+            current_app.db.commit()
+
+            evicted += deleted
+            if deleted < batch_size:
+                return evicted
+
+    @staticmethod
+    def bulk_transactions(transactions, accounts_per_commit=1000):
+        """ Applies a batch of payments and withdrawals. The transactions
+        are grouped by account and applied in time order, the resulting rows
+        are written with set-based inserts, committing once for every
+        `accounts_per_commit` accounts.
+
+        Args:
+            transactions (list(dict)) - The transactions to apply, with the
+                following keys:
+                {
+                    'account_uuid': (str) - the account uuid
+                    'type': (str) - either 'payment' or 'withdrawal'
+                    'amount': (int) - the amount of the transaction
+                    'time': (datetime) - the time of the transaction,
+                                         defaults to now()
+                }
+
+        Returns:
+            list(dict) - The result of each transaction, in the same order as
+                         the transactions. Successful transactions include
+                         the serialized account after applying them, failed
+                         ones include the error message.
+        """
+        results = [None] * len(transactions)
+
+        now = datetime.now()
+        account_transactions = OrderedDict()
+        for index, transaction in enumerate(transactions):
+            # A malformed uuid would fail the queries of every account in
+            # its batch.
+            if not valid_uuid(transaction.get('account_uuid')):
+                results[index] = _transaction_result(
+                    index, transaction.get('account_uuid'), SC.UNPROCESSABLE,
+                    message="Invalid account uuid")
+                continue
+
+            transaction.setdefault('time', now)
+            account_transactions.setdefault(
+                transaction['account_uuid'], []).append(index)
+
+        account_uuids = list(account_transactions)
+        for start in range(0, len(account_uuids), accounts_per_commit):
+            chunk = account_uuids[start:start + accounts_per_commit]
+            _lock_accounts(chunk)
+            snapshots = {
+                account.uuid: (account, last_balance)
+                for account, last_balance in _replay_snapshots(
+                    _account_snapshots().filter(
+                        CreditAccount.uuid.in_(chunk)).all())
+            }
+
+            new_rows = []
+            totals = TotalsChanges()
+            for account_uuid in chunk:
+                indexes = sorted(
+                    account_transactions[account_uuid],
+                    key=lambda index: transactions[index]['time'])
+
+                if account_uuid not in snapshots:
+                    for index in indexes:
+                        results[index] = _transaction_result(
+                            index, account_uuid, SC.NOT_FOUND,
+                            message="Account not found")
+                    continue
+
+                account, last_balance = snapshots[account_uuid]
+                previous_balance = last_balance
+
+                # The history is only needed if a pay period closes before
+                # the last transaction, it then keeps track of the new
+                # balances for the following accruals.
+                history = None
+                if _accrual_due(account, transactions[indexes[-1]]['time']):
+                    history = _get_accrual_history(account)
+
+                for index in indexes:
+                    transaction = transactions[index]
+                    time = transaction['time']
+
+                    last_balance = _accrue_interest(
+                        account, last_balance, time, new_rows, history)
+
+                    try:
+                        balance, row = _TRANSACTIONS[transaction['type']](
+                            account, last_balance, transaction['amount'],
+                            time)
+                    except APIError as ex:
+                        results[index] = _transaction_result(
+                            index, account_uuid, ex.status_code,
+                            message=ex.message)
+                        continue
+
+                    last_balance = balance
+                    new_rows.append(row)
+                    _record_balance(account, balance, new_rows)
+                    if history is not None:
+                        _record_history(history, balance)
+
+                    results[index] = _transaction_result(
+                        index, account_uuid, SC.OK,
+                        account=serialize_account(account, last_balance))
+
+                totals.add(account, previous_balance, last_balance)
+
+            _insert_rows(new_rows)
+            totals.apply()
+            current_app.db.commit()
+
+            mark_written(*chunk)
+            for account_uuid in chunk:
+                account_cache.delete(account_uuid)
+
+        return results
+
+    @staticmethod
+    def get_history(account_uuid, since=None, until=None):
+        """ Retrieves the balances, payments and withdrawals of an account
+        between two times, sorted by time ascending. Each table is read
+        through the account's time index with a server-side cursor, a page
+        at a time. The balances after the ledger entries that no snapshot
+        was recorded for are replayed, see `_replayed_history_balances`.
+
+        Args:
+            account_uuid (str) - The account uuid
+            since (datetime) - Only include history from this time onwards
+            until (datetime) - Only include history from before this time
+
+        Returns:
+            iterator(dict) - The serialized history entries
+        """
+        if not valid_uuid(account_uuid):
+            raise APIError("Account not found", SC.NOT_FOUND)
+
+        session = read_db(account_uuid)
+        account = session.query(CreditAccount.uuid).filter(
+            CreditAccount.uuid == account_uuid).first()
+
+        if not account:
+            raise APIError("Account not found", SC.NOT_FOUND)
+
+        def history(model, *order_by):
+            query = session.query(model).filter(
+                model.credit_account_uuid == account_uuid)
+
+            if since is not None:
+                query = query.filter(model.time >= since)
+            if until is not None:
+                query = query.filter(model.time < until)
+
+            return query.order_by(model.time, *order_by).yield_per(
+                HISTORY_PAGE_SIZE)
+
+        balances = heapq.merge(
+            history(Balance, Balance.seq),
+            _replayed_history_balances(session, account_uuid, since, until),
+            key=attrgetter('time', 'seq'))
+
+        return heapq.merge(
+            map(serialize_transaction, history(Payment)),
+            map(serialize_transaction, history(Withdrawal)),
+            map(serialize_balance, balances),
+            key=itemgetter('time'))
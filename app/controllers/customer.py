@@ -2,8 +2,13 @@ import uuid
 
 from flask import current_app
 
-from app.utilities import APIError, SC
-from schema import Customer
+from app.controllers.reporting import serialize_totals
+from app.utilities import (
+    APIError, get_config, get_replica_db, keyset_page, like_prefix,
+    mark_written, read_db, SC, valid_uuid)
+from schema import Customer, CustomerTotals
+
+config = get_config()
 
 
 def serialize_customer(customer):
@@ -25,11 +30,68 @@ class CustomerController:
             lname=lname)
         current_app.db.add(customer)
         current_app.db.commit()
+        mark_written(customer.uuid)
         return serialize_customer(customer)
 
     @staticmethod
     def get(uuid):
-        customer = current_app.db.query(Customer).get(uuid)
+        customer = None
+        if valid_uuid(uuid):
+            customer = read_db(uuid).query(Customer).get(uuid)
         if not customer:
             raise APIError("Customer not found", SC.NOT_FOUND)
         return serialize_customer(customer)
+
+    @staticmethod
+    def list(email=None, email_prefix=None, cursor=None, limit=None):
+        """ Lists customers in uuid order, a page at a time.
+
+        Args:
+            email (str) - Only lists the customers with this email
+            email_prefix (str) - Only lists the customers whose email starts
+                                 with this
+            cursor (str) - The uuid of the last customer of the previous
+                           page, or None for the first page
+            limit (int) - The number of customers of a page
+
+        Returns:
+            dict - The serialized customers, and the cursor of the next page
+                   or None on the last page
+        """
+        query = get_replica_db().query(Customer)
+        if email is not None:
+            query = query.filter(Customer.email == email)
+        if email_prefix is not None:
+            query = query.filter(Customer.email.like(
+                like_prefix(email_prefix), escape='\\'))
+
+        customers, more = keyset_page(
+            query, Customer.uuid, cursor, limit or config.listing.page_size)
+        return dict(
+            customers=[serialize_customer(c) for c in customers],
+            next_cursor=customers[-1].uuid if more else None)
+
+    @staticmethod
+    def get_totals(uuid):
+        """ Retrieves the totals of the accounts of a customer, kept up to
+        date by every write to their balances, in a single lookup.
+
+        Returns:
+            dict - The customer uuid and the serialized totals
+        """
+        if not valid_uuid(uuid):
+            raise APIError("Customer not found", SC.NOT_FOUND)
+
+        # Outer joined to the customer, which tells missing customers apart
+        # from customers without any accounts.
+        row = read_db(uuid).query(
+            Customer.uuid, CustomerTotals
+        ).outerjoin(
+            CustomerTotals, CustomerTotals.customer_uuid == Customer.uuid
+        ).filter(
+            Customer.uuid == uuid
+        ).first()
+
+        if not row:
+            raise APIError("Customer not found", SC.NOT_FOUND)
+        return dict(customer_uuid=uuid, totals=serialize_totals(row[1]))
@@ -0,0 +1,108 @@
+import uuid
+from collections import Counter, defaultdict
+
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+
+from app.utilities import get_config, get_replica_db
+from schema import CustomerTotals, PortfolioTotals
+
+config = get_config()
+
+TOTALS = ('accounts', 'principal_owed', 'interest_owed', 'available_credit')
+
+
+def serialize_totals(totals):
+    # Sums of the totals are numeric, and None without any rows.
+    return {
+        total: int(getattr(totals, total, None) or 0) for total in TOTALS
+    }
+
+
+def portfolio_shard(account_uuid):
+    """ The portfolio totals shard the balances of an account add up in. """
+    return uuid.UUID(account_uuid).int % config.reporting.portfolio_shards
+
+
+class TotalsChanges:
+    """ The changes made to the customer and portfolio totals by the balance
+    writes of a transaction, applied at once before it commits. """
+
+    def __init__(self):
+        self.customers = defaultdict(Counter)
+        self.shards = defaultdict(Counter)
+
+    def add(self, account, before, after):
+        """ Adds the change of the balance of an account.
+
+        Args:
+            account (CreditAccount) - The account written to
+            before (Balance) - The balance of the account before the
+                               transaction, None if it opened the account,
+                               with at least the principal and interest owed
+            after (Balance) - The balance of the account after it
+        """
+        if before is None:
+            change = Counter(
+                accounts=1,
+                principal_owed=after.principal_owed,
+                interest_owed=after.interest_owed,
+                available_credit=after.available_credit)
+        else:
+            # The credit limit of an account doesn't change, what it owes
+            # is taken from its available credit.
+            principal_owed = after.principal_owed - before.principal_owed
+            interest_owed = after.interest_owed - before.interest_owed
+            change = Counter(
+                principal_owed=principal_owed,
+                interest_owed=interest_owed,
+                available_credit=-(principal_owed + interest_owed))
+
+        self.customers[account.customer_uuid].update(change)
+        self.shards[portfolio_shard(account.uuid)].update(change)
+
+    def apply(self, session=None):
+        """ Applies the changes with an upsert of the changed totals, in key
+        order, so transactions changing the same totals can't deadlock. """
+        session = session or current_app.db
+        for model, key, changes in (
+                (CustomerTotals, 'customer_uuid', self.customers),
+                (PortfolioTotals, 'shard', self.shards)):
+            rows = [
+                dict({total: change[total] for total in TOTALS},
+                     **{key: changed})
+                for changed, change in sorted(changes.items())
+                if any(change.values())
+            ]
+            if not rows:
+                continue
+
+            statement = insert(model.__table__)
+            session.execute(statement.on_conflict_do_update(
+                index_elements=[key],
+                set_={
+                    total: getattr(model.__table__.c, total) +
+                    getattr(statement.excluded, total)
+                    for total in TOTALS
+                }), rows)
+
+        self.customers.clear()
+        self.shards.clear()
+
+
+class ReportingController:
+
+    @staticmethod
+    def get_portfolio_totals():
+        """ Retrieves the totals of all accounts, adding up the fixed number
+        of portfolio totals shards.
+
+        Returns:
+            dict - The serialized totals
+        """
+        totals = get_replica_db().query(*(
+            func.sum(getattr(PortfolioTotals, total)).label(total)
+            for total in TOTALS
+        )).one()
+        return serialize_totals(totals)
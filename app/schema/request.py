@@ -1,11 +1,45 @@
 from datetime import datetime
-from marshmallow import fields, Schema
+from marshmallow import fields, Schema, validate
+
+from app.utilities import get_config
+
+config = get_config()
 
 
 class GetAccountRequest(Schema):
     time = fields.DateTime(missing=datetime.now())
 
 
+class GetHistoryRequest(Schema):
+    since = fields.DateTime()
+    until = fields.DateTime()
+
+
+class GetInterestRequest(Schema):
+    since = fields.DateTime()
+    until = fields.DateTime()
+
+
+class PageRequest(Schema):
+    cursor = fields.UUID()
+    limit = fields.Integer(
+        validate=validate.Range(min=1, max=config.listing.max_page_size))
+
+    class Meta:
+        # An invalid cursor left out would list the first page again,
+        # which clients paging through every row would never get past.
+        strict = True
+
+
+class ListCustomersRequest(PageRequest):
+    email = fields.String()
+    email_prefix = fields.String(load_from='emailPrefix')
+
+
+class ListAccountsRequest(PageRequest):
+    pass
+
+
 class AddCustomerRequest(Schema):
     email = fields.String(required=True)
     fname = fields.String(required=True)
@@ -24,9 +58,41 @@ class AddPaymentRequest(Schema):
     account_uuid = fields.String(required=True, load_from='accountUUID')
     time = fields.DateTime(default=datetime.now())
     amount = fields.Integer(required=True)
+    idempotency_key = fields.String(
+        load_from='Idempotency-Key', location='headers')
 
 
 class AddWithdrawalRequest(Schema):
     account_uuid = fields.String(required=True, load_from='accountUUID')
     time = fields.DateTime(default=datetime.now())
     amount = fields.Integer(required=True)
+    idempotency_key = fields.String(
+        load_from='Idempotency-Key', location='headers')
+
+
+class SimulateRequest(Schema):
+    payments = fields.List(
+        fields.Integer(validate=validate.Range(min=1)),
+        required=True,
+        validate=validate.Length(
+            min=1, max=config.simulation.max_payments))
+    periods = fields.Integer(
+        validate=validate.Range(min=1, max=config.simulation.max_periods))
+    time = fields.DateTime()
+    include_balances = fields.Boolean(load_from='includeBalances')
+
+    class Meta:
+        strict = True
+
+
+class TransactionRequest(Schema):
+    account_uuid = fields.String(required=True, load_from='accountUUID')
+    type = fields.String(
+        required=True, validate=validate.OneOf(['payment', 'withdrawal']))
+    time = fields.DateTime()
+    amount = fields.Integer(required=True)
+
+
+class BulkTransactionsRequest(Schema):
+    transactions = fields.Nested(
+        TransactionRequest, many=True, required=True)
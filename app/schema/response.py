@@ -1,18 +1,49 @@
 from marshmallow import fields, Schema
 
+from app.utilities import timed
 
-class CustomerResponse(Schema):
+
+class ResponseSchema(Schema):
+    """ Adds the time spent serializing responses to the request timings. """
+
+    def dump(self, *args, **kwargs):
+        with timed('serialization'):
+            return super().dump(*args, **kwargs)
+
+
+class CustomerResponse(ResponseSchema):
     uuid = fields.String()
     fname = fields.String()
     lname = fields.String()
     email = fields.String()
 
 
-class CustomerGetResponse(Schema):
+class CustomerGetResponse(ResponseSchema):
     customer = fields.Nested(CustomerResponse)
 
 
-class AccountResponse(Schema):
+class CustomerListResponse(ResponseSchema):
+    customers = fields.Nested(CustomerResponse, many=True)
+    next_cursor = fields.String(dump_to='nextCursor')
+
+
+class TotalsResponse(ResponseSchema):
+    accounts = fields.Integer()
+    principal_owed = fields.Integer(dump_to='principalOwed')
+    interest_owed = fields.Integer(dump_to='interestOwed')
+    available_credit = fields.Integer(dump_to='availableCredit')
+
+
+class CustomerTotalsGetResponse(ResponseSchema):
+    customer_uuid = fields.String(dump_to='customerUUID')
+    totals = fields.Nested(TotalsResponse)
+
+
+class PortfolioTotalsGetResponse(ResponseSchema):
+    totals = fields.Nested(TotalsResponse)
+
+
+class AccountResponse(ResponseSchema):
     uuid = fields.String()
     apr = fields.Integer()
     max_credit = fields.Integer(dump_to='maxCredit')
@@ -22,5 +53,69 @@ class AccountResponse(Schema):
     interest_owed = fields.Integer(dump_to='interestOwed')
 
 
-class AccountGetResponse(Schema):
+class AccountGetResponse(ResponseSchema):
     account = fields.Nested(AccountResponse)
+
+
+class AccountListResponse(ResponseSchema):
+    customer_uuid = fields.String(dump_to='customerUUID')
+    accounts = fields.Nested(AccountResponse, many=True)
+    next_cursor = fields.String(dump_to='nextCursor')
+
+
+class HistoryEntryResponse(ResponseSchema):
+    uuid = fields.String()
+    type = fields.String()
+    time = fields.DateTime()
+    amount = fields.Integer()
+    available_credit = fields.Integer(dump_to='availableCredit')
+    principal_owed = fields.Integer(dump_to='principalOwed')
+    interest_owed = fields.Integer(dump_to='interestOwed')
+
+
+class InterestAccrualResponse(ResponseSchema):
+    period_start = fields.DateTime(dump_to='periodStart')
+    period_end = fields.DateTime(dump_to='periodEnd')
+    principal_days = fields.Integer(dump_to='principalDays')
+    interest = fields.Integer()
+
+
+class InterestGetResponse(ResponseSchema):
+    accruals = fields.Nested(InterestAccrualResponse, many=True)
+    total_interest = fields.Integer(dump_to='totalInterest')
+
+
+class ProjectedBalanceResponse(ResponseSchema):
+    time = fields.DateTime()
+    interest = fields.Integer()
+    payment = fields.Integer()
+    principal_owed = fields.Integer(dump_to='principalOwed')
+    interest_owed = fields.Integer(dump_to='interestOwed')
+
+
+class SimulationResponse(ResponseSchema):
+    payment = fields.Integer()
+    payoff_periods = fields.Integer(dump_to='payoffPeriods')
+    payoff_time = fields.DateTime(dump_to='payoffTime')
+    total_interest = fields.Integer(dump_to='totalInterest')
+    total_paid = fields.Integer(dump_to='totalPaid')
+    principal_owed = fields.Integer(dump_to='principalOwed')
+    interest_owed = fields.Integer(dump_to='interestOwed')
+    balances = fields.Nested(ProjectedBalanceResponse, many=True)
+
+
+class SimulateResponse(ResponseSchema):
+    account = fields.Nested(AccountResponse)
+    simulations = fields.Nested(SimulationResponse, many=True)
+
+
+class TransactionResultResponse(ResponseSchema):
+    index = fields.Integer()
+    account_uuid = fields.String(dump_to='accountUUID')
+    status_code = fields.Integer(dump_to='statusCode')
+    message = fields.String()
+    account = fields.Nested(AccountResponse)
+
+
+class BulkTransactionsResponse(ResponseSchema):
+    results = fields.Nested(TransactionResultResponse, many=True)
@@ -1,11 +1,31 @@
+import uuid
+
 from flask import jsonify
 from werkzeug.exceptions import HTTPException
+from .cache import LRUCache, make_cache, RedisCache
 from .config import get_config
-from .db import get_db
+from .db import (
+    get_db, get_replica_db, keyset_page, like_prefix, mark_written, read_db,
+    written_recently)
+from .metrics import (
+    get_request_stats,
+    observe_request,
+    render_counter,
+    render_metrics,
+    render_pool_metrics,
+    start_request_stats,
+    timed)
+from .partitions import create_partitions
 from .payment_calc import(
+    BalanceHistory,
+    get_interest_calc_date,
     get_monthly_interests,
+    get_monthly_interests_batch,
+    get_period_accruals,
+    get_period_accruals_batch,
     make_payment,
-    make_withdrawal)
+    make_withdrawal,
+    project_payoff)
 
 
 class SC:
@@ -25,6 +45,16 @@ class SC:
     TIMEOUT = 504
 
 
+def valid_uuid(value):
+    """ Whether a value is a uuid, which Postgres would otherwise refuse to
+    compare to uuid columns with an error. """
+    try:
+        uuid.UUID(value)
+    except (AttributeError, TypeError, ValueError):
+        return False
+    return True
+
+
 def make_json_error(ex, **kwargs):
     response = jsonify(message=str(ex), **kwargs)
     response.status_code = (
@@ -0,0 +1,168 @@
+import logging
+import pickle
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache(settings):
+    """ Creates the cache described by a section of the config.
+
+    Args:
+        settings (dict) - The cache settings, with the following keys:
+            {
+                'backend': (str) - either 'memory', for a cache per
+                           process, or 'redis', for a cache shared by every
+                           process using the same Redis
+                'max_size': (int) - the maximum number of entries kept in
+                            memory
+                'ttl_seconds': (float) - the seconds an entry is kept for
+                'redis_url': (str) - the Redis to keep entries in
+                'key_prefix': (str) - prepended to the keys kept in Redis
+            }
+
+    Returns:
+        LRUCache or RedisCache - The cache
+    """
+    if settings['backend'] == 'redis':
+        import redis
+
+        return RedisCache(
+            redis.StrictRedis.from_url(settings['redis_url']),
+            settings['ttl_seconds'],
+            prefix=settings['key_prefix'],
+            errors=(redis.RedisError,))
+
+    return LRUCache(settings['max_size'], settings['ttl_seconds'])
+
+
+class LRUCache:
+    """ A size-bounded cache that evicts the least recently used entries
+    first, and entries once they are older than the time to live. Keeps
+    count of its hits and misses. Safe to share between threads. """
+
+    def __init__(self, max_size, ttl, clock=monotonic):
+        """
+        Args:
+            max_size (int) - The maximum number of entries kept
+            ttl (float) - The seconds an entry is kept for
+            clock (callable) - Returns the current time in seconds
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, valid=None):
+        """ Retrieves the value cached for a key.
+
+        Args:
+            key (hashable) - The key to retrieve
+            valid (callable) - Called with the cached value, the entry is
+                               removed if it returns False
+
+        Returns:
+            The cached value, or None if there is none
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None:
+                value, expires = entry
+                if expires > self.clock() and (valid is None or valid(value)):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, self.clock() + self.ttl)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, size=len(self))
+
+
+class RedisCache:
+    """ A cache kept in Redis, shared by every process using it. Has the
+    same interface as `LRUCache`, Redis evicts the entries once they are
+    older than the time to live.
+
+    Values are pickled, so only a trusted Redis should be used. Errors
+    talking to Redis are logged and handled as misses, so the cache being
+    unavailable doesn't fail the callers. """
+
+    def __init__(self, client, ttl, prefix='', errors=()):
+        """
+        Args:
+            client (redis.StrictRedis) - The Redis client, or anything with
+                                         the same get, set and delete
+            ttl (float) - The seconds an entry is kept for
+            prefix (str) - Prepended to the keys kept in Redis
+            errors (tuple) - The exceptions raised by the client on errors
+        """
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.errors = errors
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, valid=None):
+        try:
+            data = self.client.get(self.prefix + key)
+        except self.errors:
+            logger.exception('msg=cache get failed; key=%s', key)
+            data = None
+
+        if data is not None:
+            value = pickle.loads(data)
+            if valid is None or valid(value):
+                self.hits += 1
+                return value
+            self.delete(key)
+
+        self.misses += 1
+        return None
+
+    def set(self, key, value):
+        try:
+            self.client.set(
+                self.prefix + key, pickle.dumps(value),
+                px=int(self.ttl * 1000))
+        except self.errors:
+            logger.exception('msg=cache set failed; key=%s', key)
+
+    def delete(self, key):
+        try:
+            self.client.delete(self.prefix + key)
+        except self.errors:
+            logger.exception('msg=cache delete failed; key=%s', key)
+
+    @property
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses)
@@ -1,36 +1,192 @@
+from time import monotonic, perf_counter
+
 from flask import current_app
 from sqlalchemy import create_engine, event, exc
 from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import NullPool, QueuePool
 
+from app.utilities.cache import make_cache
 from app.utilities.config import get_config
+from app.utilities.metrics import (
+    after_cursor_execute, before_cursor_execute, handle_error, pool_timeouts,
+    pool_wait)
 
 config = get_config()
 
+# The uuids of the records written to in the last read_your_writes_seconds,
+# whose reads go to the primary until the replica has caught up.
+written_cache = make_cache(dict(
+    config.written_cache,
+    ttl_seconds=config.db.postgres.read_your_writes_seconds))
+
+
+class TimedQueuePool(QueuePool):
+    """ A QueuePool that records how long getting a connection out of it
+    takes, including waiting for one to be checked back in. """
+
+    def _do_get(self):
+        start = perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_timeouts.increment()
+            raise
+        finally:
+            pool_wait.observe(perf_counter() - start)
+
+
+def engine_options(settings):
+    """ The create_engine arguments for the database settings.
+
+    Args:
+        settings (dict) - The postgres section of the db config
+
+    Returns:
+        dict - The keyword arguments for create_engine
+    """
+    options = dict(echo=settings['echo'])
+
+    if settings['pgbouncer']:
+        # PgBouncer pools the connections, pooling them in every worker
+        # process as well would keep idle server connections checked out.
+        options['poolclass'] = NullPool
+        return options
+
+    pool = settings['pool']
+    options.update(
+        poolclass=TimedQueuePool,
+        pool_size=pool['size'],
+        max_overflow=pool['max_overflow'],
+        pool_timeout=pool['timeout_seconds'],
+        pool_recycle=pool['recycle_seconds'])
+
+    if settings['statement_timeout_ms']:
+        options['connect_args'] = dict(
+            options='-c statement_timeout={}'.format(
+                settings['statement_timeout_ms']))
+    return options
+
+
+def _create_session(url, settings):
+    engine = create_engine(url, **engine_options(settings))
+
+    # bind event handlers on the engine
+    if not settings.pgbouncer:
+        if settings.pool.pre_ping != 'never':
+            event.listen(engine, 'checkout', checkout)
+            event.listen(engine, 'checkin', checkin)
+    elif settings.statement_timeout_ms:
+        # PgBouncer doesn't pass connection options on to the server,
+        # and the server connection may change on every transaction.
+        event.listen(engine, 'begin', set_statement_timeout)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+    event.listen(engine, 'handle_error', handle_error)
+
+    return scoped_session(sessionmaker(
+        autocommit=False, autoflush=False, bind=engine))
+
 
 def get_db():
     if not hasattr(current_app, 'db'):
-        engine = create_engine(
-            config.db.postgres.url,
-            pool_size=5,
-            pool_timeout=60,
-            pool_recycle=3500,
-            echo=config.db.postgres.echo,
-        )
+        settings = config.db.postgres
+        current_app.db = _create_session(settings.url, settings)
+    return current_app.db()
 
-        # bind event handlers on the engine
-        event.listen(engine, 'checkout', checkout)
 
-        db_session = scoped_session(sessionmaker(
-            autocommit=False, autoflush=False, bind=engine))
+def get_replica_db():
+    """ The session for reads that may lag behind the latest writes. It is
+    bound to the read replica, or is the primary session if there is no
+    replica. """
+    if not hasattr(current_app, 'replica_db'):
+        settings = config.db.postgres
+        if settings.replica_url:
+            current_app.replica_db = _create_session(
+                settings.replica_url, settings)
+        else:
+            get_db()
+            current_app.replica_db = current_app.db
+    return current_app.replica_db()
 
-        current_app.db = db_session
-    return current_app.db()
+
+def like_prefix(prefix):
+    """ The LIKE pattern matching strings starting with a prefix, with the
+    wildcards in it escaped by backslashes, Postgres' default escape
+    character. """
+    for character in ('\\', '%', '_'):
+        prefix = prefix.replace(character, '\\' + character)
+    return prefix + '%'
+
+
+def keyset_page(query, key, cursor, limit):
+    """ Reads a page of rows sorted by a unique key, starting after the key
+    of the last row of the previous page. An index on the key seeks straight
+    to the page, instead of skipping the rows before it like an offset.
+
+    Args:
+        query (Query) - The query of the rows, filtered but not sorted
+        key (Column) - The unique column the rows are sorted by
+        cursor (str) - The key of the last row of the previous page, or None
+                       for the first page
+        limit (int) - The number of rows of a page
+
+    Returns:
+        tuple - The rows of the page, and whether there are rows after it
+    """
+    if cursor is not None:
+        query = query.filter(key > cursor)
+    # One row more than the page tells if there is a next page, without
+    # clients having to read an empty one.
+    rows = query.order_by(key).limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
+
+
+def mark_written(*uuids):
+    """ Records that records were written to, so their reads go to the
+    primary until the replica has caught up. """
+    if not config.db.postgres.replica_url:
+        return
+
+    for uuid in uuids:
+        written_cache.set(str(uuid), True)
+
+
+def written_recently(uuid):
+    """ Whether a record was written to recently enough for the replica to
+    not have the write yet. """
+    if not config.db.postgres.replica_url:
+        return False
+
+    return written_cache.get(str(uuid)) is not None
+
+
+def read_db(uuid):
+    """ The session to read a record from: the replica, unless the record
+    was written to recently. """
+    if written_recently(uuid):
+        return get_db()
+    return get_replica_db()
+
+
+def checkin(dbapi_connection, connection_record):
+    connection_record.info['checkin_time'] = monotonic()
 
 
 def checkout(dbapi_connection, connection_record, connection_proxy):
     """Do a ping query on the database to ensure connection is not closed.
     This is to ensure the connection is always fresh if was closed when it was
-    checked out from the pool."""
+    checked out from the pool.
+
+    With the `idle` pre_ping setting, only connections that sat in the pool
+    for longer than `ping_idle_seconds` are pinged."""
+    pool = config.db.postgres.pool
+    if pool.pre_ping == 'idle':
+        # The info of new connections is empty, they were just opened.
+        checkin_time = connection_record.info.get('checkin_time')
+        if (checkin_time is None or
+                monotonic() - checkin_time < pool.ping_idle_seconds):
+            return
 
     cursor = dbapi_connection.cursor()
     try:
@@ -40,3 +196,9 @@ def checkout(dbapi_connection, connection_record, connection_proxy):
         raise exc.DisconnectionError()
     finally:
         cursor.close()
+
+
+def set_statement_timeout(connection):
+    connection.execute(
+        "SET LOCAL statement_timeout = {:d}".format(
+            config.db.postgres.statement_timeout_ms))
@@ -0,0 +1,281 @@
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+
+from flask import g, has_app_context
+from sqlalchemy.pool import QueuePool
+
+# Upper bounds of the request duration buckets, in seconds.
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Upper bounds of the buckets for the number of queries made by a request.
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Upper bounds of the buckets for the time spent getting a connection out of
+# the pool, in seconds.
+POOL_WAIT_BUCKETS = (
+    0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60)
+
+
+class RequestStats:
+    """ The database queries made while handling a request and the time
+    spent in the timed sections of the code. """
+
+    def __init__(self):
+        self.query_count = 0
+        self.db_milliseconds = 0
+        self.slowest_query = None
+        self.slowest_query_milliseconds = 0
+        self.timings = defaultdict(float)
+        self._running = set()
+
+    def record_query(self, statement, milliseconds):
+        self.query_count += 1
+        self.db_milliseconds += milliseconds
+        if milliseconds > self.slowest_query_milliseconds:
+            self.slowest_query = statement
+            self.slowest_query_milliseconds = milliseconds
+
+
+def start_request_stats():
+    """ Starts collecting the stats of the current request. """
+    g.request_stats = RequestStats()
+    return g.request_stats
+
+
+def get_request_stats():
+    """ The stats of the current request, or None if they are not being
+    collected, as in CLI commands. """
+    if not has_app_context():
+        return None
+    return g.get('request_stats')
+
+
+@contextmanager
+def timed(section):
+    """ Adds the time spent in the block to a section of the current
+    request's timings. Sections nested in themselves are only timed once. """
+    stats = get_request_stats()
+    if stats is None or section in stats._running:
+        yield
+        return
+
+    stats._running.add(section)
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        stats.timings[section] += (perf_counter() - start) * 1000
+        stats._running.discard(section)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    conn.info.setdefault('query_start_time', []).append(
+        (context, perf_counter()))
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context,
+                         executemany):
+    _, start = conn.info['query_start_time'].pop()
+    milliseconds = (perf_counter() - start) * 1000
+
+    stats = get_request_stats()
+    if stats is not None:
+        stats.record_query(statement, milliseconds)
+
+
+def handle_error(exception_context):
+    """ Drops the start time of a statement that failed, which
+    after_cursor_execute is not called for. Errors raised before the
+    statement was executed or after it completed have none. """
+    conn = exception_context.connection
+    starts = conn.info.get('query_start_time') if conn is not None else None
+    if starts and starts[-1][0] is exception_context.execution_context:
+        starts.pop()
+
+
+class Histogram:
+    """ A Prometheus histogram, with a series per combination of label
+    values. Safe to share between threads. """
+
+    def __init__(self, name, description, labels, buckets):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[label]) for label in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [
+                    [0] * (len(self.buckets) + 1), 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self):
+        """ The histogram in the Prometheus text format. """
+        lines = [
+            '# HELP {} {}'.format(self.name, self.description),
+            '# TYPE {} histogram'.format(self.name),
+        ]
+        with self._lock:
+            series = sorted(
+                (key, list(counts), total)
+                for key, (counts, total) in self._series.items())
+
+        for key, counts, total in series:
+            labels = ['{}="{}"'.format(label, _escape(value))
+                      for label, value in zip(self.labels, key)]
+
+            cumulative = 0
+            for bucket, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(_sample(
+                    self.name + '_bucket',
+                    labels + ['le="{}"'.format(bucket)], cumulative))
+            lines.append(_sample(self.name + '_sum', labels, total))
+            lines.append(_sample(self.name + '_count', labels, cumulative))
+        return '\n'.join(lines) + '\n'
+
+
+class Counter:
+    """ A Prometheus counter without labels. Safe to share between
+    threads. """
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self.value = 0
+        self._lock = Lock()
+
+    def increment(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def render(self):
+        """ The counter in the Prometheus text format. """
+        return render_counter(self.name, self.description, self.value)
+
+
+def _sample(name, labels, value):
+    if labels:
+        return '{}{{{}}} {}'.format(name, ','.join(labels), value)
+    return '{} {}'.format(name, value)
+
+
+def _escape(value):
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+request_duration = Histogram(
+    'http_request_duration_seconds',
+    'Time spent handling requests.',
+    ('endpoint', 'method', 'status'),
+    DURATION_BUCKETS)
+
+request_db_duration = Histogram(
+    'http_request_db_duration_seconds',
+    'Time spent in database queries while handling requests.',
+    ('endpoint', 'method'),
+    DURATION_BUCKETS)
+
+request_db_queries = Histogram(
+    'http_request_db_queries',
+    'Number of database queries made while handling requests.',
+    ('endpoint', 'method'),
+    QUERY_COUNT_BUCKETS)
+
+request_section_duration = Histogram(
+    'http_request_section_duration_seconds',
+    'Time spent in sections of the code, such as calculating interest or '
+    'serializing responses, while handling requests.',
+    ('endpoint', 'method', 'section'),
+    DURATION_BUCKETS)
+
+pool_wait = Histogram(
+    'db_pool_wait_seconds',
+    'Time spent getting a connection out of the database pool, including '
+    'waiting for one to be checked back in.',
+    (),
+    POOL_WAIT_BUCKETS)
+
+pool_timeouts = Counter(
+    'db_pool_timeouts_total',
+    'Times no database connection was checked back in before timing out.')
+
+HISTOGRAMS = (
+    request_duration,
+    request_db_duration,
+    request_db_queries,
+    request_section_duration,
+    pool_wait,
+)
+
+
+def observe_request(endpoint, method, status_code, milliseconds, stats):
+    """ Records a handled request in the request histograms. """
+    request_duration.observe(
+        milliseconds / 1000, endpoint=endpoint, method=method,
+        status=status_code)
+    request_db_duration.observe(
+        stats.db_milliseconds / 1000, endpoint=endpoint, method=method)
+    request_db_queries.observe(
+        stats.query_count, endpoint=endpoint, method=method)
+    for section, section_milliseconds in stats.timings.items():
+        request_section_duration.observe(
+            section_milliseconds / 1000, endpoint=endpoint, method=method,
+            section=section)
+
+
+def render_counter(name, description, value):
+    """ A counter in the Prometheus text format. """
+    return '# HELP {0} {1}\n# TYPE {0} counter\n{0} {2}\n'.format(
+        name, description, value)
+
+
+def render_gauge(name, description, value):
+    """ A gauge in the Prometheus text format. """
+    return '# HELP {0} {1}\n# TYPE {0} gauge\n{0} {2}\n'.format(
+        name, description, value)
+
+
+def render_pool_metrics(pool):
+    """ The usage of a database connection pool in the Prometheus text
+    format. Pools that don't keep connections, as when connecting through
+    PgBouncer, have none. """
+    if not isinstance(pool, QueuePool):
+        return ''
+
+    max_connections = pool.size() + pool._max_overflow
+    return ''.join([
+        render_gauge(
+            'db_pool_connections_checked_out',
+            'Database connections in use.',
+            pool.checkedout()),
+        render_gauge(
+            'db_pool_connections_idle',
+            'Database connections open in the pool, waiting to be used.',
+            pool.checkedin()),
+        render_gauge(
+            'db_pool_connections_max',
+            'Database connections the pool opens at most.',
+            max_connections),
+        render_gauge(
+            'db_pool_saturation',
+            'Share of the maximum database connections in use.',
+            pool.checkedout() / max_connections),
+        pool_timeouts.render(),
+    ])
+
+
+def render_metrics():
+    """ Every histogram in the Prometheus text format. """
+    return ''.join(histogram.render() for histogram in HISTOGRAMS)
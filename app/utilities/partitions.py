@@ -0,0 +1,75 @@
+from sqlalchemy import text
+
+# Tables range partitioned by their time column, with a partition per year
+# and a default partition for the times outside of them.
+PARTITIONED_TABLES = ('balance', 'payment', 'withdrawal')
+
+
+def partition_name(table, year):
+    return '{}_y{}'.format(table, year)
+
+
+def default_partition_name(table):
+    return '{}_default'.format(table)
+
+
+def create_partitions(session, first_year, last_year):
+    """ Creates the yearly partitions of the partitioned tables that don't
+    exist yet. Rows of a new partition's year that were written to the
+    default partition are moved into it, with the table locked.
+
+    Args:
+        session (Session) - The session the partitions are created in,
+                            which is left for the caller to commit
+        first_year (int) - The first year to create partitions for
+        last_year (int) - The last year to create partitions for
+
+    Returns:
+        list(str) - The names of the partitions created
+    """
+    created = []
+    for table in PARTITIONED_TABLES:
+        default = default_partition_name(table)
+        for year in range(first_year, last_year + 1):
+            name = partition_name(table, year)
+            if session.execute(
+                    text("SELECT to_regclass(:name)"),
+                    dict(name=name)).scalar() is not None:
+                continue
+
+            bounds = dict(
+                start='{}-01-01'.format(year),
+                end='{}-01-01'.format(year + 1))
+
+            create = text(
+                "CREATE TABLE {} PARTITION OF {} FOR VALUES "
+                "FROM ('{start}') TO ('{end}')".format(name, table, **bounds))
+
+            # A partition can't be created while the default partition holds
+            # rows of its range. Those are moved into it with the default
+            # partition detached, which locks the table out of reads and
+            # writes until the caller commits. Partitions created ahead of
+            # their year don't need it.
+            if not session.execute(text(
+                    'SELECT EXISTS (SELECT 1 FROM {} '
+                    'WHERE time >= :start AND time < :end)'.format(default)),
+                    bounds).scalar():
+                session.execute(create)
+                created.append(name)
+                continue
+
+            session.execute(text(
+                'ALTER TABLE {} DETACH PARTITION {}'.format(table, default)))
+            session.execute(create)
+            session.execute(text(
+                'WITH moved AS ('
+                '    DELETE FROM {default}'
+                '    WHERE time >= :start AND time < :end RETURNING *'
+                ') INSERT INTO {table} SELECT * FROM moved'.format(
+                    default=default, table=table)), bounds)
+            session.execute(text(
+                'ALTER TABLE {} ATTACH PARTITION {} DEFAULT'.format(
+                    table, default)))
+            created.append(name)
+
+    return created
@@ -1,4 +1,105 @@
-from datetime import timedelta
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+import numpy as np
+
+_MICROSECONDS_PER_DAY = 24 * 60 * 60 * 10 ** 6
+
+_EPOCH = datetime(year=1970, month=1, day=1)
+_MICROSECOND = timedelta(microseconds=1)
+
+# Largest magnitude below which every integer is exactly representable as a
+# float, so numpy's float division rounds exactly like python's int division.
+_MAX_EXACT_FLOAT = 2 ** 53
+
+
+def _to_microseconds(time):
+    return (time - _EPOCH) // _MICROSECOND
+
+
+def _from_microseconds(microseconds):
+    return _EPOCH + timedelta(microseconds=microseconds)
+
+
+class BalanceHistory:
+    """ A balance history kept in two arrays of 64 bit integers: the time
+    each balance was recorded, in microseconds since the epoch, and the
+    principal owed. Takes a fraction of the memory of a list of dicts and is
+    read by the interest calculations without creating any objects per
+    balance.
+
+    Times keep their time of day, as interest accrues for the whole days
+    between balances. Balances are sorted by time ascending, the first one
+    being the opening balance of the account.
+    """
+
+    __slots__ = ('times', 'principals_owed')
+
+    def __init__(self, times=(), principals_owed=()):
+        """
+        Args:
+            times (iterable(int)) - The time each balance was recorded, in
+                                    microseconds since the epoch
+            principals_owed (iterable(int)) - The principal owed for each
+                                              balance
+        """
+        self.times = array('q', times)
+        self.principals_owed = array('q', principals_owed)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """ Creates a balance history from (time, principal_owed) rows, such
+        as the ones of a query for those two columns.
+
+        Args:
+            rows (iterable(tuple)) - The (datetime, int) rows, sorted by time
+                                     ascending
+
+        Returns:
+            BalanceHistory - The balance history
+        """
+        history = cls()
+        for time, principal_owed in rows:
+            history.append(time, principal_owed)
+        return history
+
+    @classmethod
+    def from_dicts(cls, balance_history):
+        """ Creates a balance history from a list of dictionaries with the
+        'time' and 'principal_owed' keys, sorted by time ascending. """
+        return cls.from_rows(
+            (balance['time'], balance['principal_owed'])
+            for balance in balance_history)
+
+    def append(self, time, principal_owed):
+        """ Adds a balance recorded after every other balance. """
+        self.times.append(_to_microseconds(time))
+        self.principals_owed.append(principal_owed)
+
+    def insert(self, time, principal_owed):
+        """ Adds a balance, keeping the history sorted by time. A balance
+        recorded at the same time as others is added after them. """
+        time = _to_microseconds(time)
+        index = bisect_right(self.times, time)
+        self.times.insert(index, time)
+        self.principals_owed.insert(index, principal_owed)
+
+    def __len__(self):
+        return len(self.times)
+
+    def __iter__(self):
+        """ Yields the (time, principal_owed) of each balance. """
+        for time, principal_owed in zip(self.times, self.principals_owed):
+            yield _from_microseconds(time), principal_owed
+
+    @property
+    def first_time(self):
+        return _from_microseconds(self.times[0])
+
+    @property
+    def last_principal_owed(self):
+        return self.principals_owed[-1]
 
 
 def make_payment(principal_owed, interest_owed, payment):
@@ -61,6 +162,36 @@ def _get_interest(principal_owed, number_of_days, apr):
     return round(principal_owed * number_of_days * apr / 36500)
 
 
+def _get_interests(principal_owed, number_of_days, apr):
+    """ Vectorized version of `_get_interest`. Rounds exactly like the scalar
+    version, falling back to python integers for the (rare) products that
+    are too large to be divided exactly as floats.
+
+    Args:
+        principal_owed (array(int)) - The principal balances
+        number_of_days (array(int)) - The number of days each balance was held
+        apr (array(int)) - The APR for each balance
+
+    Returns:
+        array(int) - The interest for each balance
+    """
+    principal_owed, number_of_days, apr = np.broadcast_arrays(
+        np.asarray(principal_owed, dtype=np.int64),
+        np.asarray(number_of_days, dtype=np.int64),
+        np.asarray(apr, dtype=np.int64))
+
+    estimate = (principal_owed.astype(np.float64) * number_of_days) * apr
+    inexact = np.abs(estimate) >= _MAX_EXACT_FLOAT
+
+    product = np.where(inexact, 0, principal_owed * number_of_days * apr)
+    interests = np.rint(product / 36500).astype(np.int64)
+
+    for i in np.flatnonzero(inexact):
+        interests[i] = _get_interest(
+            int(principal_owed[i]), int(number_of_days[i]), int(apr[i]))
+    return interests
+
+
 def _calc_interest_over_balances(apr, balance_history):
     """ Calculates interest over an arbitrary balance history list.
 
@@ -87,6 +218,126 @@ def _calc_interest_over_balances(apr, balance_history):
     return interest
 
 
+def get_interest_calc_date(start_date, pay_period, end_date):
+    """ Calculates the end of the last pay period that closed on or before
+    the end date, which is the last eligible day to calculate interest.
+
+    Args:
+        start_date (datetime) - The time the credit line was started
+        pay_period (int) - The number of days per pay period
+        end_date (datetime) - The time to stop calculating interest
+
+    Returns:
+        datetime - The last eligible day to calculate interest. Interest is
+                   only owed if this is later than the start date.
+    """
+    days_since_account_opened = (end_date - start_date).days
+    days_since_last_pay_period = days_since_account_opened % pay_period
+
+    return end_date - timedelta(days=days_since_last_pay_period)
+
+
+def _accrue_period(times, principals_owed, apr, period_start, period_end):
+    """ Calculates the principal-day sum and interest of a single pay period
+    in a single pass, starting from the principal owed when it started.
+
+    Returns:
+        (int, int) - The principal-day sum and interest of the pay period
+    """
+    first = bisect_left(times, period_start)
+    last = bisect_right(times, period_end)
+
+    principal_days = 0
+    interest_amount = 0
+    time = period_start
+    principal_owed = principals_owed[first - 1] if first else 0
+    for i in range(first, last):
+        number_of_days = (times[i] - time) // _MICROSECONDS_PER_DAY
+        principal_days += principal_owed * number_of_days
+        interest_amount += _get_interest(principal_owed, number_of_days, apr)
+        time = times[i]
+        principal_owed = principals_owed[i]
+
+    number_of_days = (period_end - time) // _MICROSECONDS_PER_DAY
+    principal_days += principal_owed * number_of_days
+    interest_amount += _get_interest(principal_owed, number_of_days, apr)
+    return principal_days, interest_amount
+
+
+def get_period_accruals(apr, pay_period, end_date, balance_history,
+                        since=None):
+    """ Calculates the principal-day sum and the interest of each pay period
+    closing on or before the end date, from the last pay period containing
+    recorded balances onwards.
+
+    Args:
+        apr (int) - The APR for the credit line.
+        pay_period (int) - The number of days per pay period
+        end_date (datetime) - The time to stop calculating interest
+        balance_history (BalanceHistory or list(dict)) - The balance
+            history, as for `get_monthly_interests`
+        since (datetime) - Start from the pay period containing this time
+                           instead, if it is earlier
+
+    Returns:
+        list[(datetime, int, int)] - The end, principal-day sum and interest
+                                     of each pay period, sorted by time
+                                     ascending.
+    """
+    if not isinstance(balance_history, BalanceHistory):
+        balance_history = BalanceHistory.from_dicts(balance_history)
+
+    times = balance_history.times
+    principals_owed = balance_history.principals_owed
+    first_date = times[0]
+    last_date = times[-1]
+
+    # get the last eligible day to calculate interest.
+    end_date = _to_microseconds(end_date)
+    days_since_account_opened = (
+        (end_date - first_date) // _MICROSECONDS_PER_DAY)
+    interest_calc_date = end_date - (
+        days_since_account_opened % pay_period) * _MICROSECONDS_PER_DAY
+
+    if interest_calc_date <= first_date:
+        return []
+
+    period = pay_period * _MICROSECONDS_PER_DAY
+
+    # Interest is calculated over the balances for the last pay period
+    # containing recorded balances (or following them, if balances were
+    # recorded after the last eligible day). The pay periods closing after
+    # it are idle, without any balances.
+    idle_periods = max((interest_calc_date - last_date - 1) // period, 0)
+
+    last_period_end = interest_calc_date - idle_periods * period
+    period_end = last_period_end
+    if since is not None:
+        period_end = min(period_end, interest_calc_date - (
+            (interest_calc_date - _to_microseconds(since) - 1) // period
+        ) * period)
+
+    accruals = []
+    while period_end <= last_period_end:
+        principal_days, interest_amount = _accrue_period(
+            times, principals_owed, apr, period_end - period, period_end)
+        accruals.append(
+            (_from_microseconds(period_end), principal_days, interest_amount))
+        period_end += period
+
+    # Idle pay periods all accrue the same interest on the last principal
+    # owed.
+    idle_principal_days = principals_owed[-1] * pay_period
+    idle_interest = _get_interest(principals_owed[-1], pay_period, apr)
+
+    accruals.extend(
+        (_from_microseconds(period_end + i * period), idle_principal_days,
+         idle_interest)
+        for i in range(idle_periods)
+    )
+    return accruals
+
+
 def get_monthly_interests(apr, pay_period, end_date, balance_history):
     """ Calculates the interests owed per month since the last balance was
     calculated
@@ -94,10 +345,9 @@ def get_monthly_interests(apr, pay_period, end_date, balance_history):
     Args:
         apr (int) - The APR for the credit line.
         pay_period (int) - The number of days per pay period
-        credit_start_date (datetime) - THe time the credit line was started
         end_date (datetime) - The time to stop calculating interest
-        balance_history (list(dict)) - A list of dictionaries containing the
-                                       following keys:
+        balance_history (BalanceHistory or list(dict)) - The balance history,
+            or a list of dictionaries containing the following keys:
             {
                 'time': (datetime) - the time the balance was recorded
                 'principal_owed': (int) - the amount of principal owed
@@ -109,74 +359,235 @@ def get_monthly_interests(apr, pay_period, end_date, balance_history):
         list[(int, time)] - A list of tuples containing time and interest
                             amounts since the last balance was calculated.
     """
+    # The interest of each pay period adds up with the interest of the pay
+    # periods before it.
     interests = []
+    interest_owed = 0
+    for period_end, _, interest_amount in get_period_accruals(
+            apr, pay_period, end_date, balance_history):
+        interest_owed += interest_amount
+        interests.append([interest_owed, period_end])
+    return interests
+
+
+def get_period_accruals_batch(
+        pay_period, end_date, account_ids, times, principals_owed, aprs):
+    """ Calculates the principal-day sum and interest of each pay period for
+    many accounts at once. This is a vectorized version of
+    `get_period_accruals` that works on columnar balance histories, where
+    each row of the input arrays is one recorded balance. The results are
+    identical to calling `get_period_accruals` on each account's history
+    separately.
+
+    Like `get_period_accruals`, this relies on pay periods without any
+    recorded balances all accruing the same interest on the last principal
+    owed, so only the most recent pay period containing balances needs its
+    interest calculated over the history.
 
-    first_balance = balance_history[0]
-    last_balance = balance_history[-1]
-    first_date = first_balance['time']
+    Args:
+        pay_period (int) - The number of days per pay period
+        end_date (datetime) - The time to stop calculating interest
+        account_ids (array) - The account each balance belongs to
+        times (array(datetime)) - The time each balance was recorded, as
+                                  datetimes or microseconds since the epoch
+        principals_owed (array(int)) - The principal owed for each balance
+        aprs (array(int)) - The APR of the account each balance belongs to
 
-    # get the last eligible day to calculate interest.
-    days_since_account_opened = (end_date - first_date).days
-    days_since_last_pay_period = days_since_account_opened % pay_period
+        Rows of different accounts may be interleaved, but the rows of each
+        account must follow the same rules as `get_monthly_interests`: the
+        first one is the opening balance of the account and they are sorted
+        by time ascending. The APR of an account is taken from its first row.
 
-    interest_calc_date = end_date - timedelta(days=days_since_last_pay_period)
-
-    # keep track of the last principal owed
-    principal_owed = last_balance['principal_owed']
-
-    balance_index = len(balance_history) - 1
-    found_balances = False
-    while interest_calc_date > first_date:
-        previous_pay_date = interest_calc_date - timedelta(days=pay_period)
-
-        # Create an end date for the balance calculator, principal doesn't
-        # matter as it won't be factored in the interest calculation
-        balances = [{
-            'time': interest_calc_date,
-            'principal_owed': 0
-        }]
-
-        # Loop through all recorded balances that are within this pay period
-        # and append them to the balances list
-        while (balance_history[balance_index]['time'] >= previous_pay_date and
-               balance_index >= 0):
-
-            if balance_history[balance_index]['time'] <= interest_calc_date:
-                balances.append(balance_history[balance_index])
-
-            balance_index -= 1
-            found_balances = True
-
-        # Append a new balance for the calculation at the start of the pay
-        # period. Set the principal owed to the previous balance's principal
-        # owed or zero if we've exhausted the list.
-        if balance_index >= 0:
-            principal_owed = balance_history[balance_index]['principal_owed']
-        else:
-            principal_owed = 0
-
-        balances.append({
-            'time': previous_pay_date,
-            'principal_owed': principal_owed
-        })
-
-        # Since going backwards over the history, balances will be in reverse
-        # order, so need to reverse again for the interest calculation
-        interest_amount = _calc_interest_over_balances(apr, balances[::-1])
-
-        # If we have calculated interest for later pay periods, we need
-        # to make sure we add it to the new interest balances.
-        for interest in interests:
-            interest[0] += interest_amount
-
-        interests.append([interest_amount, interest_calc_date])
-
-        if found_balances:
-            # If we've found balances that means interest was already
-            # calculated for those periods and we should stop calculating.
+    Returns:
+        (array, array(datetime64), array(int), array(int)) - A tuple of
+            arrays containing the account id, end, principal-day sum and
+            interest of each pay period, sorted by account and then by time
+            ascending.
+    """
+    account_ids = np.asarray(account_ids)
+    if not len(account_ids):
+        return (account_ids,
+                np.empty(0, dtype='datetime64[us]'),
+                np.empty(0, dtype=np.int64),
+                np.empty(0, dtype=np.int64))
+
+    # Group the rows by account, keeping each account's rows in order.
+    order = np.argsort(account_ids, kind='mergesort')
+    account_ids = account_ids[order]
+    times = np.asarray(
+        times, dtype='datetime64[us]')[order].astype(np.int64)
+    principals_owed = np.asarray(principals_owed, dtype=np.int64)[order]
+    aprs = np.asarray(aprs, dtype=np.int64)[order]
+
+    total_rows = len(account_ids)
+    starts = np.flatnonzero(
+        np.concatenate(([True], account_ids[1:] != account_ids[:-1])))
+    ends = np.append(starts[1:], total_rows)
+    counts = ends - starts
+
+    account_aprs = aprs[starts]
+    first_dates = times[starts]
+    last_dates = times[ends - 1]
+    last_principals = principals_owed[ends - 1]
+
+    # get the last eligible day to calculate interest for each account.
+    end_date = np.datetime64(end_date, 'us').astype(np.int64)
+    period = pay_period * _MICROSECONDS_PER_DAY
+    days_since_account_opened = (
+        (end_date - first_dates) // _MICROSECONDS_PER_DAY)
+    interest_calc_dates = end_date - (
+        days_since_account_opened % pay_period) * _MICROSECONDS_PER_DAY
+    has_interests = interest_calc_dates > first_dates
+
+    # Pay periods that end after the last recorded balance are idle. Find the
+    # most recent pay period that contains balances, which is the last one
+    # whose interest needs to be calculated over the balance history.
+    idle_periods = np.maximum(
+        (interest_calc_dates - last_dates - 1) // period, 0)
+    period_ends = interest_calc_dates - idle_periods * period
+    period_starts = period_ends - period
+
+    row_period_starts = np.repeat(period_starts, counts)
+    row_period_ends = np.repeat(period_ends, counts)
+
+    # Every balance from the start of that pay period onwards is consumed,
+    # the balance right before them sets the principal the period opens with.
+    consumed = times >= row_period_starts
+    first_consumed = ends - np.add.reduceat(consumed.astype(np.int64), starts)
+    opening_principals = np.where(
+        first_consumed > starts,
+        principals_owed[np.maximum(first_consumed - 1, 0)],
+        0)
+
+    # Each balance within the pay period accrues interest until the next
+    # balance, or until the end of the pay period for the last one.
+    in_period = consumed & (times <= row_period_ends)
+    is_last_row = np.zeros(total_rows, dtype=bool)
+    is_last_row[ends - 1] = True
+    next_in_period = np.append(in_period[1:], False) & ~is_last_row
+    segment_ends = np.where(
+        next_in_period, np.append(times[1:], 0), row_period_ends)
+
+    rows = np.flatnonzero(in_period)
+    row_days = (segment_ends[rows] - times[rows]) // _MICROSECONDS_PER_DAY
+    row_principal_days = np.zeros(total_rows, dtype=np.int64)
+    row_principal_days[rows] = principals_owed[rows] * row_days
+    row_interests = np.zeros(total_rows, dtype=np.int64)
+    row_interests[rows] = _get_interests(
+        principals_owed[rows], row_days, aprs[rows])
+
+    first_in_period = np.minimum(first_consumed, total_rows - 1)
+    opening_ends = np.where(
+        (first_consumed < ends) & in_period[first_in_period],
+        times[first_in_period],
+        period_ends)
+    opening_days = (opening_ends - period_starts) // _MICROSECONDS_PER_DAY
+    period_principal_days = np.add.reduceat(row_principal_days, starts) + (
+        opening_principals * opening_days)
+    period_interests = np.add.reduceat(row_interests, starts) + _get_interests(
+        opening_principals, opening_days, account_aprs)
+    idle_principal_days = last_principals * pay_period
+    idle_interests = _get_interests(
+        last_principals, np.full(len(starts), pay_period), account_aprs)
+
+    # The pay period with balances is followed by the idle ones.
+    accounts = np.flatnonzero(has_interests)
+    interest_counts = idle_periods[accounts] + 1
+    offsets = np.arange(interest_counts.sum()) - np.repeat(
+        np.cumsum(interest_counts) - interest_counts, interest_counts)
+    idle = offsets > 0
+
+    accrual_account_ids = np.repeat(
+        account_ids[starts[accounts]], interest_counts)
+    accrual_ends = (
+        np.repeat(period_ends[accounts], interest_counts) + offsets * period
+    ).astype('datetime64[us]')
+    principal_days = np.where(
+        idle,
+        np.repeat(idle_principal_days[accounts], interest_counts),
+        np.repeat(period_principal_days[accounts], interest_counts))
+    interests = np.where(
+        idle,
+        np.repeat(idle_interests[accounts], interest_counts),
+        np.repeat(period_interests[accounts], interest_counts))
+
+    return accrual_account_ids, accrual_ends, principal_days, interests
+
+
+def get_monthly_interests_batch(
+        pay_period, end_date, account_ids, times, principals_owed, aprs):
+    """ Calculates the interests owed per month for many accounts at once.
+    This is a vectorized version of `get_monthly_interests`, taking the same
+    arguments as `get_period_accruals_batch`.
+
+    Returns:
+        (array, array(int), array(datetime64)) - A tuple of arrays containing
+            the account id, interest amount and time of each calculated
+            interest, sorted by account and then by time ascending.
+    """
+    account_ids, ends, _, interests = get_period_accruals_batch(
+        pay_period, end_date, account_ids, times, principals_owed, aprs)
+
+    # Interest owed carries over into each of the following pay periods.
+    totals = np.cumsum(interests)
+    if len(account_ids):
+        starts = np.flatnonzero(
+            np.concatenate(([True], account_ids[1:] != account_ids[:-1])))
+        counts = np.diff(np.append(starts, len(account_ids)))
+        totals -= np.repeat(totals[starts] - interests[starts], counts)
+
+    return account_ids, totals, ends
+
+
+def project_payoff(principal_owed, interest_owed, apr, pay_period, payments,
+                   periods):
+    """ Projects the balance of an account over the pay periods to come, for
+    several payment amounts at once. Every pay period accrues interest on the
+    principal owed like `_get_interest`, which adds to the interest owed, and
+    closes with a payment applied like `make_payment`, reduced to the balance
+    owed when it is larger.
+
+    Each pay period depends on the one before it, so the pay periods are
+    projected one after the other, each for every payment amount at once,
+    until every payment amount has paid the balance off.
+
+    Args:
+        principal_owed (int) - The current principal balance
+        interest_owed (int) - The current interest balance
+        apr (int) - The APR for the credit line
+        pay_period (int) - The number of days per pay period
+        payments (array(int)) - The payment made at the close of every pay
+                                period, for each projection
+        periods (int) - The most pay periods to project
+
+    Returns:
+        (array(int), array(int), array(int), array(int)) - A tuple of arrays
+            with a row per projected pay period and a column per payment
+            amount, containing the interest accrued, payment made, principal
+            owed and interest owed at the close of each pay period
+    """
+    payments = np.asarray(payments, dtype=np.int64)
+    principals = np.full(len(payments), principal_owed, dtype=np.int64)
+    interests_owed = np.full(len(payments), interest_owed, dtype=np.int64)
+    days = np.full(len(payments), pay_period, dtype=np.int64)
+    aprs = np.full(len(payments), apr, dtype=np.int64)
+
+    projection = []
+    for _ in range(periods):
+        if not (principals + interests_owed).any():
             break
 
-        # Set the new interest calc date.
-        interest_calc_date = previous_pay_date
+        interests = _get_interests(principals, days, aprs)
+        interests_owed = interests_owed + interests
+
+        # Payments reduce the interest owed before the principal owed.
+        paid = np.minimum(payments, principals + interests_owed)
+        paid_interest = np.minimum(paid, interests_owed)
+        interests_owed = interests_owed - paid_interest
+        principals = principals - (paid - paid_interest)
+        projection.append((interests, paid, principals, interests_owed))
 
-    return interests[::-1]
+    if not projection:
+        empty = np.empty((0, len(payments)), dtype=np.int64)
+        return empty, empty, empty, empty
+    return tuple(np.stack(column) for column in zip(*projection))
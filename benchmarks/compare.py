@@ -0,0 +1,87 @@
+"""Compares benchmark results against a baseline and exits with an error if
+any benchmark got slower than the threshold allows.
+
+Both files hold the JSON lines written by the benchmarks. Results are
+matched by benchmark name and parameters, and compared by their median.
+Each comparison is written to stdout as a line of JSON.
+
+Usage:
+    python -m benchmarks.compare BASELINE RESULTS [--threshold PERCENT]
+"""
+import argparse
+import json
+import sys
+
+from benchmarks.utils import report
+
+METRIC = 'p50_ms'
+
+# Benchmarks taking less than this are too noisy to compare, they are only
+# reported as regressions when they also got this much slower.
+MIN_DIFFERENCE_MS = 0.05
+
+
+def _result_key(result):
+    return tuple(sorted(
+        (name, value) for name, value in result.items()
+        if not name.endswith('_ms') and name != 'repeat'))
+
+
+def load_results(path):
+    with open(path) as results_file:
+        return {
+            _result_key(result): result
+            for result in map(json.loads, results_file)
+        }
+
+
+def compare(baseline, results, threshold):
+    """ Compares benchmark results against a baseline.
+
+    Args:
+        baseline (dict) - The baseline results, by result key
+        results (dict) - The new results, by result key
+        threshold (float) - The percent a benchmark may slow down by
+
+    Returns:
+        int - The number of benchmarks that regressed
+    """
+    regressions = 0
+    for key, result in sorted(results.items()):
+        if key not in baseline:
+            continue
+
+        before = baseline[key][METRIC]
+        after = result[METRIC]
+        change = (after - before) / before * 100 if before else 0
+        regressed = (change > threshold and
+                     after - before > MIN_DIFFERENCE_MS)
+        regressions += regressed
+
+        report(
+            'compare',
+            result=dict(key),
+            before_ms=before,
+            after_ms=after,
+            change_percent=round(change, 1),
+            regressed=regressed)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('baseline')
+    parser.add_argument('results')
+    parser.add_argument('--threshold', type=float, default=20,
+                        help='Percent a benchmark may slow down by')
+    args = parser.parse_args()
+
+    regressions = compare(
+        load_results(args.baseline), load_results(args.results),
+        args.threshold)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
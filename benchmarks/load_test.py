@@ -0,0 +1,266 @@
+"""Load tests the API with a mix of account reads, payments and withdrawals
+sent at a target rate, and reports the latency percentiles and throughput
+of each endpoint.
+
+Customers and accounts are created through the API first. Requests are
+then sent on a fixed schedule whether or not earlier ones have completed,
+and latencies are measured from the time each request was scheduled for,
+so a server falling behind shows up in the percentiles instead of slowing
+the load down.
+
+With `--start`, the API is started with gunicorn for the duration of the
+test, which lets the number of workers be sized by running the test with
+different `--workers`. With `--asgi` as well, the ASGI app is started with
+uvicorn workers instead, to compare both serving modes.
+
+Usage:
+    python -m benchmarks.load_test [--url URL |
+                                    --start [--workers N] [--asgi]]
+                                   [--rps N] [--duration SECONDS]
+"""
+import argparse
+import random
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from time import perf_counter
+
+import requests
+
+from benchmarks.utils import percentile, report
+
+DEFAULT_URL = 'http://api:5001'
+START_PORT = 5101
+
+# The share of each kind of request in the traffic.
+DEFAULT_MIX = 'get_account=70,payment=15,withdrawal=15'
+
+MAX_CREDIT = 10 ** 12
+OPENING_WITHDRAWAL = 10 ** 11
+AMOUNTS = (10 ** 6, 10 ** 8)
+
+_sessions = threading.local()
+
+
+def _session():
+    if not hasattr(_sessions, 'session'):
+        _sessions.session = requests.Session()
+    return _sessions.session
+
+
+def _now():
+    return datetime.now().isoformat()
+
+
+def get_account(url, account_uuid):
+    return _session().get(
+        url + '/accounts/' + account_uuid, params={'time': _now()})
+
+
+def payment(url, account_uuid):
+    return _session().post(url + '/accounts/payment', data={
+        'accountUUID': account_uuid,
+        'amount': random.randint(*AMOUNTS),
+        'time': _now()
+    })
+
+
+def withdrawal(url, account_uuid):
+    return _session().post(url + '/accounts/withdrawal', data={
+        'accountUUID': account_uuid,
+        'amount': random.randint(*AMOUNTS),
+        'time': _now()
+    })
+
+
+ENDPOINTS = {
+    'get_account': get_account,
+    'payment': payment,
+    'withdrawal': withdrawal,
+}
+
+
+def parse_mix(mix):
+    """ Parses a traffic mix such as 'get_account=70,payment=30' into the
+    endpoints and their weights. """
+    weights = dict(
+        (name, float(weight))
+        for name, weight in (part.split('=') for part in mix.split(',')))
+
+    unknown = set(weights) - set(ENDPOINTS)
+    if unknown:
+        raise ValueError('Unknown endpoints: ' + ', '.join(sorted(unknown)))
+    return list(weights), list(weights.values())
+
+
+def create_account(url, index):
+    """ Creates a customer and an account with a balance owed, so payments
+    and withdrawals can be made on it. """
+    session = _session()
+    customer = session.post(url + '/customer/', data={
+        'fname': 'Load',
+        'lname': 'Test',
+        'email': 'load{}@example.com'.format(index)
+    })
+    customer.raise_for_status()
+
+    account = session.post(url + '/accounts/', data={
+        'customerUUID': customer.json()['customer']['uuid'],
+        'apr': 35,
+        'maxCredit': MAX_CREDIT,
+        'timeOpened': _now()
+    })
+    account.raise_for_status()
+    account_uuid = account.json()['account']['uuid']
+
+    session.post(url + '/accounts/withdrawal', data={
+        'accountUUID': account_uuid,
+        'amount': OPENING_WITHDRAWAL,
+        'time': _now()
+    }).raise_for_status()
+    return account_uuid
+
+
+def run_load(url, account_uuids, endpoints, weights, rps, duration,
+             concurrency):
+    """ Sends requests at the target rate for the duration of the test.
+
+    Returns:
+        dict - The (latency in milliseconds, succeeded) of every request, by
+               endpoint
+    """
+    results = defaultdict(list)
+    lock = threading.Lock()
+
+    def send(endpoint, account_uuid, scheduled):
+        try:
+            succeeded = ENDPOINTS[endpoint](url, account_uuid).ok
+        except requests.RequestException:
+            succeeded = False
+        latency = (perf_counter() - scheduled) * 1000
+        with lock:
+            results[endpoint].append((latency, succeeded))
+
+    total = int(rps * duration)
+    with ThreadPoolExecutor(concurrency) as executor:
+        start = perf_counter()
+        for index in range(total):
+            scheduled = start + index / rps
+            delay = scheduled - perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            endpoint = random.choices(endpoints, weights)[0]
+            executor.submit(
+                send, endpoint, random.choice(account_uuids), scheduled)
+
+    return results, perf_counter() - start
+
+
+def summarize(results, elapsed):
+    """ The latency percentiles and throughput of a list of requests. """
+    latencies = sorted(latency for latency, _ in results)
+    return dict(
+        requests=len(results),
+        errors=sum(1 for _, succeeded in results if not succeeded),
+        throughput_rps=len(results) / elapsed,
+        p50_ms=percentile(latencies, 50),
+        p95_ms=percentile(latencies, 95),
+        p99_ms=percentile(latencies, 99),
+        max_ms=latencies[-1])
+
+
+def start_api(workers, port, asgi=False):
+    """ Starts the API with gunicorn and waits for it to be up. """
+    url = 'http://127.0.0.1:{}'.format(port)
+    if asgi:
+        app = ['--worker-class=uvicorn.workers.UvicornWorker', 'app.asgi:app']
+    else:
+        app = ['app.wsgi:app']
+    process = subprocess.Popen([
+        'gunicorn',
+        '--bind=127.0.0.1:{}'.format(port),
+        '--workers={}'.format(workers),
+        '--timeout=120',
+        '--log-level=warning'] + app)
+
+    for _ in range(100):
+        try:
+            if requests.get(url + '/heartbeat').ok:
+                return process, url
+        except requests.ConnectionError:
+            pass
+        if process.poll() is not None:
+            break
+        time.sleep(0.1)
+
+    process.terminate()
+    raise RuntimeError('The API did not start')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', default=DEFAULT_URL,
+                        help='The API to load test')
+    parser.add_argument('--start', action='store_true',
+                        help='Start the API with gunicorn instead of --url')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of gunicorn workers, with --start')
+    parser.add_argument('--asgi', action='store_true',
+                        help='Start the ASGI app, with --start')
+    parser.add_argument('--accounts', type=int, default=100,
+                        help='Number of accounts created for the test')
+    parser.add_argument('--rps', type=float, default=50,
+                        help='Target requests per second')
+    parser.add_argument('--duration', type=float, default=30,
+                        help='Seconds to send requests for')
+    parser.add_argument('--concurrency', type=int, default=64,
+                        help='Maximum number of requests in flight')
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help='Weight of each endpoint in the traffic')
+    args = parser.parse_args()
+
+    endpoints, weights = parse_mix(args.mix)
+
+    process = None
+    url = args.url
+    if args.start:
+        process, url = start_api(args.workers, START_PORT, args.asgi)
+
+    try:
+        with ThreadPoolExecutor(min(args.concurrency, 16)) as executor:
+            account_uuids = list(executor.map(
+                lambda index: create_account(url, index),
+                range(args.accounts)))
+
+        results, elapsed = run_load(
+            url, account_uuids, endpoints, weights, args.rps, args.duration,
+            args.concurrency)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    settings = dict(
+        target_rps=args.rps,
+        accounts=args.accounts,
+        workers=args.workers if args.start else None,
+        asgi=args.asgi if args.start else None)
+
+    for endpoint in sorted(results):
+        report(
+            'load_test.' + endpoint,
+            **dict(settings, **summarize(results[endpoint], elapsed)))
+
+    report(
+        'load_test.total',
+        **dict(settings, **summarize(
+            [result for endpoint in results for result in results[endpoint]],
+            elapsed)))
+
+
+if __name__ == '__main__':
+    main()
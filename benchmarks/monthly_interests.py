@@ -0,0 +1,99 @@
+"""Benchmarks the monthly interest calculation for accounts that were idle
+for years, which accrue interest for every pay period they were idle.
+
+Usage:
+    python -m benchmarks.monthly_interests [--repeat N] [--accounts N]
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta
+
+from app.utilities.payment_calc import (
+    BalanceHistory, get_monthly_interests, get_monthly_interests_batch)
+from benchmarks.utils import measure, report
+
+PAY_PERIOD = 30
+APR = 35
+OPENING_TIME = datetime(year=2000, month=1, day=1)
+IDLE_YEARS = [1, 5, 10, 20]
+
+
+def idle_history(balances):
+    """ A balance history with a balance a day after the account opened,
+    followed by nothing. """
+    return [{'time': OPENING_TIME, 'principal_owed': 0}] + [
+        {
+            'time': OPENING_TIME + timedelta(days=day),
+            'principal_owed': day * 1000000
+        }
+        for day in range(1, balances)
+    ]
+
+
+def history_bytes(history):
+    """ The memory held by a balance history, including its balances. """
+    if isinstance(history, BalanceHistory):
+        return (sys.getsizeof(history) + sys.getsizeof(history.times) +
+                sys.getsizeof(history.principals_owed))
+    return sys.getsizeof(history) + sum(
+        sys.getsizeof(balance) + sys.getsizeof(balance['time']) +
+        sys.getsizeof(balance['principal_owed'])
+        for balance in history)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=100,
+                        help='Number of times each calculation is timed')
+    parser.add_argument('--accounts', type=int, default=10000,
+                        help='Number of accounts in the batch calculation')
+    parser.add_argument('--balances', type=int, default=30,
+                        help='Number of balances recorded per account')
+    args = parser.parse_args()
+
+    history = idle_history(args.balances)
+    balance_history = BalanceHistory.from_dicts(history)
+
+    for years in IDLE_YEARS:
+        end_date = OPENING_TIME + timedelta(days=365 * years)
+        periods = len(get_monthly_interests(
+            APR, PAY_PERIOD, end_date, history))
+
+        for benchmark, calc_history in [
+                ('monthly_interests', history),
+                ('monthly_interests_balance_history', balance_history)]:
+            report(
+                benchmark,
+                idle_years=years,
+                balances=len(calc_history),
+                history_bytes=history_bytes(calc_history),
+                periods=periods,
+                **measure(
+                    lambda: get_monthly_interests(
+                        APR, PAY_PERIOD, end_date, calc_history),
+                    args.repeat))
+
+        account_ids = [
+            account_id
+            for account_id in range(args.accounts)
+            for _ in history
+        ]
+        times = balance_history.times * args.accounts
+        principals_owed = balance_history.principals_owed * args.accounts
+        aprs = [APR] * len(account_ids)
+
+        report(
+            'monthly_interests_batch',
+            idle_years=years,
+            accounts=args.accounts,
+            balances=len(account_ids),
+            periods=periods * args.accounts,
+            **measure(
+                lambda: get_monthly_interests_batch(
+                    PAY_PERIOD, end_date, account_ids, times,
+                    principals_owed, aprs),
+                max(1, args.repeat // 10)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Benchmarks the payment calculations: payments, withdrawals, interest
+over synthetic balance histories of 10 to 1M balances and payoff projections.
+
+Usage:
+    python -m benchmarks.payment_calc [--repeat N] [--rows N [N ...]]
+"""
+import argparse
+from datetime import datetime, timedelta
+
+from app.utilities.payment_calc import (
+    _calc_interest_over_balances, BalanceHistory, get_monthly_interests,
+    make_payment, make_withdrawal, project_payoff)
+from benchmarks.utils import measure, report
+
+PAY_PERIOD = 30
+APR = 35
+OPENING_TIME = datetime(year=2000, month=1, day=1)
+HISTORY_ROWS = [10, 100, 1000, 10000, 100000, 1000000]
+
+# Payoff projections of 30 years of pay periods, for a single payment amount
+# and for a grid of them, none of which pays the balance off early.
+PROJECTION_PERIODS = 365
+PROJECTION_PAYMENTS = [1, 100]
+
+# make_payment and make_withdrawal take microseconds, they are timed over
+# this many calls at a time.
+CALLS = 10000
+
+# Calculations over the largest histories are timed fewer times, so every
+# history size takes about as long to benchmark.
+MAX_TIMED_ROWS = 1000000
+
+
+def synthetic_history(rows):
+    """ A balance history with a balance recorded every few hours after the
+    opening balance, alternating between withdrawals and payments. """
+    balance_history = [{'time': OPENING_TIME, 'principal_owed': 0}]
+    for row in range(1, rows):
+        balance_history.append({
+            'time': OPENING_TIME + timedelta(hours=7 * row),
+            'principal_owed': (row % 50) * 1000000000
+        })
+    return balance_history
+
+
+def bench_transactions(repeat):
+    def payments():
+        for _ in range(CALLS):
+            make_payment(50000000000, 1438356164, 1000000000)
+
+    def withdrawals():
+        for _ in range(CALLS):
+            make_withdrawal(50000000000, 1000000000)
+
+    for benchmark, func in [('payment_calc.make_payment', payments),
+                            ('payment_calc.make_withdrawal', withdrawals)]:
+        report(benchmark, calls=CALLS, **measure(func, repeat))
+
+
+def bench_interests(rows, repeat):
+    history = synthetic_history(rows)
+    balance_history = BalanceHistory.from_dicts(history)
+    end_date = history[-1]['time'] + timedelta(days=PAY_PERIOD + 15)
+    repeat = max(3, min(repeat, MAX_TIMED_ROWS // rows))
+
+    report(
+        'payment_calc.calc_interest_over_balances',
+        rows=rows,
+        **measure(
+            lambda: _calc_interest_over_balances(APR, history), repeat))
+
+    for benchmark, calc_history in [
+            ('payment_calc.monthly_interests', history),
+            ('payment_calc.monthly_interests_balance_history',
+             balance_history)]:
+        report(
+            benchmark,
+            rows=rows,
+            **measure(
+                lambda: get_monthly_interests(
+                    APR, PAY_PERIOD, end_date, calc_history),
+                repeat))
+
+
+def bench_projections(repeat):
+    for payments in PROJECTION_PAYMENTS:
+        amounts = [200000000 + 1000000 * i for i in range(payments)]
+        report(
+            'payment_calc.project_payoff',
+            periods=PROJECTION_PERIODS,
+            payments=payments,
+            **measure(
+                lambda: project_payoff(
+                    100000000000, 0, APR, PAY_PERIOD, amounts,
+                    PROJECTION_PERIODS),
+                repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=100,
+                        help='Number of times each calculation is timed')
+    parser.add_argument('--rows', type=int, nargs='+', default=HISTORY_ROWS,
+                        help='Sizes of the balance histories')
+    args = parser.parse_args()
+
+    bench_transactions(args.repeat)
+    bench_projections(args.repeat)
+    for rows in args.rows:
+        bench_interests(rows, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+import json
+import sys
+from time import perf_counter
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine.url import make_url
+
+
+def percentile(values, percent):
+    """ Returns the nearest-rank percentile of a list of sorted values. """
+    index = int(round(percent / 100 * (len(values) - 1)))
+    return values[min(index, len(values) - 1)]
+
+
+def measure(func, repeat):
+    """ Calls a function repeatedly and returns its timing statistics.
+
+    Args:
+        func (callable) - The function to time, called without arguments
+        repeat (int) - The number of times to call the function
+
+    Returns:
+        dict - The number of calls along with the mean, median, 95th
+               percentile and maximum call time in milliseconds
+    """
+    timings = []
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        timings.append((perf_counter() - start) * 1000)
+
+    timings.sort()
+    return dict(
+        repeat=repeat,
+        mean_ms=sum(timings) / len(timings),
+        p50_ms=percentile(timings, 50),
+        p95_ms=percentile(timings, 95),
+        max_ms=timings[-1])
+
+
+def report(benchmark, **results):
+    """ Writes a benchmark result to stdout as a line of JSON. """
+    sys.stdout.write(json.dumps(
+        dict(benchmark=benchmark, **results), default=str, sort_keys=True))
+    sys.stdout.write('\n')
+    sys.stdout.flush()
+
+
+def create_database(url):
+    """ Creates a Postgres database if it does not exist yet. """
+    url = make_url(url)
+    database = url.database
+    url.database = 'postgres'
+
+    engine = create_engine(url, isolation_level='AUTOCOMMIT')
+    with engine.connect() as connection:
+        exists = connection.execute(
+            text("SELECT 1 FROM pg_database WHERE datname = :database"),
+            database=database).scalar()
+        if not exists:
+            connection.execute('CREATE DATABASE "{}"'.format(database))
+    engine.dispose()
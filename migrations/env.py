@@ -1,6 +1,7 @@
 from __future__ import with_statement
 
 import os
+import re
 
 from alembic import context
 from sqlalchemy import create_engine
@@ -22,6 +23,11 @@ fileConfig(config.config_file_name)
 # target_metadata = mymodel.Base.metadata
 target_metadata = schema.Base.metadata
 
+# The yearly and default partitions of the tables partitioned by time. They
+# are created by migrations and the create-partitions command rather than
+# declared in the schema.
+PARTITION_NAME = re.compile(r'^(balance|payment|withdrawal)_(y\d{4}|default)$')
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -37,6 +43,12 @@ def get_url():
     )
 
 
+def include_object(object, name, type_, reflected, compare_to):
+    """ Leaves the partitions out of autogenerate, which would otherwise
+    drop them as tables missing from the schema. """
+    return not (type_ == 'table' and PARTITION_NAME.match(name))
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -51,7 +63,8 @@ def run_migrations_offline():
     """
     url = get_url()
     context.configure(
-        url=url, target_metadata=target_metadata, literal_binds=True)
+        url=url, target_metadata=target_metadata, literal_binds=True,
+        include_object=include_object)
 
     with context.begin_transaction():
         context.run_migrations()
@@ -69,7 +82,8 @@ def run_migrations_online():
     with connectable.connect() as connection:
         context.configure(
             connection=connection,
-            target_metadata=target_metadata
+            target_metadata=target_metadata,
+            include_object=include_object
         )
 
         with context.begin_transaction():
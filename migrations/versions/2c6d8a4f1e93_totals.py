@@ -0,0 +1,43 @@
+"""totals
+
+Revision ID: 2c6d8a4f1e93
+Revises: 9b1e6f3d2a70
+Create Date: 2026-10-17 23:02:51.360718
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '2c6d8a4f1e93'
+down_revision = '9b1e6f3d2a70'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled in for existing accounts by `flask rebuild-totals`.
+    op.create_table('customer_totals',
+    sa.Column('customer_uuid', postgresql.UUID(), nullable=False),
+    sa.Column('accounts', sa.BIGINT(), nullable=False),
+    sa.Column('principal_owed', sa.BIGINT(), nullable=False),
+    sa.Column('interest_owed', sa.BIGINT(), nullable=False),
+    sa.Column('available_credit', sa.BIGINT(), nullable=False),
+    sa.ForeignKeyConstraint(['customer_uuid'], ['customer.uuid'], ),
+    sa.PrimaryKeyConstraint('customer_uuid')
+    )
+    op.create_table('portfolio_totals',
+    sa.Column('shard', sa.Integer(), nullable=False),
+    sa.Column('accounts', sa.BIGINT(), nullable=False),
+    sa.Column('principal_owed', sa.BIGINT(), nullable=False),
+    sa.Column('interest_owed', sa.BIGINT(), nullable=False),
+    sa.Column('available_credit', sa.BIGINT(), nullable=False),
+    sa.PrimaryKeyConstraint('shard')
+    )
+
+
+def downgrade():
+    op.drop_table('portfolio_totals')
+    op.drop_table('customer_totals')
@@ -0,0 +1,41 @@
+"""idempotency keys
+
+Revision ID: 3f9d2c6a8e41
+Revises: b81f04d6e2a9
+Create Date: 2026-10-17 20:31:47.214856
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9d2c6a8e41'
+down_revision = 'b81f04d6e2a9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('idempotency_key',
+    sa.Column('credit_account_uuid', postgresql.UUID(), nullable=False),
+    sa.Column('key', sa.String(length=255), nullable=False),
+    sa.Column('time_created', sa.TIMESTAMP(), nullable=False),
+    sa.Column('transaction_type', sa.String(), nullable=True),
+    sa.Column('amount', sa.BIGINT(), nullable=True),
+    sa.Column('available_credit', sa.BIGINT(), nullable=True),
+    sa.Column('principal_owed', sa.BIGINT(), nullable=True),
+    sa.Column('interest_owed', sa.BIGINT(), nullable=True),
+    sa.ForeignKeyConstraint(
+        ['credit_account_uuid'], ['credit_account.uuid'], ),
+    sa.PrimaryKeyConstraint('credit_account_uuid', 'key')
+    )
+    op.create_index('idx_idempotency_key_time_created', 'idempotency_key',
+                    ['time_created'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_idempotency_key_time_created',
+                  table_name='idempotency_key')
+    op.drop_table('idempotency_key')
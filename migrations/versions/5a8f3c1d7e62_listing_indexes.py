@@ -0,0 +1,28 @@
+"""listing indexes
+
+Revision ID: 5a8f3c1d7e62
+Revises: 2c6d8a4f1e93
+Create Date: 2026-10-17 21:12:40.183524
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5a8f3c1d7e62'
+down_revision = '2c6d8a4f1e93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('idx_customer_email', 'customer', ['email'],
+                    unique=False,
+                    postgresql_ops={'email': 'text_pattern_ops'})
+    op.create_index('idx_credit_account_customer', 'credit_account',
+                    ['customer_uuid', 'uuid'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_credit_account_customer', table_name='credit_account')
+    op.drop_index('idx_customer_email', table_name='customer')
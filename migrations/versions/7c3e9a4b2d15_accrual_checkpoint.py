@@ -0,0 +1,52 @@
+"""accrual checkpoint
+
+Revision ID: 7c3e9a4b2d15
+Revises: 01813008e82c
+Create Date: 2026-10-17 09:12:44.183920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c3e9a4b2d15'
+down_revision = '01813008e82c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('credit_account',
+                  sa.Column('accrued_through', sa.TIMESTAMP(), nullable=True))
+    op.add_column('credit_account',
+                  sa.Column('balance_seq', sa.BIGINT(), nullable=False,
+                            server_default='0'))
+    op.add_column('balance', sa.Column('seq', sa.BIGINT(), nullable=True))
+
+    # Number the existing balances of each account in the order they were
+    # recorded. Accounts start accruing from the time they were opened, the
+    # checkpoint advances the next time interest is accrued for them.
+    op.execute("""
+        UPDATE balance
+        SET seq = numbered.seq
+        FROM (
+            SELECT uuid, row_number() OVER (
+                PARTITION BY credit_account_uuid ORDER BY time, ctid) AS seq
+            FROM balance
+        ) AS numbered
+        WHERE balance.uuid = numbered.uuid
+    """)
+    op.execute("""
+        UPDATE credit_account
+        SET accrued_through = time_opened,
+            balance_seq = coalesce((
+                SELECT max(seq) FROM balance
+                WHERE balance.credit_account_uuid = credit_account.uuid), 0)
+    """)
+
+
+def downgrade():
+    op.drop_column('balance', 'seq')
+    op.drop_column('credit_account', 'balance_seq')
+    op.drop_column('credit_account', 'accrued_through')
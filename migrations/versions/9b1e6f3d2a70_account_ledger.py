@@ -0,0 +1,56 @@
+"""account ledger
+
+Revision ID: 9b1e6f3d2a70
+Revises: e7b2d94a1c58
+Create Date: 2026-10-17 22:05:19.417263
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b1e6f3d2a70'
+down_revision = 'e7b2d94a1c58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.alter_column('credit_account', 'balance_seq',
+                    new_column_name='ledger_seq')
+    op.add_column('credit_account',
+                  sa.Column('snapshot_seq', sa.BIGINT(), nullable=False,
+                            server_default='0'))
+    for table in ('payment', 'withdrawal', 'interest_accrual'):
+        op.add_column(table, sa.Column('seq', sa.BIGINT(), nullable=True))
+        op.create_index('idx_{}_account_seq'.format(table), table,
+                        ['credit_account_uuid', 'seq'], unique=False)
+    op.add_column('interest_accrual',
+                  sa.Column('interest_owed', sa.BIGINT(), nullable=True))
+    op.create_index('idx_balance_account_seq', 'balance',
+                    ['credit_account_uuid', 'seq'], unique=False)
+
+    # A balance was recorded for every existing payment, withdrawal and
+    # interest accrual, so the last one is the snapshot of each account and
+    # there is nothing to replay after it. The existing entries are left out
+    # of the ledger.
+    op.execute("""
+        UPDATE credit_account
+        SET snapshot_seq = coalesce((
+            SELECT max(seq) FROM balance
+            WHERE balance.credit_account_uuid = credit_account.uuid), 0)
+    """)
+
+
+def downgrade():
+    # Balances were only recorded every few ledger entries, which leaves
+    # gaps in the balance history of the accounts.
+    op.drop_index('idx_balance_account_seq', table_name='balance')
+    op.drop_column('interest_accrual', 'interest_owed')
+    for table in ('payment', 'withdrawal', 'interest_accrual'):
+        op.drop_index('idx_{}_account_seq'.format(table), table_name=table)
+        op.drop_column(table, 'seq')
+    op.drop_column('credit_account', 'snapshot_seq')
+    op.alter_column('credit_account', 'ledger_seq',
+                    new_column_name='balance_seq')
@@ -0,0 +1,30 @@
+"""account time indexes
+
+Revision ID: b81f04d6e2a9
+Revises: 7c3e9a4b2d15
+Create Date: 2026-10-17 10:41:05.527311
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81f04d6e2a9'
+down_revision = '7c3e9a4b2d15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('idx_balance_account_time', 'balance',
+                    ['credit_account_uuid', 'time', 'seq'], unique=False)
+    op.create_index('idx_payment_account_time', 'payment',
+                    ['credit_account_uuid', 'time'], unique=False)
+    op.create_index('idx_withdrawal_account_time', 'withdrawal',
+                    ['credit_account_uuid', 'time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_withdrawal_account_time', table_name='withdrawal')
+    op.drop_index('idx_payment_account_time', table_name='payment')
+    op.drop_index('idx_balance_account_time', table_name='balance')
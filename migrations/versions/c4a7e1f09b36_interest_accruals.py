@@ -0,0 +1,35 @@
+"""interest accruals
+
+Revision ID: c4a7e1f09b36
+Revises: 3f9d2c6a8e41
+Create Date: 2026-10-17 20:48:12.530417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a7e1f09b36'
+down_revision = '3f9d2c6a8e41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled in for existing accounts by `flask backfill-interest-accruals`.
+    op.create_table('interest_accrual',
+    sa.Column('credit_account_uuid', postgresql.UUID(), nullable=False),
+    sa.Column('period_end', sa.TIMESTAMP(), nullable=False),
+    sa.Column('period_start', sa.TIMESTAMP(), nullable=False),
+    sa.Column('principal_days', sa.BIGINT(), nullable=False),
+    sa.Column('interest', sa.BIGINT(), nullable=False),
+    sa.ForeignKeyConstraint(
+        ['credit_account_uuid'], ['credit_account.uuid'], ),
+    sa.PrimaryKeyConstraint('credit_account_uuid', 'period_end')
+    )
+
+
+def downgrade():
+    op.drop_table('interest_accrual')
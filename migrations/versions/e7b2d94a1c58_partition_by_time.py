@@ -0,0 +1,113 @@
+"""partition by time
+
+Revision ID: e7b2d94a1c58
+Revises: c4a7e1f09b36
+Create Date: 2026-10-17 21:14:36.902154
+
+"""
+from datetime import datetime
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b2d94a1c58'
+down_revision = 'c4a7e1f09b36'
+branch_labels = None
+depends_on = None
+
+# Columns of each table, other than the uuid and account they all have.
+COLUMNS = {
+    'balance': """
+        seq bigint,
+        time timestamp NOT NULL,
+        available_credit bigint,
+        principal_owed bigint,
+        interest_owed bigint""",
+    'payment': """
+        amount bigint,
+        time timestamp NOT NULL""",
+    'withdrawal': """
+        amount bigint,
+        time timestamp NOT NULL""",
+}
+
+INDEXES = {
+    'balance': [
+        ('idx_balance_time', 'time'),
+        ('idx_balance_account_time', 'credit_account_uuid, time, seq'),
+    ],
+    'payment': [
+        ('idx_payment_account_time', 'credit_account_uuid, time'),
+    ],
+    'withdrawal': [
+        ('idx_withdrawal_account_time', 'credit_account_uuid, time'),
+    ],
+}
+
+
+def create_table(table, partitioned):
+    # The partition key has to be part of the primary key.
+    op.execute("""
+        CREATE TABLE {table} (
+            uuid uuid NOT NULL,
+            credit_account_uuid uuid NOT NULL
+                REFERENCES credit_account (uuid),
+            {columns},
+            PRIMARY KEY ({primary_key})
+        ) {partitioning}
+    """.format(
+        table=table,
+        columns=COLUMNS[table].strip(),
+        primary_key='uuid, time' if partitioned else 'uuid',
+        partitioning='PARTITION BY RANGE (time)' if partitioned else ''))
+
+    for name, columns in INDEXES[table]:
+        op.execute('CREATE INDEX {} ON {} ({})'.format(name, table, columns))
+
+
+def rename_old_table(table):
+    op.execute('ALTER TABLE {0} RENAME TO {0}_old'.format(table))
+    op.execute('ALTER INDEX {0}_pkey RENAME TO {0}_old_pkey'.format(table))
+    for name, _ in INDEXES[table]:
+        op.execute('DROP INDEX {}'.format(name))
+
+
+def copy_old_table(table):
+    columns = ', '.join(['uuid', 'credit_account_uuid'] + [
+        column.split()[0] for column in COLUMNS[table].split(',')])
+    op.execute('INSERT INTO {0} ({1}) SELECT {1} FROM {0}_old'.format(
+        table, columns))
+    op.execute('DROP TABLE {}_old'.format(table))
+
+
+def upgrade():
+    connection = op.get_bind()
+    last_year = datetime.now().year + 1
+
+    for table in COLUMNS:
+        first_year = connection.execute(
+            'SELECT extract(year FROM min(time)) FROM {}'.format(table)
+        ).scalar()
+        first_year = int(first_year or datetime.now().year)
+
+        rename_old_table(table)
+        create_table(table, partitioned=True)
+
+        # Later years are created ahead of time by `flask create-partitions`.
+        for year in range(first_year, last_year + 1):
+            op.execute(
+                "CREATE TABLE {0}_y{1} PARTITION OF {0} "
+                "FOR VALUES FROM ('{1}-01-01') TO ('{2}-01-01')".format(
+                    table, year, year + 1))
+        op.execute('CREATE TABLE {0}_default PARTITION OF {0} DEFAULT'.format(
+            table))
+
+        copy_old_table(table)
+
+
+def downgrade():
+    for table in COLUMNS:
+        rename_old_table(table)
+        create_table(table, partitioned=False)
+        copy_old_table(table)
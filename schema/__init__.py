@@ -3,5 +3,9 @@ from schema.schema import (
     Balance,
     Customer,
     CreditAccount,
+    CustomerTotals,
+    IdempotencyKey,
+    InterestAccrual,
     Payment,
+    PortfolioTotals,
     Withdrawal)
@@ -19,6 +19,12 @@ class Customer(Base):
     fname = Column(String)
     lname = Column(String)
 
+    # Serves the email filters of the customer listing, prefixes included,
+    # which the default operator class can't match with LIKE.
+    idx_customer_email = Index(
+        'idx_customer_email', email,
+        postgresql_ops={'email': 'text_pattern_ops'})
+
     accounts = relationship('CreditAccount', backref='customer',
                             cascade='all, delete, delete-orphan',
                             single_parent=True)
@@ -37,15 +43,41 @@ class CreditAccount(Base):
     apr = Column(Integer)
     max_credit = Column(BIGINT)
 
+    # Interest has been accrued for every pay period closing up to this time.
+    accrued_through = Column(TIMESTAMP)
+    # Sequence number of the last entry recorded in the ledger of this
+    # account: its payments, withdrawals and interest accruals, numbered in
+    # the order they were applied.
+    ledger_seq = Column(BIGINT, nullable=False, server_default='0')
+    # Sequence number of the ledger entry the last balance was recorded at.
+    # The entries after it are replayed on top of that balance.
+    snapshot_seq = Column(BIGINT, nullable=False, server_default='0')
+
+    # Serves the pages of the accounts of a customer, in uuid order.
+    idx_credit_account_customer = Index(
+        'idx_credit_account_customer', customer_uuid, uuid)
+
     payments = relationship('Payment', backref='credit_account',
                             cascade='all, delete, delete-orphan',
-                            single_parent=True)
+                            single_parent=True,
+                            order_by='Payment.time')
     withdrawals = relationship('Withdrawal', backref='credit_account',
                                cascade='all, delete, delete-orphan',
-                               single_parent=True)
+                               single_parent=True,
+                               order_by='Withdrawal.time')
     balances = relationship('Balance', backref='credit_account',
                             cascade='all, delete, delete-orphan',
-                            single_parent=True)
+                            single_parent=True,
+                            order_by='Balance.time, Balance.seq')
+    idempotency_keys = relationship('IdempotencyKey',
+                                    backref='credit_account',
+                                    cascade='all, delete, delete-orphan',
+                                    single_parent=True)
+    interest_accruals = relationship('InterestAccrual',
+                                     backref='credit_account',
+                                     cascade='all, delete, delete-orphan',
+                                     single_parent=True,
+                                     order_by='InterestAccrual.period_end')
 
     def __repr__(self):
         return "<CreditAccount()>" % ()
@@ -57,7 +89,17 @@ class Payment(Base):
     credit_account_uuid = Column(UUID, ForeignKey('credit_account.uuid'),
                                  nullable=False)
     amount = Column(BIGINT)
-    time = Column(TIMESTAMP)
+    # Partitioned by year on the time, which is part of the primary key.
+    time = Column(TIMESTAMP, primary_key=True)
+
+    # Position in the ledger of the account, null for the ones recorded
+    # before the ledger, which each have a balance recorded with them.
+    seq = Column(BIGINT)
+
+    idx_payment_account_time = Index(
+        'idx_payment_account_time', credit_account_uuid, time)
+    idx_payment_account_seq = Index(
+        'idx_payment_account_seq', credit_account_uuid, seq)
 
     def __repr__(self):
         return "<Payments()>" % ()
@@ -69,23 +111,126 @@ class Withdrawal(Base):
     credit_account_uuid = Column(UUID, ForeignKey('credit_account.uuid'),
                                  nullable=False)
     amount = Column(BIGINT)
-    time = Column(TIMESTAMP)
+    # Partitioned by year on the time, which is part of the primary key.
+    time = Column(TIMESTAMP, primary_key=True)
+
+    # Position in the ledger of the account, null for the ones recorded
+    # before the ledger, which each have a balance recorded with them.
+    seq = Column(BIGINT)
+
+    idx_withdrawal_account_time = Index(
+        'idx_withdrawal_account_time', credit_account_uuid, time)
+    idx_withdrawal_account_seq = Index(
+        'idx_withdrawal_account_seq', credit_account_uuid, seq)
 
     def __repr__(self):
         return "<Withdrawals()>" % ()
 
 
 class Balance(Base):
+    """ Table to hold snapshots of the balance of an account, recorded every
+    `ledger.snapshot_interval` ledger entries """
     __tablename__ = 'balance'
     uuid = Column(UUID, primary_key=True)
     credit_account_uuid = Column(UUID, ForeignKey('credit_account.uuid'),
                                  nullable=False)
-    time = Column(TIMESTAMP)
+    # Sequence number of the last ledger entry the balance includes.
+    seq = Column(BIGINT)
+    # Partitioned by year on the time, which is part of the primary key.
+    time = Column(TIMESTAMP, primary_key=True)
     available_credit = Column(BIGINT)
     principal_owed = Column(BIGINT)
     interest_owed = Column(BIGINT)
 
     idx_balance_time = Index('idx_balance_time', time)
+    # Serves both the latest balance and the history of an account, in the
+    # order balances are sorted in.
+    idx_balance_account_time = Index(
+        'idx_balance_account_time', credit_account_uuid, time, seq)
+    # Serves the snapshot of an account the ledger is replayed from.
+    idx_balance_account_seq = Index(
+        'idx_balance_account_seq', credit_account_uuid, seq)
 
     def __repr__(self):
         return "<Balance()>" % ()
+
+
+class IdempotencyKey(Base):
+    """ Table to hold the result of payments and withdrawals made with an
+    idempotency key, returned again when they are retried with the key """
+    __tablename__ = 'idempotency_key'
+    credit_account_uuid = Column(UUID, ForeignKey('credit_account.uuid'),
+                                 primary_key=True)
+    key = Column(String(255), primary_key=True)
+    time_created = Column(TIMESTAMP, nullable=False)
+    # The request the key was used for.
+    transaction_type = Column(String)
+    amount = Column(BIGINT)
+    # The balance of the account right after the request.
+    available_credit = Column(BIGINT)
+    principal_owed = Column(BIGINT)
+    interest_owed = Column(BIGINT)
+
+    # Keys are evicted by age.
+    idx_idempotency_key_time_created = Index(
+        'idx_idempotency_key_time_created', time_created)
+
+    def __repr__(self):
+        return "<IdempotencyKey()>" % ()
+
+
+class InterestAccrual(Base):
+    """ Table to hold the interest accrued for each closed pay period of an
+    account, which are entries of its ledger """
+    __tablename__ = 'interest_accrual'
+    # Accruals of an account are looked up by the time their pay period
+    # closed, through the primary key.
+    credit_account_uuid = Column(UUID, ForeignKey('credit_account.uuid'),
+                                 primary_key=True)
+    period_end = Column(TIMESTAMP, primary_key=True)
+    period_start = Column(TIMESTAMP, nullable=False)
+    # Sum of the principal owed over each day of the pay period.
+    principal_days = Column(BIGINT, nullable=False)
+    interest = Column(BIGINT, nullable=False)
+    # Position in the ledger of the account and the interest owed once the
+    # interest was accrued, null for the accruals recorded before the ledger
+    # or backfilled.
+    seq = Column(BIGINT)
+    interest_owed = Column(BIGINT)
+
+    idx_interest_accrual_account_seq = Index(
+        'idx_interest_accrual_account_seq', credit_account_uuid, seq)
+
+    def __repr__(self):
+        return "<InterestAccrual()>" % ()
+
+
+class CustomerTotals(Base):
+    """ Table to hold the totals of the accounts of each customer, updated
+    along with every write to their balances """
+    __tablename__ = 'customer_totals'
+    customer_uuid = Column(UUID, ForeignKey('customer.uuid'),
+                           primary_key=True)
+    accounts = Column(BIGINT, nullable=False)
+    principal_owed = Column(BIGINT, nullable=False)
+    interest_owed = Column(BIGINT, nullable=False)
+    available_credit = Column(BIGINT, nullable=False)
+
+    def __repr__(self):
+        return "<CustomerTotals()>" % ()
+
+
+class PortfolioTotals(Base):
+    """ Table to hold the totals of all accounts, split into shards that
+    accounts are spread over by uuid, so concurrent writes to different
+    accounts rarely wait on the same row. The portfolio totals are the sum
+    of the shards. """
+    __tablename__ = 'portfolio_totals'
+    shard = Column(Integer, primary_key=True)
+    accounts = Column(BIGINT, nullable=False)
+    principal_owed = Column(BIGINT, nullable=False)
+    interest_owed = Column(BIGINT, nullable=False)
+    available_credit = Column(BIGINT, nullable=False)
+
+    def __repr__(self):
+        return "<PortfolioTotals()>" % ()
@@ -0,0 +1,20 @@
+import pytest
+from flask import current_app
+
+from app.app import create_app
+from app.utilities import get_db
+
+
+@pytest.fixture(scope='module')
+def app():
+    app = create_app()
+    with app.app_context():
+        get_db()
+    return app
+
+
+@pytest.fixture
+def context(app):
+    with app.app_context():
+        yield
+        current_app.db.remove()
@@ -1,15 +1,26 @@
+import json
+import os
 import pytest
 import uuid
 
 from datetime import datetime
 import requests
 
-base_url = "http://api:5001"
+# The API under test, api_asgi:5002 to test the ASGI app.
+base_url = os.environ.get("API_URL", "http://api:5001")
 
 
-def post_request(url, payload):
+def post_request(url, payload, headers=None):
     request_url = base_url + url
-    response = requests.post(request_url, data=payload)
+    response = requests.post(request_url, data=payload, headers=headers)
+
+    response.raise_for_status()
+    return response.json()
+
+
+def post_json_request(url, payload):
+    request_url = base_url + url
+    response = requests.post(request_url, json=payload)
 
     response.raise_for_status()
     return response.json()
@@ -26,6 +37,14 @@ def get_customer(uuid):
     return get_request("/customer/" + uuid)
 
 
+def list_customers(params=None):
+    return get_request("/customer/", params)
+
+
+def list_accounts(customer_uuid, params=None):
+    return get_request("/customer/" + customer_uuid + "/accounts", params)
+
+
 def get_account(uuid, time=None):
     params = None
     if time:
@@ -33,6 +52,25 @@ def get_account(uuid, time=None):
     return get_request("/accounts/" + uuid, params)
 
 
+def get_history(uuid, params=None):
+    request_url = base_url + "/accounts/" + uuid + "/history"
+    response = requests.get(request_url, params=params, stream=True)
+    response.raise_for_status()
+    return [json.loads(line) for line in response.iter_lines() if line]
+
+
+def get_interest(uuid, params=None):
+    return get_request("/accounts/" + uuid + "/interest", params)
+
+
+def get_customer_totals(uuid):
+    return get_request("/customer/" + uuid + "/totals")
+
+
+def get_portfolio_totals():
+    return get_request("/reporting/portfolio")
+
+
 def new_customer(
         fname="Michael", lname="Villalobos", email="mvillalobosj@yahoo.com"):
     customer_payload = {
@@ -44,10 +82,12 @@ def new_customer(
     return post_request("/customer/", customer_payload)
 
 
-def new_account(apr, max_credit, time_opened=datetime.now()):
-    customer = new_customer()
+def new_account(apr, max_credit, time_opened=datetime.now(),
+                customer_uuid=None):
+    if customer_uuid is None:
+        customer_uuid = new_customer()['customer']['uuid']
     account_payload = {
-        "customerUUID": customer['customer']['uuid'],
+        "customerUUID": customer_uuid,
         "apr": apr,
         "maxCredit": max_credit,
         "timeOpened": time_opened
@@ -55,22 +95,43 @@ def new_account(apr, max_credit, time_opened=datetime.now()):
     return post_request("/accounts/", account_payload)
 
 
-def make_payment(account_uuid, amount, time=datetime.now()):
+def make_payment(account_uuid, amount, time=datetime.now(),
+                 idempotency_key=None):
     payment_payload = {
         "accountUUID": account_uuid,
         "amount": amount,
         "time": time
     }
-    return post_request("/accounts/payment", payment_payload)
+    headers = None
+    if idempotency_key:
+        headers = {"Idempotency-Key": idempotency_key}
+    return post_request("/accounts/payment", payment_payload, headers)
 
 
-def make_withdrawal(account_uuid, amount, time=datetime.now()):
+def make_withdrawal(account_uuid, amount, time=datetime.now(),
+                    idempotency_key=None):
     withdrawal_payload = {
         "accountUUID": account_uuid,
         "amount": amount,
         "time": time
     }
-    return post_request("/accounts/withdrawal", withdrawal_payload)
+    headers = None
+    if idempotency_key:
+        headers = {"Idempotency-Key": idempotency_key}
+    return post_request("/accounts/withdrawal", withdrawal_payload, headers)
+
+
+def simulate(account_uuid, payments, time, **params):
+    return post_json_request(
+        "/accounts/" + account_uuid + "/simulate",
+        dict(params, payments=payments, time=time.isoformat()))
+
+
+def post_transactions(transactions):
+    for transaction in transactions:
+        transaction['time'] = transaction['time'].isoformat()
+    return post_json_request(
+        "/accounts/transactions", {"transactions": transactions})
 
 
 class TestCustomer:
@@ -269,6 +330,609 @@ class TestInterest:
         assert response['account']['principalOwed'] == 40000000000
         assert response['account']['maxCredit'] == 100000000000
 
+    def test_no_accrual_until_next_pay_period(self):
+        open_time = datetime(year=2017, month=10, day=1)
+        check_time = datetime(year=2017, month=10, day=31)
+        payment_time = datetime(year=2017, month=11, day=2)
+        check_time_2 = datetime(year=2017, month=11, day=5)
+
+        account = new_account(
+            apr=35,
+            max_credit=100000000000,
+            time_opened=open_time)
+
+        account_uuid = account['account']['uuid']
+
+        make_withdrawal(account_uuid, 50000000000, time=open_time)
+        get_account(account_uuid, check_time)
+        make_payment(account_uuid, 1438356164, time=payment_time)
+
+        response = get_account(account_uuid, check_time_2)
+
+        assert response['account']['interestOwed'] == 0
+        assert response['account']['availableCredit'] == 50000000000
+        assert response['account']['principalOwed'] == 50000000000
+        assert response['account']['maxCredit'] == 100000000000
+
+    def test_interest_accrued_once_per_pay_period(self):
+        open_time = datetime(year=2017, month=10, day=1)
+        check_time = datetime(year=2017, month=10, day=31)
+        check_time_2 = datetime(year=2017, month=10, day=31, hour=5)
+
+        account = new_account(
+            apr=35,
+            max_credit=100000000000,
+            time_opened=open_time)
+
+        account_uuid = account['account']['uuid']
+
+        make_withdrawal(account_uuid, 50000000000, time=open_time)
+        get_account(account_uuid, check_time)
+        response = get_account(account_uuid, check_time_2)
+
+        assert response['account']['interestOwed'] == 1438356164
+
+        interests = [
+            entry for entry in get_history(account_uuid)
+            if entry['type'] == 'balance' and entry['interestOwed']
+        ]
+        assert len(interests) == 1
+
+
+class TestHistory:
+
+    def test_get_history(self):
+        open_time = datetime(year=2017, month=10, day=1)
+        withdrawal_time = datetime(year=2017, month=10, day=5)
+        payment_time = datetime(year=2017, month=10, day=16)
+
+        account = new_account(
+            apr=35,
+            max_credit=100000000000,
+            time_opened=open_time)
+
+        account_uuid = account['account']['uuid']
+
+        make_withdrawal(account_uuid, 50000000000, time=withdrawal_time)
+        make_payment(account_uuid, 20000000000, time=payment_time)
+
+        history = get_history(account_uuid)
+
+        assert [entry['type'] for entry in history] == [
+            'balance', 'withdrawal', 'balance', 'payment', 'balance']
+        assert history[1]['amount'] == 50000000000
+        assert history[3]['amount'] == 20000000000
+        assert history[4]['principalOwed'] == 30000000000
+        assert history[4]['availableCredit'] == 70000000000
+
+    def test_get_history_snapshots(self):
+        open_time = datetime(year=2017, month=10, day=1)
+        withdrawal_time = datetime(year=2017, month=10, day=5)
+
+        account = new_account(
+            apr=35,
+            max_credit=100000000000,
+            time_opened=open_time)
+
+        account_uuid = account['account']['uuid']
+
+        for _ in range(11):
+            make_withdrawal(account_uuid, 1000000000, time=withdrawal_time)
+
+        balances = [
+            entry for entry in get_history(account_uuid)
+            if entry['type'] == 'balance'
+        ]
+
+        # A balance is recorded every 10 ledger entries, the ones in between
+        # are replayed.
+        assert [balance['principalOwed'] for balance in balances] == [
+            1000000000 * withdrawals for withdrawals in range(12)]
+        assert balances == [
+            entry for entry in get_history(account_uuid)
+            if entry['type'] == 'balance'
+        ]
+        assert get_account(
+            account_uuid, withdrawal_time)['account']['principalOwed'] == (
+                11000000000)
+
+    def test_get_history_interest(self):
+        open_time = datetime(year=2017, month=10, day=1)
+        withdrawal_time = datetime(year=2017, month=10, day=5)
+        check_time = datetime(year=2018, month=2, day=28)
+
+        account = new_account(
+            apr=35,
+            max_credit=100000000000,
+            time_opened=open_time)
+
+        account_uuid = account['account']['uuid']
+
+        make_withdrawal(account_uuid, 50000000000, time=withdrawal_time)
+        interest_owed = get_account(
+            account_uuid, check_time)['account']['interestOwed']
+
+        history = get_history(account_uuid)
+
+        assert [entry['type'] for entry in history] == [
+            'balance', 'withdrawal', 'balance'] + ['balance'] * 5
+        assert [entry['time'] for entry in history[3:]] == [
+            accrual['periodEnd']
+            for accrual in get_interest(account_uuid)['accruals']]
+        assert history[-1]['interestOwed'] == interest_owed
+
+        since = {'since': history[4]['time']}
+        assert get_history(account_uuid, since) == history[4:]
+
+    def test_get_history_since(self):
+        open_time = datetime(year=2017, month=10, day=1)
+        withdrawal_time = datetime(year=2017, month=10, day=5)
+        payment_time = datetime(year=2017, month=10, day=16)
+
+        account = new_account(
+            apr=35,
+            max_credit=100000000000,
+            time_opened=open_time)
+
+        account_uuid = account['account']['uuid']
+
+        make_withdrawal(account_uuid, 50000000000, time=withdrawal_time)
+        make_payment(account_uuid, 20000000000, time=payment_time)
+
+        history = get_history(account_uuid, {'since': payment_time})
+
+        assert [entry['type'] for entry in history] == ['payment', 'balance']
+
+
+class TestInterestAccruals:
+
+    def test_get_interest(self):
+        open_time = datetime(year=2017, month=10, day=1)
+        withdrawal_time = datetime(year=2017, month=10, day=16)
+        check_time = datetime(year=2017, month=12, day=1)
+
+        account = new_account(
+            apr=35,
+            max_credit=100000000000,
+            time_opened=open_time)
+
+        account_uuid = account['account']['uuid']
+
+        make_withdrawal(account_uuid, 50000000000, time=withdrawal_time)
+        get_account(account_uuid, check_time)
+
+        response = get_interest(account_uuid)
+
+        assert response['accruals'] == [{
+            'periodStart': '2017-10-01T00:00:00+00:00',
+            'periodEnd': '2017-10-31T00:00:00+00:00',
+            'principalDays': 15 * 50000000000,
+            'interest': 719178082,
+        }, {
+            'periodStart': '2017-10-31T00:00:00+00:00',
+            'periodEnd': '2017-11-30T00:00:00+00:00',
+            'principalDays': 30 * 50000000000,
+            'interest': 1438356164,
+        }]
+        assert response['totalInterest'] == 2157534246
+
+        response = get_interest(
+            account_uuid, {'since': datetime(year=2017, month=11, day=1)})
+
+        assert [accrual['interest'] for accrual in response['accruals']] == [
+            1438356164]
+        assert response['totalInterest'] == 1438356164
+
+    def test_account_without_interest(self):
+        account = new_account(
+            apr=35,
+            max_credit=100000000000)
+
+        response = get_interest(account['account']['uuid'])
+
+        assert response == {'accruals': [], 'totalInterest': 0}
+
+
+class TestBulkTransactions:
+
+    def test_transactions_applied_in_time_order(self):
+        open_time = datetime(year=2017, month=10, day=1)
+        check_time = datetime(year=2017, month=12, day=1)
+
+        account = new_account(
+            apr=35,
+            max_credit=100000000000,
+            time_opened=open_time)
+
+        account_uuid = account['account']['uuid']
+
+        response = post_transactions([{
+            "accountUUID": account_uuid,
+            "type": "withdrawal",
+            "amount": 10000000000,
+            "time": datetime(year=2017, month=11, day=5)
+        }, {
+            "accountUUID": account_uuid,
+            "type": "payment",
+            "amount": 20000000000,
+            "time": datetime(year=2017, month=10, day=16)
+        }, {
+            "accountUUID": account_uuid,
+            "type": "withdrawal",
+            "amount": 50000000000,
+            "time": datetime(year=2017, month=10, day=5)
+        }])
+
+        results = response['results']
+        assert [result['index'] for result in results] == [0, 1, 2]
+        assert [result['statusCode'] for result in results] == [200] * 3
+        assert results[0]['account']['principalOwed'] == 40000000000
+        assert results[0]['account']['interestOwed'] == 958904109
+        assert results[2]['account']['principalOwed'] == 50000000000
+
+        # Matches TestInterest.test_recent_pay_periods_previous_payments
+        response = get_account(account_uuid, check_time)
+
+        assert response['account']['interestOwed'] == 1102739726
+        assert response['account']['availableCredit'] == 58897260274
+        assert response['account']['principalOwed'] == 40000000000
+
+    def test_failed_transactions_reported_per_item(self):
+        account = new_account(
+            apr=35,
+            max_credit=50000000000)
+
+        account_uuid = account['account']['uuid']
+        time = datetime.now()
+
+        response = post_transactions([{
+            "accountUUID": account_uuid,
+            "type": "withdrawal",
+            "amount": 60000000000,
+            "time": time
+        }, {
+            "accountUUID": str(uuid.uuid4()),
+            "type": "payment",
+            "amount": 10000000000,
+            "time": time
+        }, {
+            "accountUUID": account_uuid,
+            "type": "withdrawal",
+            "amount": 10000000000,
+            "time": time
+        }])
+
+        results = response['results']
+        assert [result['statusCode'] for result in results] == [
+            422, 404, 200]
+        assert results[2]['account']['availableCredit'] == 40000000000
+
+        response = get_account(account_uuid)
+        assert response['account']['principalOwed'] == 10000000000
+
+    def test_malformed_account_uuid(self):
+        account = new_account(
+            apr=35,
+            max_credit=50000000000)
+
+        account_uuid = account['account']['uuid']
+        time = datetime.now()
+
+        response = post_transactions([{
+            "accountUUID": "not a uuid",
+            "type": "payment",
+            "amount": 10000000000,
+            "time": time
+        }, {
+            "accountUUID": account_uuid,
+            "type": "withdrawal",
+            "amount": 10000000000,
+            "time": time
+        }])
+
+        results = response['results']
+        assert results[0]['accountUUID'] == 'not a uuid'
+        assert results[0]['statusCode'] == 422
+        assert results[0]['message'] == 'Invalid account uuid'
+        assert results[1]['statusCode'] == 200
+
+        response = get_account(account_uuid)
+        assert response['account']['principalOwed'] == 10000000000
+
+
+class TestIdempotency:
+
+    def test_retried_payment(self):
+        open_time = datetime(year=2017, month=10, day=1)
+        payment_time = datetime(year=2017, month=10, day=16)
+
+        account = new_account(
+            apr=35,
+            max_credit=100000000000,
+            time_opened=open_time)
+
+        account_uuid = account['account']['uuid']
+        idempotency_key = str(uuid.uuid4())
+
+        make_withdrawal(account_uuid, 50000000000, time=open_time)
+        response = make_payment(
+            account_uuid, 20000000000, time=payment_time,
+            idempotency_key=idempotency_key)
+        retry = make_payment(
+            account_uuid, 20000000000, time=payment_time,
+            idempotency_key=idempotency_key)
+
+        assert retry == response
+        assert retry['account']['principalOwed'] == 30000000000
+
+        history = get_history(account_uuid)
+        assert len([
+            entry for entry in history if entry['type'] == 'payment']) == 1
+
+    def test_keys_are_per_account(self):
+        open_time = datetime(year=2017, month=10, day=1)
+        idempotency_key = str(uuid.uuid4())
+
+        account_uuids = [
+            new_account(
+                apr=35,
+                max_credit=100000000000,
+                time_opened=open_time)['account']['uuid']
+            for _ in range(2)
+        ]
+
+        for account_uuid in account_uuids:
+            response = make_withdrawal(
+                account_uuid, 50000000000, time=open_time,
+                idempotency_key=idempotency_key)
+
+            assert response['account']['uuid'] == account_uuid
+            assert response['account']['principalOwed'] == 50000000000
+
+    def test_key_reused_for_different_request(self):
+        open_time = datetime(year=2017, month=10, day=1)
+
+        account = new_account(
+            apr=35,
+            max_credit=100000000000,
+            time_opened=open_time)
+
+        account_uuid = account['account']['uuid']
+        idempotency_key = str(uuid.uuid4())
+
+        make_withdrawal(
+            account_uuid, 50000000000, time=open_time,
+            idempotency_key=idempotency_key)
+
+        with pytest.raises(requests.HTTPError) as error:
+            make_withdrawal(
+                account_uuid, 40000000000, time=open_time,
+                idempotency_key=idempotency_key)
+        assert '409' in str(error.value)
+
+
+class TestTotals:
+
+    def test_customer_totals(self):
+        open_time = datetime(year=2017, month=10, day=1)
+        check_time = datetime(year=2017, month=11, day=1)
+
+        customer_uuid = new_customer()['customer']['uuid']
+        first = new_account(
+            apr=35,
+            max_credit=100000000000,
+            time_opened=open_time,
+            customer_uuid=customer_uuid)['account']['uuid']
+        new_account(
+            apr=35,
+            max_credit=50000000000,
+            time_opened=open_time,
+            customer_uuid=customer_uuid)
+
+        make_withdrawal(first, 30000000000, time=open_time)
+        make_payment(first, 10000000000, time=open_time)
+
+        response = get_customer_totals(customer_uuid)
+
+        assert response == {
+            'customerUUID': customer_uuid,
+            'totals': {
+                'accounts': 2,
+                'principalOwed': 20000000000,
+                'interestOwed': 0,
+                'availableCredit': 130000000000,
+            },
+        }
+
+        account = get_account(first, check_time)['account']
+        totals = get_customer_totals(customer_uuid)['totals']
+
+        assert account['interestOwed'] > 0
+        assert totals['interestOwed'] == account['interestOwed']
+        assert totals['availableCredit'] == (
+            130000000000 - account['interestOwed'])
+
+    def test_customer_without_accounts(self):
+        customer_uuid = new_customer()['customer']['uuid']
+
+        assert get_customer_totals(customer_uuid)['totals'] == {
+            'accounts': 0,
+            'principalOwed': 0,
+            'interestOwed': 0,
+            'availableCredit': 0,
+        }
+
+    def test_portfolio_totals(self):
+        open_time = datetime(year=2017, month=10, day=1)
+
+        before = get_portfolio_totals()['totals']
+
+        account = new_account(
+            apr=35,
+            max_credit=100000000000,
+            time_opened=open_time)
+        make_withdrawal(account['account']['uuid'], 40000000000,
+                        time=open_time)
+
+        after = get_portfolio_totals()['totals']
+
+        assert {total: after[total] - before[total] for total in after} == {
+            'accounts': 1,
+            'principalOwed': 40000000000,
+            'interestOwed': 0,
+            'availableCredit': 60000000000,
+        }
+
+
+class TestSimulate:
+
+    def test_simulate_payoff(self):
+        open_time = datetime(year=2017, month=10, day=1)
+        simulate_time = datetime(year=2017, month=10, day=11)
+
+        account_uuid = new_account(
+            apr=35,
+            max_credit=100000000000,
+            time_opened=open_time)['account']['uuid']
+        make_withdrawal(account_uuid, 1000000000, time=open_time)
+
+        response = simulate(
+            account_uuid, [600000000, 10000000], simulate_time,
+            periods=12, includeBalances=True)
+
+        assert response['account']['principalOwed'] == 1000000000
+        paid_off, not_paid_off = response['simulations']
+
+        assert paid_off == {
+            'payment': 600000000,
+            'payoffPeriods': 2,
+            'payoffTime': '2017-11-30T00:00:00+00:00',
+            'totalInterest': 41101520,
+            'totalPaid': 1041101520,
+            'principalOwed': 0,
+            'interestOwed': 0,
+            'balances': [{
+                'time': '2017-10-31T00:00:00+00:00',
+                'interest': 28767123,
+                'payment': 600000000,
+                'principalOwed': 428767123,
+                'interestOwed': 0,
+            }, {
+                'time': '2017-11-30T00:00:00+00:00',
+                'interest': 12334397,
+                'payment': 441101520,
+                'principalOwed': 0,
+                'interestOwed': 0,
+            }],
+        }
+
+        # The payment doesn't cover the interest, which keeps adding up.
+        assert not_paid_off['payoffPeriods'] is None
+        assert not_paid_off['payoffTime'] is None
+        assert len(not_paid_off['balances']) == 12
+        assert not_paid_off['interestOwed'] > 0
+
+        assert get_account(account_uuid, simulate_time)['account'] == (
+            response['account'])
+
+    def test_without_balances(self):
+        account_uuid = new_account(
+            apr=35,
+            max_credit=100000000000)['account']['uuid']
+
+        response = simulate(account_uuid, [1000000], datetime.now())
+
+        assert response['simulations'] == [{
+            'payment': 1000000,
+            'payoffPeriods': 0,
+            'payoffTime': response['simulations'][0]['payoffTime'],
+            'totalInterest': 0,
+            'totalPaid': 0,
+            'principalOwed': 0,
+            'interestOwed': 0,
+        }]
+
+
+class TestListing:
+
+    def test_list_customers(self):
+        domain = "{}.fair.com".format(uuid.uuid4().hex)
+        customers = [
+            new_customer(email="{}@{}".format(name, domain))['customer']
+            for name in ("a_b", "a%b", "ab")
+        ]
+        customers.sort(key=lambda customer: customer['uuid'])
+
+        listed = []
+        params = {"emailPrefix": "a_b@" + domain[:8], "limit": 1}
+        response = list_customers(params)
+        assert response['customers'] == [
+            customer for customer in customers
+            if customer['email'].startswith("a_b@")]
+        assert response['nextCursor'] is None
+
+        params = {"limit": 2}
+        while True:
+            response = list_customers(params)
+            listed += response['customers']
+            if response['nextCursor'] is None:
+                break
+            assert len(response['customers']) == 2
+            params['cursor'] = response['nextCursor']
+
+        assert [
+            customer for customer in listed
+            if customer['email'].endswith(domain)] == customers
+
+    def test_list_customers_by_email(self):
+        email = "{}@fair.com".format(uuid.uuid4().hex)
+        customer = new_customer(email=email)['customer']
+
+        assert list_customers({"email": email}) == {
+            'customers': [customer],
+            'nextCursor': None,
+        }
+        assert list_customers({"email": email.upper()})['customers'] == []
+
+    def test_list_accounts(self):
+        open_time = datetime(year=2017, month=10, day=1)
+
+        customer_uuid = new_customer()['customer']['uuid']
+        accounts = [
+            new_account(
+                apr=35,
+                max_credit=100000000000,
+                time_opened=open_time,
+                customer_uuid=customer_uuid)['account']
+            for _ in range(3)
+        ]
+        accounts.sort(key=lambda account: account['uuid'])
+        accounts[1] = make_withdrawal(
+            accounts[1]['uuid'], 30000000000, time=open_time)['account']
+
+        first = list_accounts(customer_uuid, {"limit": 2})
+
+        assert first == {
+            'customerUUID': customer_uuid,
+            'accounts': accounts[:2],
+            'nextCursor': accounts[1]['uuid'],
+        }
+
+        second = list_accounts(
+            customer_uuid, {"limit": 2, "cursor": first['nextCursor']})
+
+        assert second['accounts'] == accounts[2:]
+        assert second['nextCursor'] is None
+
+    def test_customer_without_accounts(self):
+        customer_uuid = new_customer()['customer']['uuid']
+
+        assert list_accounts(customer_uuid) == {
+            'customerUUID': customer_uuid,
+            'accounts': [],
+            'nextCursor': None,
+        }
+
 
 class TestNegative:
 
@@ -277,11 +941,80 @@ class TestNegative:
             response = get_customer(str(uuid.uuid4()))
             assert response.status_code == 404
 
+    def test_non_existing_customer_totals(self):
+        with pytest.raises(requests.HTTPError):
+            response = get_customer_totals(str(uuid.uuid4()))
+            assert response.status_code == 404
+
+    def test_non_existing_customer_accounts(self):
+        with pytest.raises(requests.HTTPError):
+            response = list_accounts(str(uuid.uuid4()))
+            assert response.status_code == 404
+
+    def test_malformed_customer_uuid(self):
+        for request in (get_customer, get_customer_totals, list_accounts):
+            with pytest.raises(requests.HTTPError) as error:
+                request("not a uuid")
+            assert '404' in str(error.value)
+
+    def test_invalid_listing(self):
+        with pytest.raises(requests.HTTPError):
+            response = list_customers({"limit": 0})
+            assert response.status_code == 422
+
+        with pytest.raises(requests.HTTPError):
+            response = list_customers({"cursor": "not a uuid"})
+            assert response.status_code == 422
+
+    def test_simulate_non_existing_account(self):
+        with pytest.raises(requests.HTTPError):
+            response = simulate(str(uuid.uuid4()), [1000000], datetime.now())
+            assert response.status_code == 404
+
+    def test_invalid_simulation(self):
+        account_uuid = new_account(
+            apr=35,
+            max_credit=50000000000)['account']['uuid']
+
+        for payments in ([], [0], [1000000] * 101):
+            with pytest.raises(requests.HTTPError):
+                response = simulate(account_uuid, payments, datetime.now())
+                assert response.status_code == 422
+
     def test_non_existing_account(self):
         with pytest.raises(requests.HTTPError):
             response = get_account(str(uuid.uuid4()))
             assert response.status_code == 404
 
+    def test_non_existing_account_interest(self):
+        with pytest.raises(requests.HTTPError):
+            response = get_interest(str(uuid.uuid4()))
+            assert response.status_code == 404
+
+    def test_non_existing_account_history(self):
+        with pytest.raises(requests.HTTPError):
+            response = get_history(str(uuid.uuid4()))
+            assert response.status_code == 404
+
+    def test_malformed_account_uuid_interest(self):
+        with pytest.raises(requests.HTTPError) as error:
+            get_interest("not a uuid")
+        assert '404' in str(error.value)
+
+    def test_malformed_account_uuid_history(self):
+        with pytest.raises(requests.HTTPError) as error:
+            get_history("not a uuid")
+        assert '404' in str(error.value)
+
+    def test_malformed_account_uuid(self):
+        with pytest.raises(requests.HTTPError):
+            response = make_payment("not a uuid", 10000000000)
+            assert response.status_code == 404
+
+        with pytest.raises(requests.HTTPError):
+            response = get_account("not a uuid")
+            assert response.status_code == 404
+
     def test_make_invalid_payment(self):
         account = new_account(
             apr=35,
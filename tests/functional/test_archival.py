@@ -0,0 +1,218 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from flask import current_app
+
+from app.aio import queries
+from app.aio.app import create_pool
+from app.controllers.accounts import AccountController
+from app.controllers.customer import CustomerController
+from app.utilities import create_partitions, get_config
+from app.utilities.partitions import partition_name, PARTITIONED_TABLES
+from schema import Balance
+
+# The snapshot interval of defaults.yml, before the tests change it.
+SNAPSHOT_INTERVAL = get_config().ledger.snapshot_interval
+
+
+@pytest.fixture(autouse=True)
+def snapshot_every_balance(monkeypatch):
+    # Every balance is recorded, so there are some to compact.
+    monkeypatch.setitem(get_config().ledger, 'snapshot_interval', 1)
+
+
+def new_account(apr, max_credit, time_opened):
+    customer = CustomerController.add('bob@test.com', 'Bob', 'Loblaw')
+    return AccountController.open_account(
+        customer['uuid'], apr, max_credit, time_opened)
+
+
+def compact(account_uuid, before):
+    next_uuid = str(uuid.UUID(int=uuid.UUID(account_uuid).int + 1))
+    return AccountController.compact_balances(
+        before, lower_uuid=account_uuid, upper_uuid=next_uuid)
+
+
+def balance_times(account_uuid):
+    return [time for time, in current_app.db.query(Balance.time).filter(
+        Balance.credit_account_uuid == account_uuid
+    ).order_by(Balance.time, Balance.seq)]
+
+
+def make_transactions(account_uuid, open_time):
+    for day in range(0, 100, 5):
+        AccountController.withdrawal(
+            account_uuid, 1000000000, open_time + timedelta(days=day))
+        AccountController.payment(
+            account_uuid, 500000000, open_time + timedelta(days=day + 2))
+
+
+class TestCompactBalances:
+
+    def test_keeps_last_balance_of_each_pay_period(self, context):
+        open_time = datetime(year=2017, month=10, day=1)
+        account = new_account(35, 100000000000, open_time)
+        make_transactions(account['uuid'], open_time)
+        AccountController.get_account(
+            account['uuid'], open_time + timedelta(days=150))
+
+        before = balance_times(account['uuid'])
+        assert compact(
+            account['uuid'], open_time + timedelta(days=200)) > 0
+        after = balance_times(account['uuid'])
+
+        # Interest was accrued through day 150, the pay periods from day 120
+        # on are left for the next accrual.
+        window_start = open_time + timedelta(days=120)
+        assert [time for time in after if time >= window_start] == [
+            time for time in before if time >= window_start]
+        assert [time for time in after if time < window_start] == [
+            open_time + timedelta(days=days)
+            for days in (0, 27, 57, 87, 97)]
+
+        assert compact(account['uuid'], open_time + timedelta(days=200)) == 0
+
+    def test_accrual_after_compaction(self, context):
+        open_time = datetime(year=2017, month=10, day=1)
+        # Opened later, so it isn't compacted.
+        later = timedelta(days=3000)
+        compacted = new_account(35, 100000000000, open_time)
+        kept = new_account(35, 100000000000, open_time + later)
+
+        for account, offset in ((compacted, timedelta()), (kept, later)):
+            make_transactions(account['uuid'], open_time + offset)
+            AccountController.get_account(
+                account['uuid'], open_time + offset + timedelta(days=150))
+
+        compact(compacted['uuid'], open_time + timedelta(days=200))
+
+        for days in (185, 400):
+            result = AccountController.get_account(
+                compacted['uuid'], open_time + timedelta(days=days))
+            expected = AccountController.get_account(
+                kept['uuid'], open_time + later + timedelta(days=days))
+
+            assert result['interest_owed'] == expected['interest_owed']
+            assert result['principal_owed'] == expected['principal_owed']
+
+
+def history(account_uuid, since=None):
+    """ The history of an account as both apps list it, without the uuids
+    of the balances, which are derived from the ledger once replayed. """
+    async def read_async_history():
+        pool = await create_pool()
+        try:
+            return [entry async for entry in queries.get_history(
+                pool, account_uuid, since)]
+        finally:
+            await pool.close()
+
+    loop = asyncio.new_event_loop()
+    try:
+        async_history = loop.run_until_complete(read_async_history())
+    finally:
+        loop.close()
+
+    return [
+        [dict(entry, uuid=None) if entry['type'] == 'balance' else entry
+         for entry in entries]
+        for entries in (
+            list(AccountController.get_history(account_uuid, since)),
+            async_history)
+    ]
+
+
+class TestCompactedHistory:
+
+    @pytest.fixture(autouse=True)
+    def default_snapshot_interval(self, monkeypatch):
+        monkeypatch.setitem(
+            get_config().ledger, 'snapshot_interval', SNAPSHOT_INTERVAL)
+
+    def test_history_after_compaction(self, context):
+        open_time = datetime(year=2017, month=10, day=1)
+        account = new_account(35, 100000000000, open_time)
+        for day in range(1, 26):
+            AccountController.withdrawal(
+                account['uuid'], 1000000000, open_time + timedelta(days=day))
+        AccountController.get_account(
+            account['uuid'], open_time + timedelta(days=150))
+        # Replayed from before the snapshot after the 10th withdrawal, which
+        # is compacted.
+        since = open_time + timedelta(days=15)
+
+        before = history(account['uuid']), history(account['uuid'], since)
+        assert compact(
+            account['uuid'], open_time + timedelta(days=200)) > 0
+        after = history(account['uuid']), history(account['uuid'], since)
+
+        assert after == before
+        # Each app lists a balance after each of the 25 withdrawals and 5
+        # interest accruals, and the opening balance.
+        for entries in before[0]:
+            assert [entry['type'] for entry in entries].count(
+                'balance') == 31
+
+    def test_history_without_first_balance(self, context):
+        open_time = datetime(year=2017, month=10, day=1)
+        account = new_account(35, 100000000000, open_time)
+        for day in range(1, 13):
+            AccountController.withdrawal(
+                account['uuid'], 1000000000, open_time + timedelta(days=day))
+        before = history(account['uuid'])
+
+        # As left by compactions that deleted the first balance too.
+        current_app.db.query(Balance).filter(
+            Balance.credit_account_uuid == account['uuid'],
+            Balance.seq == 0).delete()
+        current_app.db.commit()
+
+        assert [
+            [entry for entry in entries if entry['time'] != open_time]
+            for entries in before
+        ] == history(account['uuid'])
+
+
+@pytest.fixture
+def partition_year(context):
+    """ A year without partitions. The partitions the test creates for it
+    are dropped afterwards, with their rows moved back to the default
+    partitions. """
+    year = 2090
+    yield year
+
+    current_app.db.rollback()
+    for table in PARTITIONED_TABLES:
+        name = partition_name(table, year)
+        if current_app.db.execute(
+                "SELECT to_regclass(:name)", dict(name=name)).scalar():
+            current_app.db.execute(
+                'ALTER TABLE {} DETACH PARTITION {}'.format(table, name))
+            current_app.db.execute(
+                'INSERT INTO {} SELECT * FROM {}'.format(table, name))
+            current_app.db.execute('DROP TABLE {}'.format(name))
+    current_app.db.commit()
+
+
+class TestCreatePartitions:
+
+    def test_moves_rows_out_of_default_partition(self, partition_year):
+        open_time = datetime(year=partition_year, month=3, day=1)
+        account = new_account(35, 100000000000, open_time)
+        AccountController.withdrawal(account['uuid'], 1000000000, open_time)
+
+        assert create_partitions(
+            current_app.db, partition_year, partition_year) == [
+            partition_name(table, partition_year)
+            for table in PARTITIONED_TABLES]
+        current_app.db.commit()
+
+        partitions = current_app.db.execute(
+            "SELECT DISTINCT tableoid::regclass::text FROM balance "
+            "WHERE credit_account_uuid = :uuid", dict(uuid=account['uuid'])
+        ).fetchall()
+        assert partitions == [(partition_name('balance', partition_year),)]
+        assert create_partitions(
+            current_app.db, partition_year, partition_year) == []
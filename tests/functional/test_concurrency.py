@@ -0,0 +1,156 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+
+from app.controllers.accounts import AccountController
+from app.controllers.customer import CustomerController
+from app.utilities import APIError, SC
+
+# Writes to the database directly, from as many threads as the connection
+# pool allows, so several transactions hit the same account at once.
+THREADS = 8
+
+
+def run_concurrently(app, func, calls):
+    def run(args):
+        with app.app_context():
+            try:
+                return func(*args)
+            except APIError as ex:
+                return ex
+            finally:
+                current_app.db.remove()
+
+    with ThreadPoolExecutor(THREADS) as executor:
+        return list(executor.map(run, calls))
+
+
+def new_account(app, apr, max_credit, time_opened):
+    with app.app_context():
+        customer = CustomerController.add(
+            'bob@test.com', 'Bob', 'Loblaw')
+        account = AccountController.open_account(
+            customer['uuid'], apr, max_credit, time_opened)
+        current_app.db.remove()
+    return account
+
+
+def make_transaction(transaction, account_uuid, amount, time):
+    return transaction(account_uuid, amount, time)
+
+
+def get_account(app, account_uuid, time):
+    with app.app_context():
+        account = AccountController.get_account(account_uuid, time)
+        current_app.db.remove()
+    return account
+
+
+def get_history(app, account_uuid):
+    with app.app_context():
+        history = list(AccountController.get_history(account_uuid))
+        current_app.db.remove()
+    return history
+
+
+class TestConcurrency:
+
+    def test_concurrent_withdrawals(self, app):
+        open_time = datetime(year=2017, month=10, day=1)
+        withdrawal_time = datetime(year=2017, month=10, day=2)
+
+        account = new_account(app, 35, 100000000000, open_time)
+
+        results = run_concurrently(
+            app, AccountController.withdrawal,
+            [(account['uuid'], 1000000000, withdrawal_time)] * 50)
+
+        assert not [
+            result for result in results if isinstance(result, APIError)]
+
+        history = get_history(app, account['uuid'])
+        withdrawals = [
+            entry for entry in history if entry['type'] == 'withdrawal']
+        result = get_account(app, account['uuid'], withdrawal_time)
+
+        assert len(withdrawals) == 50
+        assert result['principal_owed'] == 50000000000
+        assert result['available_credit'] == 50000000000
+
+    def test_concurrent_withdrawals_over_limit(self, app):
+        open_time = datetime(year=2017, month=10, day=1)
+        withdrawal_time = datetime(year=2017, month=10, day=2)
+
+        account = new_account(app, 35, 10000000000, open_time)
+
+        results = run_concurrently(
+            app, AccountController.withdrawal,
+            [(account['uuid'], 1000000000, withdrawal_time)] * 20)
+
+        errors = [
+            result for result in results if isinstance(result, APIError)]
+
+        assert len(errors) == 10
+        assert all(
+            error.status_code == SC.UNPROCESSABLE for error in errors)
+
+        history = get_history(app, account['uuid'])
+        withdrawals = [
+            entry for entry in history if entry['type'] == 'withdrawal']
+        result = get_account(app, account['uuid'], withdrawal_time)
+
+        assert len(withdrawals) == 10
+        assert result['available_credit'] == 0
+
+    def test_concurrent_payments_and_withdrawals(self, app):
+        open_time = datetime(year=2017, month=10, day=1)
+        withdrawal_time = datetime(year=2017, month=10, day=2)
+        payment_time = datetime(year=2017, month=10, day=3)
+
+        account = new_account(app, 35, 100000000000, open_time)
+
+        run_concurrently(
+            app, AccountController.withdrawal,
+            [(account['uuid'], 2000000000, withdrawal_time)] * 20)
+        results = run_concurrently(
+            app, make_transaction,
+            [(AccountController.payment, account['uuid'], 1000000000,
+              payment_time),
+             (AccountController.withdrawal, account['uuid'], 500000000,
+              payment_time)] * 20)
+
+        assert not [
+            result for result in results if isinstance(result, APIError)]
+
+        history = get_history(app, account['uuid'])
+        transactions = [
+            entry for entry in history if entry['type'] != 'balance']
+        result = get_account(app, account['uuid'], payment_time)
+
+        assert len(transactions) == 60
+        assert result['principal_owed'] == 30000000000
+
+    def test_concurrent_interest_accrual(self, app):
+        open_time = datetime(year=2017, month=10, day=1)
+        check_time = datetime(year=2017, month=10, day=31)
+
+        account = new_account(app, 35, 100000000000, open_time)
+
+        run_concurrently(
+            app, AccountController.withdrawal,
+            [(account['uuid'], 50000000000, open_time)])
+        results = run_concurrently(
+            app, AccountController.get_account,
+            [(account['uuid'], check_time)] * 20)
+
+        assert all(
+            result['interest_owed'] == 1438356164 for result in results)
+
+        with app.app_context():
+            accruals = AccountController.get_interest_accruals(
+                account['uuid'])
+            current_app.db.remove()
+
+        assert len(accruals['accruals']) == 1
+        assert accruals['total_interest'] == 1438356164
@@ -0,0 +1,75 @@
+import uuid
+from datetime import datetime
+
+from flask import current_app
+
+from app.controllers.accounts import AccountController
+from app.controllers.customer import CustomerController
+from app.utilities import get_config
+from schema import InterestAccrual
+
+
+def new_account(apr, max_credit, time_opened):
+    customer = CustomerController.add('bob@test.com', 'Bob', 'Loblaw')
+    return AccountController.open_account(
+        customer['uuid'], apr, max_credit, time_opened)
+
+
+class TestInterestAccruals:
+
+    def test_scheduler_records_accruals(self, context):
+        open_time = datetime(year=2017, month=10, day=1)
+
+        scheduled = new_account(35, 100000000000, open_time)
+        requested = new_account(35, 100000000000, open_time)
+        for account in (scheduled, requested):
+            AccountController.withdrawal(
+                account['uuid'], 50000000000,
+                datetime(year=2017, month=10, day=11))
+
+        # Only the scheduled account is accrued by the scheduler.
+        next_uuid = str(uuid.UUID(int=uuid.UUID(scheduled['uuid']).int + 1))
+        AccountController.accrue_due_interest(
+            datetime(year=2018, month=1, day=1),
+            lower_uuid=scheduled['uuid'], upper_uuid=next_uuid)
+        AccountController.get_account(
+            requested['uuid'], datetime(year=2018, month=1, day=1))
+
+        accruals = AccountController.get_interest_accruals(scheduled['uuid'])
+
+        assert accruals == AccountController.get_interest_accruals(
+            requested['uuid'])
+        assert [accrual['principal_days'] for accrual in accruals[
+            'accruals']] == [20 * 50000000000] + [30 * 50000000000] * 2
+        assert accruals['total_interest'] == 3835616438
+
+    def test_backfill(self, context, monkeypatch):
+        # Accounts from before the ledger have a balance recorded for every
+        # payment, withdrawal and interest accrual.
+        monkeypatch.setitem(get_config().ledger, 'snapshot_interval', 1)
+        open_time = datetime(year=2017, month=10, day=1)
+
+        account = new_account(35, 100000000000, open_time)
+        AccountController.withdrawal(
+            account['uuid'], 50000000000,
+            datetime(year=2017, month=10, day=11))
+        AccountController.payment(
+            account['uuid'], 20000000000,
+            datetime(year=2017, month=11, day=15))
+        AccountController.get_account(
+            account['uuid'], datetime(year=2018, month=1, day=1))
+
+        recorded = AccountController.get_interest_accruals(account['uuid'])
+
+        # Accruals recorded before the interest_accrual table existed.
+        current_app.db.query(InterestAccrual).filter(
+            InterestAccrual.credit_account_uuid == account['uuid'],
+            InterestAccrual.period_end > datetime(year=2017, month=11, day=1)
+        ).delete()
+        current_app.db.commit()
+
+        assert AccountController.backfill_interest_accruals() >= 2
+        assert AccountController.get_interest_accruals(
+            account['uuid']) == recorded
+
+        assert AccountController.backfill_interest_accruals() == 0
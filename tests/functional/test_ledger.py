@@ -0,0 +1,92 @@
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app.controllers.accounts import AccountController
+from app.controllers.customer import CustomerController
+from app.utilities import get_config
+from schema import Balance, CreditAccount
+
+
+def run_account(open_time):
+    """ Runs payments, withdrawals and interest accruals on a new account
+    through every write path, returning the account read after each. """
+    customer = CustomerController.add('bob@test.com', 'Bob', 'Loblaw')
+    account = AccountController.open_account(
+        customer['uuid'], 35, 100000000000, open_time)
+    account_uuid = account['uuid']
+    results = []
+
+    for day in range(0, 100, 7):
+        AccountController.withdrawal(
+            account_uuid, 3000000000, open_time + timedelta(days=day))
+        results.append(AccountController.payment(
+            account_uuid, 1000000000, open_time + timedelta(days=day + 3)))
+
+    results.append(AccountController.get_account(
+        account_uuid, open_time + timedelta(days=150)))
+
+    results.extend(result['account'] for result in (
+        AccountController.bulk_transactions([
+            dict(account_uuid=account_uuid, type='withdrawal',
+                 amount=2000000000,
+                 time=open_time + timedelta(days=day))
+            for day in range(160, 230, 5)
+        ])))
+
+    next_uuid = str(uuid.UUID(int=uuid.UUID(account_uuid).int + 1))
+    AccountController.accrue_due_interest(
+        open_time + timedelta(days=300), lower_uuid=account_uuid,
+        upper_uuid=next_uuid)
+    results.append(AccountController.get_account(
+        account_uuid, open_time + timedelta(days=310)))
+
+    balances = current_app.db.query(Balance).filter(
+        Balance.credit_account_uuid == account_uuid).count()
+    return [
+        {key: value for key, value in result.items() if key != 'uuid'}
+        for result in results
+    ], balances, account_uuid
+
+
+class TestLedger:
+
+    def test_snapshot_interval(self, context, monkeypatch):
+        open_time = datetime(year=2017, month=10, day=1)
+
+        runs = {}
+        for interval in (1, 4, 10):
+            monkeypatch.setitem(
+                get_config().ledger, 'snapshot_interval', interval)
+            runs[interval] = run_account(open_time)
+
+        results, balances, _ = runs[1]
+        assert runs[4][0] == results
+        assert runs[10][0] == results
+
+        # The opening balance and a balance for every entry of the ledger:
+        # 44 payments and withdrawals and 10 interest accruals.
+        assert balances == 55
+        assert runs[4][1] == 1 + 54 // 4
+        assert runs[10][1] == 1 + 54 // 10
+
+    def test_replays_entries_after_snapshot(self, context, monkeypatch):
+        monkeypatch.setitem(get_config().ledger, 'snapshot_interval', 10)
+        open_time = datetime(year=2017, month=10, day=1)
+
+        customer = CustomerController.add('bob@test.com', 'Bob', 'Loblaw')
+        account = AccountController.open_account(
+            customer['uuid'], 35, 100000000000, open_time)
+        for _ in range(13):
+            AccountController.withdrawal(
+                account['uuid'], 1000000000, open_time)
+
+        credit_account = current_app.db.query(CreditAccount).get(
+            account['uuid'])
+        assert (credit_account.ledger_seq, credit_account.snapshot_seq) == (
+            13, 10)
+
+        result = AccountController.get_account(account['uuid'], open_time)
+        assert result['principal_owed'] == 13000000000
+        assert result['available_credit'] == 87000000000
@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta
+
+from app.controllers.accounts import AccountController
+from app.controllers.customer import CustomerController
+from app.controllers.reporting import ReportingController
+
+
+class TestRebuildTotals:
+
+    def test_matches_incremental_totals(self, context):
+        open_time = datetime(year=2017, month=10, day=1)
+
+        customer = CustomerController.add('bob@test.com', 'Bob', 'Loblaw')
+        accounts = [
+            AccountController.open_account(
+                customer['uuid'], 35, 100000000000, open_time)['uuid']
+            for _ in range(3)
+        ]
+
+        AccountController.withdrawal(accounts[0], 20000000000, open_time)
+        AccountController.payment(
+            accounts[0], 5000000000, open_time + timedelta(days=40))
+        AccountController.bulk_transactions([
+            dict(account_uuid=account_uuid, type='withdrawal',
+                 amount=10000000000, time=open_time + timedelta(days=day))
+            for account_uuid in accounts[1:]
+            for day in (0, 35, 70)
+        ])
+        AccountController.accrue_due_interest(
+            open_time + timedelta(days=120))
+
+        customer_totals = CustomerController.get_totals(customer['uuid'])
+        portfolio_totals = ReportingController.get_portfolio_totals()
+        assert customer_totals['totals']['interest_owed'] > 0
+
+        assert AccountController.rebuild_totals(batch_size=2) >= 3
+
+        assert CustomerController.get_totals(
+            customer['uuid']) == customer_totals
+        assert ReportingController.get_portfolio_totals() == portfolio_totals
@@ -0,0 +1,149 @@
+import pytest
+
+from app.utilities.cache import LRUCache, make_cache, RedisCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.time = 0
+
+    def __call__(self):
+        return self.time
+
+
+class FakeRedisError(Exception):
+    pass
+
+
+class FakeRedis:
+    """ Stands in for a Redis client, keeping the values in a dict. """
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+        self.down = False
+
+    def _check(self):
+        if self.down:
+            raise FakeRedisError('Connection refused')
+
+    def get(self, key):
+        self._check()
+        return self.data.get(key)
+
+    def set(self, key, value, px=None):
+        self._check()
+        assert isinstance(value, bytes)
+        self.data[key] = value
+        self.ttls[key] = px
+
+    def delete(self, key):
+        self._check()
+        self.data.pop(key, None)
+
+
+class TestLRUCache:
+
+    def test_get_and_set(self):
+        cache = LRUCache(max_size=10, ttl=60)
+
+        assert cache.get('a') is None
+        cache.set('a', 1)
+
+        assert cache.get('a') == 1
+        assert cache.stats == dict(hits=1, misses=1, size=1)
+
+    def test_least_recently_used_evicted(self):
+        cache = LRUCache(max_size=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+        assert len(cache) == 2
+
+    def test_entries_expire(self):
+        clock = FakeClock()
+        cache = LRUCache(max_size=10, ttl=60, clock=clock)
+        cache.set('a', 1)
+
+        clock.time = 59
+        assert cache.get('a') == 1
+
+        clock.time = 60
+        assert cache.get('a') is None
+        assert len(cache) == 0
+
+    def test_invalid_entries_removed(self):
+        cache = LRUCache(max_size=10, ttl=60)
+        cache.set('a', 1)
+
+        assert cache.get('a', valid=lambda value: value > 1) is None
+        assert cache.get('a') is None
+        assert cache.stats == dict(hits=0, misses=2, size=0)
+
+    def test_delete(self):
+        cache = LRUCache(max_size=10, ttl=60)
+        cache.set('a', 1)
+        cache.delete('a')
+        cache.delete('b')
+
+        assert cache.get('a') is None
+
+
+class TestRedisCache:
+
+    @pytest.fixture
+    def client(self):
+        return FakeRedis()
+
+    def make_cache(self, client):
+        return RedisCache(
+            client, ttl=30, prefix='account:', errors=(FakeRedisError,))
+
+    def test_shared_between_caches(self, client):
+        worker_1 = self.make_cache(client)
+        worker_2 = self.make_cache(client)
+
+        worker_1.set('a', {'uuid': 'a', 'principal_owed': 1})
+
+        assert worker_2.get('a') == {'uuid': 'a', 'principal_owed': 1}
+        assert client.ttls['account:a'] == 30000
+
+        worker_2.delete('a')
+
+        assert worker_1.get('a') is None
+        assert worker_1.stats == dict(hits=0, misses=1)
+        assert worker_2.stats == dict(hits=1, misses=0)
+
+    def test_invalid_entries_removed(self, client):
+        cache = self.make_cache(client)
+        cache.set('a', 1)
+
+        assert cache.get('a', valid=lambda value: value > 1) is None
+        assert client.data == {}
+
+    def test_errors_are_misses(self, client):
+        cache = self.make_cache(client)
+        cache.set('a', 1)
+        client.down = True
+
+        cache.set('a', 2)
+        cache.delete('a')
+        assert cache.get('a') is None
+
+        client.down = False
+        assert cache.get('a') == 1
+
+
+class TestMakeCache:
+
+    def test_memory_backend(self):
+        cache = make_cache(dict(backend='memory', max_size=10, ttl_seconds=5))
+
+        assert isinstance(cache, LRUCache)
+        assert cache.max_size == 10
+        assert cache.ttl == 5
@@ -0,0 +1,190 @@
+from time import monotonic
+
+import pytest
+from flask import Flask
+from sqlalchemy.pool import NullPool
+
+from app.utilities import db
+from app.utilities.cache import LRUCache
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, statement):
+        self.connection.statements.append(statement)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.statements = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+class FakeConnectionRecord:
+    def __init__(self, **info):
+        self.info = info
+
+
+def settings(**overrides):
+    values = dict(
+        url='postgresql://postgres@localhost/credit',
+        echo=False,
+        pool=dict(
+            size=5, max_overflow=10, timeout_seconds=60,
+            recycle_seconds=3500, pre_ping='idle', ping_idle_seconds=30),
+        statement_timeout_ms=0,
+        pgbouncer=False)
+    values.update(overrides)
+    return values
+
+
+class TestEngineOptions():
+    def test_pool(self):
+        options = db.engine_options(settings())
+
+        assert options == dict(
+            echo=False,
+            poolclass=db.TimedQueuePool,
+            pool_size=5,
+            max_overflow=10,
+            pool_timeout=60,
+            pool_recycle=3500)
+
+    def test_statement_timeout(self):
+        options = db.engine_options(settings(statement_timeout_ms=1500))
+
+        assert options['connect_args'] == dict(
+            options='-c statement_timeout=1500')
+
+    def test_pgbouncer(self):
+        options = db.engine_options(
+            settings(pgbouncer=True, statement_timeout_ms=1500))
+
+        assert options == dict(echo=False, poolclass=NullPool)
+
+
+class TestCheckout():
+    @pytest.mark.parametrize('pre_ping,info,pinged', [
+        ('always', {}, True),
+        ('always', {'checkin_time': monotonic()}, True),
+        ('idle', {}, False),
+        ('idle', {'checkin_time': monotonic()}, False),
+        ('idle', {'checkin_time': monotonic() - 60}, True),
+    ])
+    def test_pre_ping(self, monkeypatch, pre_ping, info, pinged):
+        monkeypatch.setitem(db.config.db.postgres.pool, 'pre_ping', pre_ping)
+        connection = FakeConnection()
+
+        db.checkout(connection, FakeConnectionRecord(**info), None)
+
+        assert connection.statements == (['SELECT 1'] if pinged else [])
+
+
+class FakeClock:
+    def __init__(self):
+        self.time = 0
+
+    def __call__(self):
+        return self.time
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def replica(monkeypatch, clock):
+    monkeypatch.setitem(
+        db.config.db.postgres, 'replica_url', 'postgresql://replica/credit')
+    monkeypatch.setattr(db, 'written_cache', LRUCache(2, 10, clock=clock))
+
+    app = Flask(__name__)
+    app.db = lambda: 'primary'
+    app.replica_db = lambda: 'replica'
+    with app.app_context():
+        yield
+
+
+class TestReadYourWrites():
+    def test_reads_written_records_from_primary(self, replica):
+        db.mark_written('a', 'b')
+
+        assert db.read_db('a') == 'primary'
+        assert db.read_db('b') == 'primary'
+        assert db.read_db('c') == 'replica'
+
+    def test_writes_become_stale(self, replica, clock):
+        db.mark_written('a')
+        clock.time = 10
+
+        assert not db.written_recently('a')
+        assert db.read_db('a') == 'replica'
+
+    def test_without_replica(self, monkeypatch, clock):
+        monkeypatch.setattr(db, 'written_cache', LRUCache(2, 10, clock=clock))
+        app = Flask(__name__)
+        app.db = lambda: 'primary'
+        with app.app_context():
+            db.mark_written('a')
+
+            assert len(db.written_cache) == 0
+            assert not db.written_recently('a')
+            assert db.get_replica_db() == 'primary'
+
+
+class FakeQuery:
+    def __init__(self, rows):
+        self.rows = rows
+        self.filters = []
+
+    def filter(self, condition):
+        self.filters.append(condition)
+        return self
+
+    def order_by(self, key):
+        return self
+
+    def limit(self, limit):
+        self.rows = self.rows[:limit]
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class FakeKey:
+    def __gt__(self, other):
+        return ('>', other)
+
+
+class TestKeysetPage():
+    @pytest.mark.parametrize('rows,page,more', [
+        ([1, 2, 3], [1, 2], True),
+        ([1, 2], [1, 2], False),
+        ([1], [1], False),
+        ([], [], False),
+    ])
+    def test_page(self, rows, page, more):
+        assert db.keyset_page(FakeQuery(rows), 'key', None, 2) == (page, more)
+
+    def test_cursor(self):
+        query = FakeQuery([])
+        db.keyset_page(query, FakeKey(), 'a', 2)
+
+        assert query.filters == [('>', 'a')]
+
+
+class TestLikePrefix():
+    def test_escapes_wildcards(self):
+        assert db.like_prefix('a_b%c\\') == 'a\\_b\\%c\\\\%'
+
+    def test_plain_prefix(self):
+        assert db.like_prefix('john.doe@') == 'john.doe@%'
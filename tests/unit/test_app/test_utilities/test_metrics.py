@@ -0,0 +1,137 @@
+from unittest.mock import Mock
+
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.pool import NullPool, QueuePool
+
+from app.utilities import metrics
+
+
+class TestRequestStats():
+    def test_records_slowest_query(self):
+        stats = metrics.RequestStats()
+        stats.record_query('SELECT 1', 2.0)
+        stats.record_query('SELECT 2', 5.0)
+        stats.record_query('SELECT 3', 1.0)
+
+        assert stats.query_count == 3
+        assert stats.db_milliseconds == 8.0
+        assert stats.slowest_query == 'SELECT 2'
+        assert stats.slowest_query_milliseconds == 5.0
+
+
+class TestTimed():
+    def test_times_sections_of_the_request(self):
+        with Flask(__name__).app_context():
+            stats = metrics.start_request_stats()
+
+            with metrics.timed('serialization'):
+                with metrics.timed('serialization'):
+                    pass
+            with metrics.timed('interest_calculation'):
+                pass
+
+            assert metrics.get_request_stats() is stats
+            assert set(stats.timings) == {
+                'serialization', 'interest_calculation'}
+            assert not stats._running
+
+    def test_without_request_stats(self):
+        with metrics.timed('serialization'):
+            pass
+
+        with Flask(__name__).app_context():
+            with metrics.timed('serialization'):
+                pass
+            assert metrics.get_request_stats() is None
+
+
+class TestQueryTimes():
+    def test_failed_statements(self):
+        engine = create_engine('sqlite://')
+        event.listen(
+            engine, 'before_cursor_execute', metrics.before_cursor_execute)
+        event.listen(
+            engine, 'after_cursor_execute', metrics.after_cursor_execute)
+        event.listen(engine, 'handle_error', metrics.handle_error)
+
+        with Flask(__name__).app_context():
+            stats = metrics.start_request_stats()
+            with engine.connect() as conn:
+                with pytest.raises(exc.OperationalError):
+                    conn.execute('SELECT * FROM missing')
+                conn.execute('SELECT 1')
+
+                assert conn.info['query_start_time'] == []
+            assert stats.query_count == 1
+
+
+class TestHistogram():
+    def test_render(self):
+        histogram = metrics.Histogram(
+            'request_seconds', 'Time spent.', ('endpoint',), (0.1, 1))
+        histogram.observe(0.05, endpoint='a')
+        histogram.observe(0.1, endpoint='a')
+        histogram.observe(0.5, endpoint='a')
+        histogram.observe(2, endpoint='a')
+        histogram.observe(2, endpoint='b"')
+
+        assert histogram.render().splitlines() == [
+            '# HELP request_seconds Time spent.',
+            '# TYPE request_seconds histogram',
+            'request_seconds_bucket{endpoint="a",le="0.1"} 2',
+            'request_seconds_bucket{endpoint="a",le="1"} 3',
+            'request_seconds_bucket{endpoint="a",le="+Inf"} 4',
+            'request_seconds_sum{endpoint="a"} 2.65',
+            'request_seconds_count{endpoint="a"} 4',
+            'request_seconds_bucket{endpoint="b\\"",le="0.1"} 0',
+            'request_seconds_bucket{endpoint="b\\"",le="1"} 0',
+            'request_seconds_bucket{endpoint="b\\"",le="+Inf"} 1',
+            'request_seconds_sum{endpoint="b\\""} 2',
+            'request_seconds_count{endpoint="b\\""} 1',
+        ]
+
+    def test_observe_request(self):
+        stats = metrics.RequestStats()
+        stats.record_query('SELECT 1', 20)
+        stats.timings['serialization'] = 1
+
+        metrics.observe_request('accounts.get_account', 'GET', 200, 50, stats)
+
+        rendered = metrics.render_metrics()
+        assert (
+            'http_request_duration_seconds_count{endpoint="accounts.'
+            'get_account",method="GET",status="200"}') in rendered
+        assert (
+            'http_request_db_queries_bucket{endpoint="accounts.get_account",'
+            'method="GET",le="1"}') in rendered
+        assert 'section="serialization"' in rendered
+
+
+class TestPoolMetrics():
+    def test_render_pool_metrics(self):
+        pool = QueuePool(lambda: Mock(), pool_size=2, max_overflow=2)
+        connection = pool.connect()
+
+        rendered = metrics.render_pool_metrics(pool)
+        connection.close()
+
+        assert 'db_pool_connections_checked_out 1\n' in rendered
+        assert 'db_pool_connections_max 4\n' in rendered
+        assert 'db_pool_saturation 0.25\n' in rendered
+        assert 'db_pool_timeouts_total 0\n' in rendered
+
+    def test_pools_without_connections(self):
+        assert metrics.render_pool_metrics(NullPool(lambda: Mock())) == ''
+
+    def test_histogram_without_labels(self):
+        histogram = metrics.Histogram('wait_seconds', 'Wait.', (), (1,))
+        histogram.observe(0.5)
+
+        assert histogram.render().splitlines()[2:] == [
+            'wait_seconds_bucket{le="1"} 1',
+            'wait_seconds_bucket{le="+Inf"} 1',
+            'wait_seconds_sum 0.5',
+            'wait_seconds_count 1',
+        ]
@@ -1,7 +1,9 @@
-from datetime import datetime
+import random
+from datetime import datetime, timedelta
 import app.utilities.payment_calc as calc
 
 import pytest
+from hypothesis import given, settings, strategies as st
 
 
 class TestMakePayment():
@@ -262,3 +264,418 @@ class TestGetMonthlyInterests():
         for i in range(len(interests)):
             assert int(test_interests[i][0]) == interests[i][0]
             assert test_interests[i][1] == interests[i][1]
+
+
+def _backward_scan_monthly_interests(
+        apr, pay_period, end_date, balance_history):
+    """ The original implementation of `get_monthly_interests`, which walks
+    the balance history backwards one pay period at a time. Kept as the
+    reference the current implementation is checked against. """
+    interests = []
+
+    first_balance = balance_history[0]
+    last_balance = balance_history[-1]
+    first_date = first_balance['time']
+
+    interest_calc_date = calc.get_interest_calc_date(
+        first_date, pay_period, end_date)
+
+    principal_owed = last_balance['principal_owed']
+
+    balance_index = len(balance_history) - 1
+    found_balances = False
+    while interest_calc_date > first_date:
+        previous_pay_date = interest_calc_date - timedelta(days=pay_period)
+
+        balances = [{
+            'time': interest_calc_date,
+            'principal_owed': 0
+        }]
+
+        while (balance_history[balance_index]['time'] >= previous_pay_date and
+               balance_index >= 0):
+
+            if balance_history[balance_index]['time'] <= interest_calc_date:
+                balances.append(balance_history[balance_index])
+
+            balance_index -= 1
+            found_balances = True
+
+        if balance_index >= 0:
+            principal_owed = balance_history[balance_index]['principal_owed']
+        else:
+            principal_owed = 0
+
+        balances.append({
+            'time': previous_pay_date,
+            'principal_owed': principal_owed
+        })
+
+        interest_amount = calc._calc_interest_over_balances(
+            apr, balances[::-1])
+
+        for interest in interests:
+            interest[0] += interest_amount
+
+        interests.append([interest_amount, interest_calc_date])
+
+        if found_balances:
+            break
+
+        interest_calc_date = previous_pay_date
+
+    return interests[::-1]
+
+
+@st.composite
+def balance_histories(draw):
+    opening_time = draw(st.datetimes(
+        min_value=datetime(year=2000, month=1, day=1),
+        max_value=datetime(year=2030, month=1, day=1)))
+
+    balance_history = [{'time': opening_time, 'principal_owed': 0}]
+    for days, seconds, principal_owed in draw(st.lists(st.tuples(
+            st.integers(0, 120),
+            st.integers(0, 86399),
+            st.integers(0, 10 ** 12)), max_size=20)):
+        balance_history.append({
+            'time': balance_history[-1]['time'] + timedelta(
+                days=days, seconds=seconds),
+            'principal_owed': principal_owed
+        })
+    return balance_history
+
+
+class TestGetMonthlyInterestsEquivalence():
+    @settings(max_examples=500, deadline=None)
+    @given(
+        apr=st.integers(0, 100),
+        pay_period=st.sampled_from([7, 30, 31]),
+        balance_history=balance_histories(),
+        days=st.integers(-10, 2500),
+        seconds=st.integers(0, 86399))
+    def test_matches_backward_scan(
+            self, apr, pay_period, balance_history, days, seconds):
+        end_date = balance_history[-1]['time'] + timedelta(
+            days=days, seconds=seconds)
+
+        assert calc.get_monthly_interests(
+            apr, pay_period, end_date, balance_history
+        ) == _backward_scan_monthly_interests(
+            apr, pay_period, end_date, balance_history)
+
+    def test_idle_for_years(self):
+        opening_time = datetime(year=2010, month=1, day=1)
+        balance_history = [
+            {'time': opening_time, 'principal_owed': 0},
+            {'time': opening_time, 'principal_owed': 50000000000},
+        ]
+        end_date = datetime(year=2016, month=1, day=1)
+
+        interests = calc.get_monthly_interests(
+            35, 30, end_date, balance_history)
+
+        assert len(interests) == 73
+        assert interests[-1] == [
+            73 * 1438356164, opening_time + timedelta(days=73 * 30)]
+        assert interests == _backward_scan_monthly_interests(
+            35, 30, end_date, balance_history)
+
+
+class TestGetPeriodAccruals():
+    def test_principal_days(self):
+        opening_time = datetime(year=2017, month=10, day=1)
+        balance_history = [
+            {'time': opening_time, 'principal_owed': 0},
+            {'time': opening_time + timedelta(days=10), 'principal_owed': 500},
+            {'time': opening_time + timedelta(days=40), 'principal_owed': 200},
+        ]
+
+        accruals = calc.get_period_accruals(
+            35, 30, datetime(year=2018, month=1, day=1), balance_history,
+            since=opening_time)
+
+        assert accruals == [
+            (opening_time + timedelta(days=30), 20 * 500, 10),
+            (opening_time + timedelta(days=60), 10 * 500 + 20 * 200, 9),
+            (opening_time + timedelta(days=90), 30 * 200, 6),
+        ]
+
+    @settings(max_examples=200, deadline=None)
+    @given(
+        apr=st.integers(0, 100),
+        balance_history=balance_histories(),
+        days=st.integers(-10, 2500))
+    def test_sum_to_monthly_interests(self, apr, balance_history, days):
+        end_date = balance_history[-1]['time'] + timedelta(days=days)
+
+        accruals = calc.get_period_accruals(
+            apr, 30, end_date, balance_history)
+        interests = calc.get_monthly_interests(
+            apr, 30, end_date, balance_history)
+
+        assert [end for end, _, _ in accruals] == [
+            end for _, end in interests]
+        assert sum(interest for _, _, interest in accruals) == (
+            interests[-1][0] if interests else 0)
+
+    @settings(max_examples=200, deadline=None)
+    @given(
+        apr=st.integers(0, 100),
+        balance_history=balance_histories(),
+        days=st.integers(-10, 2500))
+    def test_since_opening(self, apr, balance_history, days):
+        end_date = balance_history[-1]['time'] + timedelta(days=days)
+
+        accruals = calc.get_period_accruals(
+            apr, 30, end_date, balance_history,
+            since=balance_history[0]['time'])
+
+        # Every pay period since the account opened, ending with the ones
+        # calculated from the last pay period containing balances.
+        latest = calc.get_period_accruals(apr, 30, end_date, balance_history)
+        assert accruals[len(accruals) - len(latest):] == latest
+        assert [end for end, _, _ in accruals] == [
+            accruals[-1][0] - timedelta(days=30 * i)
+            for i in reversed(range(len(accruals)))
+        ]
+        assert not accruals or (
+            accruals[0][0] - timedelta(days=30) <=
+            balance_history[0]['time'] < accruals[0][0])
+
+
+class TestBalanceHistory():
+    def test_from_rows(self):
+        rows = [
+            (datetime(year=1969, month=12, day=31, hour=23), 0),
+            (datetime(year=2017, month=10, day=1, microsecond=1), 500),
+            (datetime(year=2017, month=10, day=1, microsecond=1), 250),
+        ]
+        history = calc.BalanceHistory.from_rows(rows)
+
+        assert len(history) == 3
+        assert list(history) == rows
+        assert history.first_time == rows[0][0]
+        assert history.last_principal_owed == 250
+
+    def test_insert_keeps_history_sorted(self):
+        opening_time = datetime(year=2017, month=10, day=1)
+        history = calc.BalanceHistory.from_rows([
+            (opening_time + timedelta(days=1), 100),
+            (opening_time + timedelta(days=3), 300),
+        ])
+
+        history.insert(opening_time, 0)
+        history.insert(opening_time + timedelta(days=1), 150)
+        history.insert(opening_time + timedelta(days=5), 500)
+
+        assert [principal for _, principal in history] == [
+            0, 100, 150, 300, 500]
+
+    @settings(max_examples=200, deadline=None)
+    @given(
+        apr=st.integers(0, 100),
+        balance_history=balance_histories(),
+        days=st.integers(-10, 2500))
+    def test_monthly_interests_match_dicts(self, apr, balance_history, days):
+        end_date = balance_history[-1]['time'] + timedelta(days=days)
+
+        assert calc.get_monthly_interests(
+            apr, 30, end_date, calc.BalanceHistory.from_dicts(balance_history)
+        ) == calc.get_monthly_interests(apr, 30, end_date, balance_history)
+
+    def test_batch_accepts_history_arrays(self):
+        opening_time = datetime(year=2017, month=10, day=1)
+        history = calc.BalanceHistory.from_rows([
+            (opening_time, 0),
+            (opening_time + timedelta(days=4), 50000000000),
+        ])
+        end_date = datetime(year=2017, month=12, day=1)
+
+        account_ids, interests, dates = calc.get_monthly_interests_batch(
+            30, end_date, ['a'] * len(history), history.times,
+            history.principals_owed, [35] * len(history))
+
+        assert [
+            [interest, date] for interest, date in
+            zip(interests.tolist(), dates.astype(datetime))
+        ] == calc.get_monthly_interests(35, 30, end_date, history)
+
+
+def _random_balance_history(rand, opening_time):
+    balance_history = [{'time': opening_time, 'principal_owed': 0}]
+    time = opening_time
+    for _ in range(rand.randint(0, 20)):
+        time += timedelta(
+            days=rand.choice([0, 0, 1, 5, 30, 90]),
+            seconds=rand.randint(0, 86399))
+        balance_history.append({
+            'time': time,
+            'principal_owed': rand.randint(0, 100000000000)
+        })
+    return balance_history
+
+
+class TestGetMonthlyInterestsBatch():
+    def test_empty_history(self):
+        account_ids, interests, dates = calc.get_monthly_interests_batch(
+            30, datetime(year=2017, month=10, day=31), [], [], [], [])
+
+        assert len(account_ids) == len(interests) == len(dates) == 0
+
+    def test_matches_scalar_interests(self):
+        rand = random.Random(1234)
+        end_date = datetime(year=2018, month=6, day=1, hour=13)
+
+        histories = {}
+        for account_id in range(200):
+            opening_time = end_date - timedelta(
+                days=rand.randint(-10, 400), seconds=rand.randint(0, 86399))
+            histories[account_id] = (
+                rand.randint(0, 40),
+                _random_balance_history(rand, opening_time))
+
+        rows = [
+            (account_id, apr, balance['time'], balance['principal_owed'], i)
+            for account_id, (apr, history) in histories.items()
+            for i, balance in enumerate(history)
+        ]
+        # interleave the accounts while keeping each history in order
+        rand.shuffle(rows)
+        rows.sort(key=lambda row: row[4])
+
+        account_ids, interests, dates = calc.get_monthly_interests_batch(
+            30,
+            end_date,
+            [row[0] for row in rows],
+            [row[2] for row in rows],
+            [row[3] for row in rows],
+            [row[1] for row in rows])
+
+        batch_interests = {}
+        for account_id, interest, date in zip(
+                account_ids, interests, dates.astype(datetime)):
+            batch_interests.setdefault(account_id, []).append(
+                (interest, date))
+
+        for account_id, (apr, history) in histories.items():
+            expected = [
+                (interest, date) for interest, date in
+                calc.get_monthly_interests(apr, 30, end_date, history)
+            ]
+            assert batch_interests.get(account_id, []) == expected
+
+    def test_interleaved_accounts(self):
+        opening_time = datetime(year=2017, month=10, day=1)
+        account_ids, interests, dates = calc.get_monthly_interests_batch(
+            30,
+            datetime(year=2017, month=12, day=1),
+            ['b', 'a', 'b', 'a', 'b'],
+            [opening_time, opening_time,
+             datetime(year=2017, month=10, day=1),
+             datetime(year=2017, month=10, day=5),
+             datetime(year=2017, month=10, day=16)],
+            [0, 0, 50000000000, 50000000000, 30000000000],
+            [35, 35, 35, 35, 35])
+
+        assert list(account_ids) == ['a', 'a', 'b', 'b']
+        assert list(dates.astype(datetime)) == [
+            datetime(year=2017, month=10, day=31),
+            datetime(year=2017, month=11, day=30)] * 2
+        assert list(interests) == [
+            1246575342, 2684931506, 1150684931, 2013698630]
+
+    def test_matches_scalar_accruals(self):
+        rand = random.Random(4321)
+        end_date = datetime(year=2018, month=6, day=1, hour=13)
+
+        histories = {}
+        for account_id in range(100):
+            opening_time = end_date - timedelta(
+                days=rand.randint(-10, 400), seconds=rand.randint(0, 86399))
+            histories[account_id] = (
+                rand.randint(0, 40),
+                _random_balance_history(rand, opening_time))
+
+        rows = [
+            (account_id, apr, balance['time'], balance['principal_owed'])
+            for account_id, (apr, history) in histories.items()
+            for balance in history
+        ]
+        account_ids, ends, principal_days, interests = (
+            calc.get_period_accruals_batch(
+                30,
+                end_date,
+                [row[0] for row in rows],
+                [row[2] for row in rows],
+                [row[3] for row in rows],
+                [row[1] for row in rows]))
+
+        batch_accruals = {}
+        for account_id, end, days, interest in zip(
+                account_ids, ends.astype(datetime), principal_days.tolist(),
+                interests.tolist()):
+            batch_accruals.setdefault(account_id, []).append(
+                (end, days, interest))
+
+        for account_id, (apr, history) in histories.items():
+            assert batch_accruals.get(account_id, []) == (
+                calc.get_period_accruals(apr, 30, end_date, history))
+
+    def test_large_products_round_exactly(self):
+        principal_owed = 10 ** 15 + 3
+        interests = calc._get_interests([principal_owed], [30], [35])
+
+        assert interests[0] == calc._get_interest(principal_owed, 30, 35)
+
+
+def project_scalar(principal_owed, interest_owed, apr, payment, periods):
+    """ Projects a single payment amount one pay period at a time, with the
+    scalar interest and payment calculations. """
+    projection = []
+    for _ in range(periods):
+        if not principal_owed + interest_owed:
+            break
+        interest = calc._get_interest(principal_owed, 30, apr)
+        interest_owed += interest
+        paid = min(payment, principal_owed + interest_owed)
+        principal_owed, interest_owed = calc.make_payment(
+            principal_owed, interest_owed, paid)
+        projection.append((interest, paid, principal_owed, interest_owed))
+    return projection
+
+
+class TestProjectPayoff():
+    @pytest.mark.parametrize('principal_owed,interest_owed,apr', [
+        (50000000000, 0, 35),
+        (50000000000, 1438356164, 35),
+        (10 ** 15 + 3, 0, 35),
+        (1000000, 0, 0),
+    ])
+    def test_matches_scalar_projection(
+            self, principal_owed, interest_owed, apr):
+        payments = [1, 1000000000, 1438356164, 5000000000, 10 ** 12]
+        projection = calc.project_payoff(
+            principal_owed, interest_owed, apr, 30, payments, 365)
+
+        for column, payment in enumerate(payments):
+            expected = project_scalar(
+                principal_owed, interest_owed, apr, payment, 365)
+            columns = [values[:, column].tolist() for values in projection]
+
+            assert list(zip(*columns))[:len(expected)] == expected
+            assert not any(
+                paid for paid in columns[1][len(expected):])
+
+    def test_stops_once_paid_off(self):
+        interests, paid, principals, interests_owed = calc.project_payoff(
+            1000000000, 0, 35, 30, [600000000, 10 ** 12], 365)
+
+        assert paid.tolist() == [[600000000, 1028767123], [441101520, 0]]
+        assert principals[-1].tolist() == [0, 0]
+        assert interests_owed[-1].tolist() == [0, 0]
+
+    def test_nothing_owed(self):
+        projection = calc.project_payoff(0, 0, 35, 30, [1000000], 365)
+
+        assert [values.shape for values in projection] == [(0, 1)] * 4